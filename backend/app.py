@@ -3,25 +3,13 @@ from flask_migrate import Migrate
 from flask_cors import CORS
 import os
 from dotenv import load_dotenv
-import logging
 from backend.extensions import db, login_manager, jwt  # Import from extensions.py
-from backend.models import User  # Import the User model
+from backend.auth_cache import load_cached_user, register_user_cache
+from backend.structured_logging import configure_logging, register_request_ids
+from backend.metrics import register_metrics
 from datetime import timedelta
 
 
-from flask_login import current_user
-
-@login_manager.user_loader
-def load_user(user_id):
-    # Check if the user is anonymous
-    if user_id is None or current_user.is_anonymous:
-        return None  # Return None for anonymous users
-
-    return User.query.get(int(user_id))  # Return the user by ID if logged in
-
-
-logging.basicConfig(level=logging.DEBUG)
-
 def create_app():
     # Initialize Flask app
     app = Flask(__name__)
@@ -29,6 +17,9 @@ def create_app():
     # Load environment variables from .env file
     load_dotenv()
 
+    # JSON logs written by a background thread (LOG_LEVEL, LOG_LEVELS, ... see structured_logging.py)
+    configure_logging()
+
     # Configure the app directly in app.py (database URI, etc.)
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY')
     app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.join(os.path.abspath(os.path.dirname(__file__)), "instance", "meta_ads_manager.db")}'
@@ -39,7 +30,16 @@ def create_app():
     app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=1)
     token_location_value = os.getenv('JWT_TOKEN_LOCATION', 'headers')  # Default to 'headers' if not set
     app.config['JWT_TOKEN_LOCATION'] = [token_location_value] if isinstance(token_location_value, str) else token_location_value
+    app.config['JOB_WORKERS'] = int(os.getenv('JOB_WORKERS', 2))  # Background job threads per process, 0 to disable
+    app.config['JOB_POLL_INTERVAL'] = float(os.getenv('JOB_POLL_INTERVAL', 1.0))
+    app.config['META_APP_SECRET'] = os.getenv('META_APP_SECRET')  # Signs webhook payloads
+    app.config['META_WEBHOOK_VERIFY_TOKEN'] = os.getenv('META_WEBHOOK_VERIFY_TOKEN')
+
 
+    # Fail at startup, not at the first registration, when PASSWORD_HASH_METHOD's hashes would not fit
+    from backend.models import User
+    from backend.password_hashing import check_hash_method
+    check_hash_method(User.__table__.c._password.type.length)
 
     # Initialize the extensions with the app object
     db.init_app(app)
@@ -47,6 +47,21 @@ def create_app():
     login_manager.init_app(app)
     jwt.init_app(app)
 
+    # Bump each user's data version whenever their campaigns, ad sets, ads or creatives change
+    from backend.versions import register_version_tracking
+    register_version_tracking()
+    # ... and drop their cached responses in every worker process
+    from backend.response_cache import register_response_cache
+    register_response_cache()
+    # ... and push them to the user's open /api/events streams
+    from backend.events import register_event_broker
+    register_event_broker()
+
+    # Tag every log record of a request with its ID
+    register_request_ids(app)
+    # Count and time requests, SQL statements and commits for /metrics
+    register_metrics(app)
+
     # Enable CORS for the frontend
     CORS(app, supports_credentials=True)
 
@@ -54,10 +69,30 @@ def create_app():
     from backend.routes import routes_bp
     app.register_blueprint(routes_bp)
 
-    # Set up the user loader for Flask-Login
+    # Register CLI commands (flask sync-account, ...)
+    from backend.commands import register_commands
+    register_commands(app)
+
+    # Start the background job workers lazily, so CLI commands and the
+    # pre-fork parent process never spawn threads
+    from backend.jobs import start_job_workers
+
+    @app.before_request
+    def ensure_job_workers():
+        start_job_workers(app)
+
+    # Set up the user loaders for Flask-Login and @jwt_required; both read
+    # the user cache, so an authenticated request normally costs no query
+    register_user_cache()
+
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))  # This loads the user by ID
+        return load_cached_user(user_id)
+
+    @jwt.user_lookup_loader
+    def load_jwt_user(jwt_header, jwt_data):
+        # None (a deleted user) makes @jwt_required answer 401
+        return load_cached_user(jwt_data[app.config['JWT_IDENTITY_CLAIM']])
 
     return app
 
@@ -0,0 +1,277 @@
+import inspect
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask_jwt_extended import JWTManager
+from sqlalchemy import event
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+DEFAULT_TOKEN_CACHE_SIZE = 10000
+DEFAULT_USER_CACHE_SIZE = 10000
+DEFAULT_USER_CACHE_TTL = 60  # Seconds; bounds how stale another process's view of a changed user can be
+
+# flask-jwt-extended has no public hook around signature verification: decode_token() (and with it
+# @jwt_required) calls this private JWTManager method, so CachingJWTManager overrides it. The package is
+# pinned in requirements.txt; check_decode_hook() fails startup if an upgrade changes the method.
+DECODE_HOOK = "_decode_jwt_from_config"
+DECODE_HOOK_PARAMETERS = ["self", "encoded_token", "csrf_value", "allow_expired"]
+
+
+def auth_cache_enabled():
+    return os.getenv("AUTH_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+
+
+class TokenCache:
+    """Claims of already verified JWTs, keyed by signature and kept until the token expires.
+
+    A hit also requires the same header and payload, so a cached entry can
+    only ever stand in for the exact token that was verified.
+    """
+
+    def __init__(self, max_entries=DEFAULT_TOKEN_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # signature -> (signing_input, claims, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token):
+        signing_input, _, signature = token.rpartition(".")
+        with self._lock:
+            entry = self._entries.get(signature)
+            if entry is None or entry[0] != signing_input or entry[2] <= time.time():
+                if entry is not None:
+                    del self._entries[signature]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(signature)
+            self.hits += 1
+            return dict(entry[1])
+
+    def set(self, token, claims, expires_at):
+        signing_input, _, signature = token.rpartition(".")
+        with self._lock:
+            self._entries[signature] = (signing_input, dict(claims), expires_at)
+            self._entries.move_to_end(signature)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def check_decode_hook():
+    """Raise RuntimeError unless JWTManager still has the decode method CachingJWTManager overrides."""
+    method = getattr(JWTManager, DECODE_HOOK, None)
+    if not callable(method) or list(inspect.signature(method).parameters) != DECODE_HOOK_PARAMETERS:
+        raise RuntimeError(
+            f"flask_jwt_extended.JWTManager.{DECODE_HOOK}({', '.join(DECODE_HOOK_PARAMETERS[1:])}) is missing or "
+            "has changed; install the flask-jwt-extended version pinned in requirements.txt or update CachingJWTManager"
+        )
+
+
+class CachingJWTManager(JWTManager):
+    """JWTManager that verifies each distinct token once and serves its claims from a TokenCache afterwards.
+
+    Only tokens that verified successfully are cached, and only until their
+    `exp`; anything else goes through the normal decode path, so errors and
+    expiry handling are unchanged.
+    """
+
+    def __init__(self, *args, token_cache=None, **kwargs):
+        check_decode_hook()
+        self.token_cache = token_cache or TokenCache(
+            int(os.getenv("AUTH_TOKEN_CACHE_SIZE", DEFAULT_TOKEN_CACHE_SIZE))
+        )
+        super().__init__(*args, **kwargs)
+
+    def _decode_jwt_from_config(self, encoded_token, csrf_value=None, allow_expired=False):
+        # See DECODE_HOOK
+        cacheable = csrf_value is None and not allow_expired and auth_cache_enabled()
+        if cacheable:
+            claims = self.token_cache.get(encoded_token)
+            if claims is not None:
+                return claims
+
+        claims = super()._decode_jwt_from_config(encoded_token, csrf_value, allow_expired)
+        if cacheable and claims.get("exp"):
+            self.token_cache.set(encoded_token, claims, claims["exp"])
+        return claims
+
+
+class UserCache:
+    """Detached User rows by ID, re-attached to the caller's session without a query.
+
+    Entries live for `ttl` seconds. Changes to a user committed by this
+    process drop its entry at once (see `register_user_cache`); the TTL
+    bounds how long other processes keep serving the old row.
+    """
+
+    def __init__(self, max_entries=DEFAULT_USER_CACHE_SIZE, ttl=DEFAULT_USER_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # user_id -> (detached user, expires_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, session, user_id, load):
+        """Return the user with `user_id` attached to `session`, calling `load(user_id)` on a miss."""
+        user_id = int(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+            else:
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                entry = None
+        if entry is not None:
+            # load=False trusts the cached state instead of selecting the row again
+            return session.merge(entry[0], load=False)
+
+        user = load(user_id)
+        if user is not None:
+            self._store(user_id, user)
+        return user
+
+    def _store(self, user_id, user):
+        # Cache a copy of the columns; the loaded instance stays with the caller's session
+        snapshot = type(user)()
+        for attr in sa_inspect(type(user)).column_attrs:
+            setattr(snapshot, attr.key, getattr(user, attr.key))
+        make_transient_to_detached(snapshot)
+        with self._lock:
+            self._entries[user_id] = (snapshot, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_ids):
+        with self._lock:
+            for user_id in user_ids:
+                self._entries.pop(int(user_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries), "ttl": self.ttl}
+
+
+_user_cache = None
+_user_cache_lock = threading.Lock()
+
+
+def get_user_cache():
+    """Return the process-wide UserCache, or None when AUTH_CACHE_ENABLED is false."""
+    global _user_cache
+
+    if _user_cache is None:
+        if not auth_cache_enabled():
+            return None
+        with _user_cache_lock:
+            if _user_cache is None:
+                _user_cache = UserCache(
+                    max_entries=int(os.getenv("AUTH_USER_CACHE_SIZE", DEFAULT_USER_CACHE_SIZE)),
+                    ttl=float(os.getenv("AUTH_USER_CACHE_TTL", DEFAULT_USER_CACHE_TTL)),
+                )
+    return _user_cache
+
+
+def load_cached_user(user_id):
+    """The User with `user_id` in the current session (None if there is none), from the user cache when possible."""
+    from backend.extensions import db
+    from backend.models import User
+
+    if user_id is None:
+        return None
+    cache = get_user_cache()
+    if cache is None:
+        return db.session.get(User, int(user_id))
+    return cache.get(db.session, user_id, lambda uid: db.session.get(User, uid))
+
+
+def _collect_changed_users(session, flush_context):
+    from backend.models import User
+
+    changed = session.info.setdefault("changed_users", set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, User) and obj.id is not None:
+            changed.add(obj.id)
+
+
+def _invalidate_changed_users(session):
+    changed = session.info.pop("changed_users", None)
+    if changed and _user_cache is not None:
+        _user_cache.invalidate(changed)
+
+
+def _discard_changed_users(session):
+    session.info.pop("changed_users", None)
+
+
+def register_user_cache():
+    """Drop a user's cached row after every commit that changes it."""
+    if not event.contains(Session, "after_flush", _collect_changed_users):
+        # after_flush so new users have their ID; they cannot be cached yet anyway
+        event.listen(Session, "after_flush", _collect_changed_users)
+        event.listen(Session, "after_commit", _invalidate_changed_users)
+        event.listen(Session, "after_rollback", _discard_changed_users)
+
+
+def benchmark_auth(user_id, requests):
+    """Time the authentication of `requests` requests for `user_id`, with cold and with warm caches.
+
+    Returns {mode: {"us_per_request", "queries_per_request"}}. Cold clears
+    both caches before every request, which is what each request cost
+    before they existed.
+    """
+    from flask import current_app
+    from flask_jwt_extended import create_access_token, get_current_user, verify_jwt_in_request
+
+    from backend.extensions import db, jwt
+
+    headers = {"Authorization": f"Bearer {create_access_token(identity=user_id)}"}
+    queries = [0]
+
+    def count(*args):
+        queries[0] += 1
+
+    def authenticate():
+        with current_app.test_request_context("/api/campaigns", headers=headers):
+            verify_jwt_in_request()
+            get_current_user()
+        # What the request's teardown does; keeps the identity map from answering for the cache
+        db.session.remove()
+
+    user_cache = get_user_cache()
+    results = {}
+    event.listen(db.engine, "before_cursor_execute", count)
+    try:
+        for mode in ("cold", "warm"):
+            authenticate()
+            queries[0] = 0
+            started = time.perf_counter()
+            for _ in range(requests):
+                if mode == "cold":
+                    jwt.token_cache.clear()
+                    if user_cache is not None:
+                        user_cache.clear()
+                authenticate()
+            elapsed = time.perf_counter() - started
+            results[mode] = {
+                "us_per_request": round(elapsed / requests * 1e6, 1),
+                "queries_per_request": queries[0] / requests,
+            }
+    finally:
+        event.remove(db.engine, "before_cursor_execute", count)
+    return results
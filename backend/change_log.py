@@ -0,0 +1,139 @@
+import logging
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, exists, func, or_, select
+from sqlalchemy.orm import aliased
+
+from backend.dashboard import SECTIONS
+from backend.extensions import db
+from backend.models import ChangeLogCompaction, ChangeLogEntry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETENTION_DAYS = 7
+DEFAULT_COMPACTION_BATCH_SIZE = 5000
+
+
+class ChangeLogExpired(Exception):
+    """Raised when a cursor points before entries that compaction has already removed."""
+
+
+def retention_days():
+    return int(os.getenv("CHANGE_LOG_RETENTION_DAYS", DEFAULT_RETENTION_DAYS))
+
+
+def expired_through():
+    """The highest change log ID removed by age; older cursors cannot be served."""
+    return db.session.query(func.max(ChangeLogCompaction.expired_through)).scalar() or 0
+
+
+def current_cursor_id():
+    """A cursor from which the feed starts with the next change."""
+    return max(db.session.query(func.max(ChangeLogEntry.id)).scalar() or 0, expired_through())
+
+
+def changes_since(user_id, after_id, limit):
+    """The user's entities changed after change log entry `after_id`, each once, in their current state.
+
+    Reads at most `limit` log entries. Returns {"changes", "last_id",
+    "has_more"}; each change has `entity`, `id`, `op` (create, update or
+    delete) and `data` (the row as /api/dashboard renders it, None when
+    deleted). Raises ChangeLogExpired when compaction removed entries after
+    `after_id`.
+    """
+    if after_id < expired_through():
+        raise ChangeLogExpired("Cursor is older than the retained change log; reload everything and start over")
+
+    entries = db.session.query(
+        ChangeLogEntry.id, ChangeLogEntry.entity, ChangeLogEntry.entity_id, ChangeLogEntry.op
+    ).filter(
+        ChangeLogEntry.user_id == user_id, ChangeLogEntry.id > after_id
+    ).order_by(ChangeLogEntry.id).limit(limit + 1).all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    # Collapse repeats, ordered by each entity's last change
+    ops = {}
+    for _, entity, entity_id, op in entries:
+        first = ops.pop((entity, entity_id), op)
+        ops[(entity, entity_id)] = "create" if "create" in (first, op) and op != "delete" else op
+
+    rows = {}
+    for model, entity, serialize in SECTIONS:
+        ids = [entity_id for (key, entity_id), op in ops.items() if key == entity and op != "delete"]
+        if ids:
+            for row in model.query.filter(model.id.in_(ids), model.user_id == user_id):
+                rows[(entity, row.id)] = serialize(row)
+
+    changes = []
+    for (entity, entity_id), op in ops.items():
+        data = rows.get((entity, entity_id))
+        changes.append({
+            "entity": entity,
+            "id": entity_id,
+            # Deleted (or moved to another user) since the entry was written
+            "op": op if data is not None else "delete",
+            "data": data,
+        })
+    return {"changes": changes, "last_id": entries[-1].id if entries else after_id, "has_more": has_more}
+
+
+def superseded_entries():
+    """Condition for entries a newer entry of the same entity makes redundant.
+
+    The latest create of an entity is kept even when updates follow it, so a
+    reader whose cursor is before it still sees the entity as created.
+    """
+    newer = aliased(ChangeLogEntry)
+    return exists().where(
+        newer.user_id == ChangeLogEntry.user_id,
+        newer.entity == ChangeLogEntry.entity,
+        newer.entity_id == ChangeLogEntry.entity_id,
+        newer.id > ChangeLogEntry.id,
+        or_(ChangeLogEntry.op != "create", newer.op == "create"),
+    )
+
+
+def _delete_in_batches(condition, batch_size):
+    removed = 0
+    after_id = 0
+    while True:
+        # Walk forward by ID so entries already checked and kept are not checked again
+        ids = db.session.scalars(
+            select(ChangeLogEntry.id).where(ChangeLogEntry.id > after_id, condition)
+            .order_by(ChangeLogEntry.id).limit(batch_size)
+        ).all()
+        if ids:
+            removed += db.session.execute(delete(ChangeLogEntry).where(ChangeLogEntry.id.in_(ids))).rowcount
+        # Short transactions, so request handlers writing the log are not held up
+        db.session.commit()
+        if len(ids) < batch_size:
+            return removed
+        after_id = ids[-1]
+
+
+def compact_change_log(retention_days=DEFAULT_RETENTION_DAYS, batch_size=DEFAULT_COMPACTION_BATCH_SIZE):
+    """Bound the change log.
+
+    Entries superseded by a newer entry for the same entity are dropped,
+    except the entity's latest create: readers collapse an entity's entries
+    into one change, and with the create kept that change is the same from
+    every cursor. Then entries older than
+    `retention_days` are dropped and cursors before them expire.
+    Returns the ChangeLogCompaction recorded for the run.
+    """
+    latest_id = db.session.query(func.max(ChangeLogEntry.id)).scalar() or 0
+    superseded = _delete_in_batches((ChangeLogEntry.id <= latest_id) & superseded_entries(), batch_size)
+
+    cutoff = datetime.utcnow() - timedelta(days=retention_days)
+    horizon = db.session.query(func.max(ChangeLogEntry.id)).filter(ChangeLogEntry.changed_at < cutoff).scalar()
+    expired = _delete_in_batches(ChangeLogEntry.id <= horizon, batch_size) if horizon else 0
+
+    compaction = ChangeLogCompaction(
+        expired_through=max(horizon or 0, expired_through()), superseded=superseded, expired=expired
+    )
+    db.session.add(compaction)
+    db.session.commit()
+    logger.info(f"Compacted the change log: {superseded} superseded and {expired} expired entries removed")
+    return compaction
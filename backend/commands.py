@@ -0,0 +1,134 @@
+import json
+import os
+
+import click
+from flask.cli import with_appcontext
+
+
+@click.command('sync-account')
+@click.option('--user-id', type=int, required=True, help='Local user that will own the synced objects.')
+@click.option('--account', 'ad_account_id', default=None, help='Ad account ID without the act_ prefix (defaults to AD_ACCOUNT_ID).')
+@click.option('--full', is_flag=True, help='Ignore the high-water marks and rescan the whole account.')
+@with_appcontext
+def sync_account_command(user_id, ad_account_id, full):
+    """Mirror an ad account's campaigns, ad sets and ads into the local database."""
+    from backend.sync import sync_account
+
+    results = sync_account(user_id, ad_account_id, full=full)
+    click.echo(json.dumps(results, indent=2))
+
+
+@click.command('ingest-insights')
+@click.option('--user-id', type=int, required=True, help='Local user that requested the report.')
+@click.option('--account', 'ad_account_id', default=None, help='Ad account ID without the act_ prefix (defaults to AD_ACCOUNT_ID).')
+@click.option('--level', type=click.Choice(['account', 'campaign', 'adset', 'ad']), default='ad')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), required=True)
+@click.option('--until', type=click.DateTime(formats=['%Y-%m-%d']), required=True)
+@with_appcontext
+def ingest_insights_command(user_id, ad_account_id, level, since, until):
+    """Run an async insights report and store its daily rows."""
+    from backend.insights import ingest_insights
+
+    run = ingest_insights(user_id, ad_account_id or os.getenv('AD_ACCOUNT_ID'), level, since.date(), until.date())
+    click.echo(json.dumps(run.to_dict(), indent=2))
+
+
+@click.command('rebuild-metrics-store')
+@click.option('--batch-size', type=int, default=5000, show_default=True)
+@with_appcontext
+def rebuild_metrics_store_command(batch_size):
+    """Copy every insights_daily row into the columnar metrics store."""
+    from backend.insights import write_store_rows
+    from backend.models import DailyInsight
+
+    written = 0
+    batch = []
+    for row in DailyInsight.query.order_by(DailyInsight.id).yield_per(batch_size):
+        batch.append({'object_id': row.object_id, 'date': row.date, 'spend': row.spend,
+                      'impressions': row.impressions, 'clicks': row.clicks, 'conversions': row.conversions,
+                      'level': row.level})
+        if len(batch) >= batch_size:
+            written += _write_store_batch(write_store_rows, batch)
+            batch = []
+    written += _write_store_batch(write_store_rows, batch)
+    click.echo(f'Wrote {written} rows to the metrics store')
+
+
+def _write_store_batch(write_store_rows, batch):
+    written = 0
+    for level in {row['level'] for row in batch}:
+        written += write_store_rows(level, [row for row in batch if row['level'] == level])
+    return written
+
+
+@click.command('check-query-plans')
+@click.option('--users', type=int, default=20, show_default=True,
+              help='Synthetic users; each gets 50 campaigns, 500 ad sets and 2,500 ads.')
+def check_query_plans_command(users):
+    """EXPLAIN QUERY PLAN every hot query on a synthetic database; exit 1 on any full table scan."""
+    from backend.query_plans import check_query_plans
+
+    failures = 0
+    for name, details, full_scan in check_query_plans(users):
+        click.echo(f"{'FAIL' if full_scan else 'ok  '} {name}")
+        for detail in details:
+            click.echo(f"       {detail}")
+        failures += full_scan
+    if failures:
+        raise click.ClickException(f'{failures} queries do a full table scan')
+    click.echo('No full table scans')
+
+
+@click.command('compact-change-log')
+@click.option('--retention-days', type=int, default=None,
+              help='Drop entries older than this (default: CHANGE_LOG_RETENTION_DAYS, or 7).')
+@click.option('--batch-size', type=int, default=5000, show_default=True, help='Entries deleted per transaction.')
+@with_appcontext
+def compact_change_log_command(retention_days, batch_size):
+    """Drop superseded and expired change log entries; run it from cron."""
+    from backend.change_log import compact_change_log, retention_days as default_retention_days
+
+    compaction = compact_change_log(retention_days if retention_days is not None else default_retention_days(),
+                                    batch_size=batch_size)
+    click.echo(f'Removed {compaction.superseded} superseded and {compaction.expired} expired entries; '
+               f'cursors before {compaction.expired_through} have expired')
+
+
+@click.command('bench-auth')
+@click.option('--user-id', type=int, required=True, help='User the benchmark token is issued to.')
+@click.option('--requests', type=int, default=2000, show_default=True)
+@with_appcontext
+def bench_auth_command(user_id, requests):
+    """Measure the per-request cost of token verification and user loading, without and with the auth caches."""
+    from backend.auth_cache import benchmark_auth
+
+    for mode, result in benchmark_auth(user_id, requests).items():
+        click.echo(f"{mode:5} {result['us_per_request']:8.1f} us/request  "
+                   f"{result['queries_per_request']:.2f} queries/request")
+
+
+@click.command('bench-serve')
+@click.option('--path', default='/api/ready', show_default=True, help='Endpoint to load.')
+@click.option('--user-id', type=int, default=None, help='Send a token for this user (for protected endpoints).')
+@click.option('--duration', type=float, default=5.0, show_default=True, help='Seconds of load per server.')
+@click.option('--concurrency', type=int, default=32, show_default=True, help='Keep-alive connections.')
+@with_appcontext
+def bench_serve_command(path, user_id, duration, concurrency):
+    """Compare the throughput of `flask run` and `python -m backend.serve` (SERVE_* settings apply)."""
+    from flask_jwt_extended import create_access_token
+    from backend.serve import benchmark_servers
+
+    headers = {'Authorization': f'Bearer {create_access_token(identity=user_id)}'} if user_id else {}
+    for name, result in benchmark_servers(path, duration, concurrency, headers).items():
+        click.echo(f"{name:14} {result['requests_per_second']:9.1f} req/s  p50 {result['p50_ms']} ms  "
+                   f"p99 {result['p99_ms']} ms  {result['errors']} errors")
+
+
+def register_commands(app):
+    app.cli.add_command(sync_account_command)
+    app.cli.add_command(ingest_insights_command)
+    app.cli.add_command(rebuild_metrics_store_command)
+    app.cli.add_command(check_query_plans_command)
+    app.cli.add_command(compact_change_log_command)
+    app.cli.add_command(bench_auth_command)
+    app.cli.add_command(bench_serve_command)
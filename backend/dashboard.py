@@ -0,0 +1,57 @@
+from datetime import datetime
+
+from sqlalchemy.orm import selectinload
+
+from backend.extensions import db
+from backend.models import Campaign, AdGroup, Ad, AdCreative
+
+# Model -> key in the dashboard payload and its serializer
+SECTIONS = [
+    (Campaign, "campaigns", Campaign.to_dict),
+    (AdGroup, "ad_groups", AdGroup.to_dict),
+    (Ad, "ads", Ad.to_dict),
+    (AdCreative, "ad_creatives", AdCreative.to_summary_dict),
+]
+
+
+def full_dashboard(user_id):
+    """The user's whole hierarchy in four queries: campaigns, then their ad sets and ads, then creatives."""
+    campaigns = (
+        Campaign.query.filter_by(user_id=user_id)
+        .options(selectinload(Campaign.ad_groups).selectinload(AdGroup.ads))
+        .order_by(Campaign.id)
+        .all()
+    )
+    ad_groups = [ad_group for campaign in campaigns for ad_group in campaign.ad_groups]
+    ads = [ad for ad_group in ad_groups for ad in ad_group.ads]
+    ad_creatives = AdCreative.query.filter_by(user_id=user_id).order_by(AdCreative.id).all()
+
+    return {
+        "campaigns": [campaign.to_dict() for campaign in campaigns],
+        "ad_groups": [ad_group.to_dict() for ad_group in sorted(ad_groups, key=lambda row: row.id)],
+        "ads": [ad.to_dict() for ad in sorted(ads, key=lambda row: row.id)],
+        "ad_creatives": [ad_creative.to_summary_dict() for ad_creative in ad_creatives],
+    }
+
+
+def changed_since(user_id, since):
+    """Rows updated after `since`, plus every current ID per section so clients can drop deleted rows."""
+    result = {"ids": {}}
+    for model, key, serialize in SECTIONS:
+        rows = model.query.filter(model.user_id == user_id, model.updated_at > since).order_by(model.id)
+        result[key] = [serialize(row) for row in rows]
+        result["ids"][key] = [row_id for (row_id,) in
+                              db.session.query(model.id).filter(model.user_id == user_id).order_by(model.id)]
+    return result
+
+
+def dashboard_data(user_id, since=None):
+    """Everything DashboardPage shows, or with `since` only what changed after it.
+
+    `server_time` is the value to pass as `since` on the next call.
+    """
+    # Taken before reading, so a row committed while we read is picked up next time
+    server_time = datetime.utcnow()
+    data = full_dashboard(user_id) if since is None else changed_since(user_id, since)
+    data["server_time"] = server_time.isoformat()
+    return data
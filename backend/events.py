@@ -0,0 +1,227 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from backend.shared_cache import get_invalidation_bus
+from backend.versions import on_versions_committed
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUFFER_SIZE = 256          # Events held per connection before it is told to resync
+DEFAULT_HEARTBEAT = 15.0           # Seconds of silence before a keep-alive comment
+DEFAULT_BUS_POLL_INTERVAL = 0.05   # Seconds between checks for other processes' writes
+RETRY_MS = 3000                    # How long EventSource waits before reconnecting
+
+
+class Subscription:
+    """One SSE connection's pending events: a bounded buffer the broker appends to and the connection drains.
+
+    When the buffer overflows it is emptied and replaced by a single
+    `resync` event, so a slow client costs a fixed amount of memory and
+    learns that it must refetch.
+    """
+
+    def __init__(self, user_id, buffer_size):
+        self.user_id = user_id
+        self.buffer_size = buffer_size
+        self._events = deque()
+        self._overflowed = False
+        self._closed = False
+        self._ready = threading.Condition()
+
+    def push(self, event):
+        with self._ready:
+            if self._overflowed or self._closed:
+                return
+            if len(self._events) >= self.buffer_size:
+                self._events.clear()
+                self._overflowed = True
+            else:
+                self._events.append(event)
+            self._ready.notify()
+
+    def close(self):
+        with self._ready:
+            self._closed = True
+            self._ready.notify()
+
+    def drain(self, timeout):
+        """Wait up to `timeout` seconds for events and return them (an empty list on timeout, None once closed)."""
+        with self._ready:
+            if not self._events and not self._overflowed and not self._closed:
+                self._ready.wait(timeout)
+            if self._closed:
+                return None
+            if self._overflowed:
+                self._overflowed = False
+                return [("resync", {"reason": "overflow"})]
+            events = list(self._events)
+            self._events.clear()
+            return events
+
+
+class EventBroker:
+    """Fans committed changes out to this process's SSE connections, per user.
+
+    Changes committed by this process arrive through the data version
+    hook with their rows. Changes committed by other worker processes are
+    only known from the invalidation bus, as user IDs, so those users'
+    connections get a `resync` event instead.
+    """
+
+    def __init__(self, buffer_size=DEFAULT_BUFFER_SIZE, bus_poll_interval=DEFAULT_BUS_POLL_INTERVAL):
+        self.buffer_size = buffer_size
+        self.bus_poll_interval = bus_poll_interval
+        self._subscriptions = {}  # user_id -> set of Subscription
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._closed = False
+
+    def subscribe(self, user_id):
+        subscription = Subscription(int(user_id), self.buffer_size)
+        with self._lock:
+            if self._closed:
+                subscription.close()
+                return subscription
+            self._subscriptions.setdefault(subscription.user_id, set()).add(subscription)
+            if self._watcher is None:
+                self._start_watcher()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def close(self):
+        """End every open stream, and any opened from now on (the worker process is shutting down)."""
+        with self._lock:
+            self._closed = True
+            subscriptions = [s for subscriptions in self._subscriptions.values() for s in subscriptions]
+        for subscription in subscriptions:
+            subscription.close()
+
+    def connections(self):
+        with self._lock:
+            return sum(len(subscriptions) for subscriptions in self._subscriptions.values())
+
+    def publish(self, user_id, name, data):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(int(user_id), ()))
+        for subscription in subscriptions:
+            subscription.push((name, data))
+
+    def publish_changes(self, user_ids, changes):
+        """Data version hook: send each change to its user's connections, and `resync` for bulk updates."""
+        with self._lock:
+            if not self._subscriptions:
+                return
+        resync = set()
+        for change in changes:
+            if change["data"] is None and change["op"] != "delete":
+                # Updated by a bulk statement: we only know the row changed, not how
+                resync.add(change["user_id"])
+                continue
+            self.publish(change["user_id"], "change", {key: change[key] for key in ("entity", "op", "id", "data")})
+        for user_id in resync:
+            self.publish(user_id, "resync", {"reason": "bulk"})
+
+    def _start_watcher(self):
+        # Caller holds the lock
+        bus = get_invalidation_bus()
+        if bus is None:
+            return
+        self._watcher = threading.Thread(target=self._watch_bus, args=(bus,), name="sse-bus-watcher", daemon=True)
+        self._watcher.start()
+
+    def _watch_bus(self, bus):
+        pid = os.getpid()
+        sequence = bus.sequence()
+        while True:
+            time.sleep(self.bus_poll_interval)
+            sequence, entries = bus.read(sequence)
+            if entries is None:
+                with self._lock:
+                    user_ids = list(self._subscriptions)
+            else:
+                user_ids = {user_id for origin, user_id in entries if origin != pid}
+            for user_id in user_ids:
+                self.publish(user_id, "resync", {"reason": "remote"})
+
+
+def format_event(name, data):
+    return f"event: {name}\ndata: {json.dumps(data, separators=(',', ':'), default=str)}\n\n"
+
+
+def event_stream(broker, subscription, heartbeat=DEFAULT_HEARTBEAT, expires_at=None):
+    """Yield SSE frames for `subscription` until the client goes away, with keep-alives while idle.
+
+    The stream ends at `expires_at` (the token's expiry, as a UNIX time) so
+    the client reconnects with a fresh token.
+    """
+    try:
+        yield f"retry: {RETRY_MS}\n" + format_event("ready", {"heartbeat": heartbeat})
+        while expires_at is None or time.time() < expires_at:
+            timeout = heartbeat if expires_at is None else max(0.0, min(heartbeat, expires_at - time.time()))
+            events = subscription.drain(timeout)
+            if events is None:
+                break  # Closed: EventSource reconnects, to another worker
+            if not events:
+                # A comment line: keeps proxies from timing out and surfaces a dead client on write
+                yield ": keep-alive\n\n"
+                continue
+            yield "".join(format_event(name, data) for name, data in events)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_event_broker():
+    """Return the process-wide EventBroker, creating it on first use."""
+    global _broker
+
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = EventBroker(
+                    buffer_size=int(os.getenv("EVENTS_BUFFER_SIZE", DEFAULT_BUFFER_SIZE)),
+                    bus_poll_interval=float(os.getenv("EVENTS_BUS_POLL_INTERVAL", DEFAULT_BUS_POLL_INTERVAL)),
+                )
+    return _broker
+
+
+def publish_committed_changes(user_ids, changes):
+    """Data version hook: forward committed changes to SSE connections, if this process has any."""
+    if _broker is not None:
+        _broker.publish_changes(user_ids, changes)
+
+
+def close_event_streams():
+    """End this process's open SSE streams, if it has any."""
+    if _broker is not None:
+        _broker.close()
+
+
+def register_event_broker():
+    """Push every committed change to the SSE connections of its user."""
+    on_versions_committed(publish_committed_changes)
+
+
+def _reset_after_fork():
+    # The bus watcher thread does not survive fork(); the child builds its own broker on first use
+    global _broker, _broker_lock
+    _broker = None
+    _broker_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
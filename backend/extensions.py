@@ -1,8 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
-from flask_jwt_extended import JWTManager
+from backend.auth_cache import CachingJWTManager
 
 # Initialize the extensions here
 db = SQLAlchemy()
 login_manager = LoginManager()
-jwt = JWTManager()
+jwt = CachingJWTManager()  # Verifies each token once, see auth_cache.py
@@ -0,0 +1,159 @@
+import json
+import logging
+import os
+import time
+
+import requests
+from flask import has_request_context
+
+from backend.graph_client import GRAPH_API_URL, get_graph_client
+from backend.rate_limit import RateLimited, note_retry_after, rate_limit_key
+
+logger = logging.getLogger(__name__)
+
+# Meta accepts at most 50 operations per batch request
+MAX_BATCH_SIZE = 50
+MAX_BATCH_RETRIES = 3
+BATCH_BASE_WAIT_TIME = 1.0
+
+# Graph error for an object that does not exist (any more): code 100, subcode 33
+MISSING_OBJECT_CODE = 100
+MISSING_OBJECT_SUBCODE = 33
+
+# Graph error codes that mean Meta is throttling the app or the ad account
+THROTTLING_ERROR_CODES = {4, 17, 32, 341, 613, 80004}
+# Graph error codes worth retrying: unknown/service errors and throttling
+TRANSIENT_ERROR_CODES = {1, 2} | THROTTLING_ERROR_CODES
+
+
+def _is_transient(item, result):
+    # Meta returns null for operations that did not finish in time
+    if item is None or item.get("code", 0) >= 500:
+        return True
+    error = result.get("error") if isinstance(result, dict) else None
+    if not isinstance(error, dict):
+        return False
+    return bool(error.get("is_transient")) or error.get("code") in TRANSIENT_ERROR_CODES
+
+
+def _is_throttled(result):
+    error = result.get("error") if isinstance(result, dict) else None
+    return isinstance(error, dict) and error.get("code") in THROTTLING_ERROR_CODES
+
+
+def is_missing_object(result):
+    """True when a Graph result is the "object does not exist" error, e.g. for an object Meta already deleted."""
+    error = result.get("error") if isinstance(result, dict) else None
+    return (isinstance(error, dict) and error.get("code") == MISSING_OBJECT_CODE
+            and error.get("error_subcode") == MISSING_OBJECT_SUBCODE)
+
+
+def _parse_item(item):
+    """Turn one raw batch response item into the same shape `make_meta_api_request` returns."""
+    if item is None:
+        return {"error": {"message": "Operation timed out in batch request"}}
+
+    try:
+        body = json.loads(item.get("body") or "{}")
+    except json.JSONDecodeError:
+        body = {"error": {"message": item.get("body")}}
+
+    if item.get("code") == 200:
+        return body
+    if not isinstance(body, dict) or "error" not in body:
+        body = {"error": {"message": f"Batch operation failed with status {item.get('code')}"}}
+    return body
+
+
+def _send_chunk(operations, access_token):
+    payload = {
+        "access_token": access_token,
+        "batch": json.dumps(operations),
+        "include_headers": "false",
+    }
+    response = get_graph_client().post(GRAPH_API_URL, data=payload)
+    data = response.json()
+    if response.status_code != 200 or not isinstance(data, list):
+        error = data.get("error", {}) if isinstance(data, dict) else {}
+        raise requests.exceptions.RequestException(error.get("message", f"Batch request failed with status {response.status_code}"))
+    return data
+
+
+def execute_batch(operations, access_token=None, max_retries=MAX_BATCH_RETRIES):
+    """Run Graph operations through batch requests of up to 50 operations each.
+
+    Each operation is a dict with `method`, `relative_url` and optionally
+    `body`. Returns one result per operation, in the same order: the parsed
+    response body on success or a dict with an `error` key on failure. Only
+    the operations that failed with a transient error are retried.
+
+    Inside a request nothing sleeps: operations still failing after the
+    first round are returned with a `retry_after` hint (also noted for the
+    response) instead of being retried in the request thread.
+    """
+    access_token = access_token or os.getenv("META_ACCESS_TOKEN")
+    results = [None] * len(operations)
+    pending = list(range(len(operations)))
+    wait_time = BATCH_BASE_WAIT_TIME
+    attempt = 0
+
+    while pending:
+        retry = []
+        for start in range(0, len(pending), MAX_BATCH_SIZE):
+            indexes = pending[start:start + MAX_BATCH_SIZE]
+            try:
+                items = _send_chunk([operations[i] for i in indexes], access_token)
+            except RateLimited as e:
+                # Don't wait on the governor; report every unsent operation with the retry hint
+                note_retry_after(e.retry_after)
+                for index in pending[start:]:
+                    results[index] = {"error": {"message": str(e), "retry_after": e.retry_after}}
+                return results
+            except (requests.exceptions.RequestException, ValueError) as e:
+                logger.warning(f"Batch request of {len(indexes)} operations failed: {e}")
+                items = [None] * len(indexes)
+
+            for index, item in zip(indexes, items):
+                results[index] = _parse_item(item)
+                if _is_transient(item, results[index]):
+                    retry.append(index)
+
+        attempt += 1
+        if not retry or attempt > max_retries:
+            break
+
+        governor = get_graph_client().governor
+        throttled = governor is not None and any(_is_throttled(results[index]) for index in retry)
+        if throttled:
+            # Meta is throttling the account: back off through the shared governor so every worker waits
+            governor.block(rate_limit_key(GRAPH_API_URL), wait_time)
+        if has_request_context():
+            # Don't hold a request thread; the client retries after the hint
+            note_retry_after(wait_time)
+            for index in retry:
+                error = results[index].get("error")
+                if isinstance(error, dict):
+                    error["retry_after"] = max(1, int(wait_time))
+            return results
+
+        logger.info(f"Retrying {len(retry)} failed batch operations in {wait_time} seconds...")
+        if not throttled:
+            # An ordinary flaky operation only delays this batch, not the whole account
+            time.sleep(wait_time)
+        wait_time *= 2  # Exponential backoff
+        pending = retry
+
+    return results
+
+
+def delete_meta_objects(meta_ids, access_token=None):
+    """Delete Meta objects (ads, ad sets, campaigns...) by ID using batch requests.
+
+    Returns a dict mapping each Meta ID to its result. Objects that no longer
+    exist (e.g. removed with their parent) count as deleted.
+    """
+    operations = [{"method": "DELETE", "relative_url": str(meta_id)} for meta_id in meta_ids]
+    return {
+        meta_id: {"success": True} if is_missing_object(result) else result
+        for meta_id, result in zip(meta_ids, execute_batch(operations, access_token=access_token))
+    }
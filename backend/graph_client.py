@@ -0,0 +1,177 @@
+import gzip
+import os
+import re
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+from backend import metrics
+from backend.rate_limit import APP_KEY, get_governor, parse_usage_headers, rate_limit_key
+
+# Load environment variables from .env file
+load_dotenv()
+
+GRAPH_API_URL = "https://graph.facebook.com/v22.0"
+
+# Pool size is per worker process: every process gets its own client
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = 60  # Seconds to wait for Meta before giving up
+# Only bodies bigger than this are worth the CPU to gzip
+DEFAULT_COMPRESS_MIN_BYTES = 1024
+
+_VERSION_RE = re.compile(r"^/v\d+\.\d+")
+_ID_SEGMENT_RE = re.compile(r"^(act_)?[0-9_]+$")
+
+
+def graph_path_template(url):
+    """The Graph path of `url` with its version and object IDs taken out: /act_{id}/insights, /{id}/adsets."""
+    path = _VERSION_RE.sub("", requests.utils.urlparse(url).path) or "/"
+    segments = []
+    for segment in path.split("/"):
+        match = _ID_SEGMENT_RE.match(segment)
+        segments.append(segment if match is None else f"{match.group(1) or ''}{{id}}")
+    return "/".join(segments)
+
+
+class GraphClient:
+    """Shared HTTP client for the Meta Graph API.
+
+    Wraps a single `requests.Session` so every call reuses kept-alive
+    TCP/TLS connections from a bounded, thread-safe urllib3 pool instead of
+    opening a new connection per request. When a rate limit governor is
+    attached, every call first takes a token from it and every response's
+    usage headers are fed back to it.
+    """
+
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT,
+                 compress=False, compress_min_bytes=DEFAULT_COMPRESS_MIN_BYTES, governor=None):
+        self.governor = governor
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.compress = compress
+        self.compress_min_bytes = compress_min_bytes
+
+        # pool_block=True caps the number of open sockets at pool_size; extra
+        # threads wait for a free connection instead of opening new ones
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session = requests.Session()
+        self.session.mount("https://", self._adapter)
+        self.session.mount("http://", self._adapter)
+        self.session.headers.update({"Connection": "keep-alive", "Accept-Encoding": "gzip, deflate"})
+
+    def request(self, method, url, params=None, data=None, json=None, headers=None, timeout=None):
+        """Send a request through the pooled session and return the `requests.Response`.
+
+        Raises `backend.rate_limit.RateLimited` when the governor refuses the call.
+        """
+        key = rate_limit_key(url)
+        path = graph_path_template(url)
+        if self.governor is not None:
+            waited = self.governor.acquire(key)
+            if waited:
+                metrics.inc("meta_rate_limit_wait_seconds_total", (("path", path),), waited)
+
+        request = requests.Request(method, url, params=params, data=data, json=json, headers=headers)
+        prepared = self.session.prepare_request(request)
+
+        if self.compress and prepared.body and len(prepared.body) >= self.compress_min_bytes:
+            body = prepared.body.encode("utf-8") if isinstance(prepared.body, str) else prepared.body
+            prepared.body = gzip.compress(body)
+            prepared.headers["Content-Encoding"] = "gzip"
+            prepared.headers["Content-Length"] = str(len(prepared.body))
+
+        started = time.perf_counter()
+        try:
+            response = self.session.send(prepared, timeout=timeout or self.timeout)
+        except requests.RequestException as e:
+            self._record(method, path, type(e).__name__, started)
+            raise
+        self._record(method, path, response.status_code, started)
+
+        if self.governor is not None:
+            usage = self.governor.record_response(key, response.headers)
+        else:
+            usage = parse_usage_headers(response.headers)
+        for scope, usage_key, pct in (("account", key, usage["account_pct"]), ("app", APP_KEY, usage["app_pct"])):
+            if pct is not None:
+                metrics.set_gauge("meta_usage_percent", pct, (("key", usage_key), ("scope", scope)))
+        return response
+
+    @staticmethod
+    def _record(method, path, status, started):
+        metrics.inc("meta_graph_requests_total", (("method", method), ("path", path), ("status", status)))
+        metrics.observe("meta_graph_request_duration_seconds", time.perf_counter() - started,
+                        (("method", method), ("path", path)))
+
+    def get(self, url, params=None, headers=None, **kwargs):
+        return self.request("GET", url, params=params, headers=headers, **kwargs)
+
+    def post(self, url, data=None, json=None, headers=None, **kwargs):
+        return self.request("POST", url, data=data, json=json, headers=headers, **kwargs)
+
+    def delete(self, url, params=None, json=None, headers=None, **kwargs):
+        return self.request("DELETE", url, params=params, json=json, headers=headers, **kwargs)
+
+    def pool_stats(self):
+        """Return connection pool counters for this client.
+
+        A hit is a request served on an already open connection, a miss is a
+        request that had to open a new one.
+        """
+        requests_sent = 0
+        connections_opened = 0
+        idle = 0
+        pools = self._adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            requests_sent += pool.num_requests
+            connections_opened += pool.num_connections
+            # The pool queue is pre-filled with None placeholders
+            if pool.pool is not None:
+                idle += sum(1 for conn in list(pool.pool.queue) if conn is not None)
+
+        return {
+            "pool_size": self.pool_size,
+            "requests": requests_sent,
+            "hits": requests_sent - connections_opened,
+            "misses": connections_opened,
+            "idle_connections": idle,
+        }
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+
+
+def get_graph_client():
+    """Return the process-wide GraphClient, creating it on first use.
+
+    The client is rebuilt after a fork so worker processes never share
+    sockets with their parent.
+    """
+    global _client, _client_pid
+
+    pid = os.getpid()
+    if _client is not None and _client_pid == pid:
+        return _client
+
+    with _client_lock:
+        if _client is None or _client_pid != pid:
+            _client = GraphClient(
+                pool_size=int(os.getenv("META_GRAPH_POOL_SIZE", DEFAULT_POOL_SIZE)),
+                timeout=float(os.getenv("META_GRAPH_TIMEOUT", DEFAULT_TIMEOUT)),
+                compress=os.getenv("META_GRAPH_COMPRESS", "false").lower() in ("1", "true", "yes"),
+                compress_min_bytes=int(os.getenv("META_GRAPH_COMPRESS_MIN_BYTES", DEFAULT_COMPRESS_MIN_BYTES)),
+                governor=get_governor() if os.getenv("META_RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes") else None,
+            )
+            _client_pid = pid
+    return _client
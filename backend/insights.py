@@ -0,0 +1,235 @@
+import json
+import logging
+import os
+import time
+from datetime import date, datetime
+
+from sqlalchemy.dialects.sqlite import insert
+
+from backend.extensions import db
+from backend.graph_client import GRAPH_API_URL
+from backend.metrics_store import LEVELS as STORE_LEVELS, METRICS, get_metrics_store
+from backend.models import DailyInsight, InsightsReportRun
+
+logger = logging.getLogger(__name__)
+
+LEVELS = ("account", "campaign", "adset", "ad")
+INSIGHTS_FIELDS = [
+    "account_id", "campaign_id", "adset_id", "ad_id", "date_start", "spend", "impressions", "clicks", "conversions",
+]
+PAGE_SIZE = 500           # Result rows per Graph page
+WRITE_BATCH_SIZE = 1000   # Rows per INSERT ... ON CONFLICT statement
+
+# Polling backoff for report runs
+POLL_INITIAL_DELAY = 2.0
+POLL_MAX_DELAY = 60.0
+POLL_BACKOFF = 1.5
+POLL_TIMEOUT = 60 * 60    # Give up on a report run after an hour
+
+OBJECT_ID_FIELD = {"account": "account_id", "campaign": "campaign_id", "adset": "adset_id", "ad": "ad_id"}
+
+
+class InsightsError(Exception):
+    """Raised when Meta rejects, fails or never finishes an insights report run."""
+
+
+def _meta_request(url, payload, method):
+    from backend.routes import make_meta_api_request  # Avoid a circular import
+
+    data = make_meta_api_request(url, payload, method=method)
+    if "error" in data:
+        raise InsightsError(f"Meta API error for {url}: {data['error']}")
+    return data
+
+
+def submit_report_run(ad_account_id, level, since, until, access_token=None):
+    """Start an async insights report run with one row per object per day and return its ID."""
+    payload = {
+        "level": level,
+        "fields": ",".join(INSIGHTS_FIELDS),
+        "time_range": json.dumps({"since": since.isoformat(), "until": until.isoformat()}),
+        "time_increment": 1,
+        "access_token": access_token or os.getenv("META_ACCESS_TOKEN"),
+    }
+    data = _meta_request(f"{GRAPH_API_URL}/act_{ad_account_id}/insights", payload, "POST")
+    return data["report_run_id"]
+
+
+def wait_for_report_run(report_run_id, access_token=None, on_progress=None, timeout=POLL_TIMEOUT):
+    """Poll a report run until Meta finishes it.
+
+    The delay grows while the run makes no progress and shrinks back towards
+    the time the remaining percentage should take at the observed rate.
+    """
+    params = {
+        "fields": "async_status,async_percent_completion",
+        "access_token": access_token or os.getenv("META_ACCESS_TOKEN"),
+    }
+    started = time.monotonic()
+    delay = POLL_INITIAL_DELAY
+    last_percent, last_time = 0, started
+
+    while True:
+        data = _meta_request(f"{GRAPH_API_URL}/{report_run_id}", params, "GET")
+        status = data.get("async_status")
+        percent = int(data.get("async_percent_completion") or 0)
+        if on_progress:
+            on_progress(status, percent)
+
+        if status == "Job Completed" and percent >= 100:
+            return
+        if status in ("Job Failed", "Job Skipped"):
+            raise InsightsError(f"Report run {report_run_id} ended with status '{status}'")
+
+        now = time.monotonic()
+        if now - started > timeout:
+            raise InsightsError(f"Report run {report_run_id} did not finish within {timeout} seconds")
+
+        if percent > last_percent:
+            # Aim for the time the rest of the report should take at the current pace
+            rate = (percent - last_percent) / (now - last_time)
+            delay = (100 - percent) / rate if rate > 0 else delay
+            last_percent, last_time = percent, now
+        else:
+            delay *= POLL_BACKOFF
+        delay = min(POLL_MAX_DELAY, max(POLL_INITIAL_DELAY, delay))
+        time.sleep(delay)
+
+
+def iter_report_rows(report_run_id, access_token=None):
+    """Yield the result rows of a finished report run, one Graph page at a time."""
+    params = {"limit": PAGE_SIZE, "access_token": access_token or os.getenv("META_ACCESS_TOKEN")}
+    url = f"{GRAPH_API_URL}/{report_run_id}/insights"
+
+    while True:
+        data = _meta_request(url, params, "GET")
+        for row in data.get("data", []):
+            yield row
+
+        paging = data.get("paging", {})
+        after = paging.get("cursors", {}).get("after")
+        if not paging.get("next") or not after:
+            break
+        params["after"] = after
+
+
+def _sum_actions(actions):
+    total = 0.0
+    for action in actions or []:
+        try:
+            total += float(action.get("value") or 0)
+        except (TypeError, ValueError):
+            continue
+    return total
+
+
+def row_to_values(level, row):
+    """Map one Meta insights row to an insights_daily row."""
+    return {
+        "level": level,
+        "object_id": row.get(OBJECT_ID_FIELD[level]),
+        "date": date.fromisoformat(row["date_start"]),
+        "ad_account_id": row.get("account_id"),
+        "meta_campaign_id": row.get("campaign_id"),
+        "meta_ad_group_id": row.get("adset_id"),
+        "meta_ad_id": row.get("ad_id"),
+        "spend": float(row.get("spend") or 0),
+        "impressions": int(row.get("impressions") or 0),
+        "clicks": int(row.get("clicks") or 0),
+        "conversions": _sum_actions(row.get("conversions")),
+        "updated_at": datetime.utcnow(),
+    }
+
+
+def write_insight_rows(values):
+    """Upsert a batch of insights_daily rows with a single executemany statement."""
+    if not values:
+        return 0
+    statement = insert(DailyInsight.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=["level", "object_id", "date"],
+        set_={
+            column: statement.excluded[column]
+            for column in ("ad_account_id", "meta_campaign_id", "meta_ad_group_id", "meta_ad_id",
+                           "spend", "impressions", "clicks", "conversions", "updated_at")
+        },
+    )
+    db.session.execute(statement, values)
+    db.session.commit()
+    return len(values)
+
+
+def write_store_rows(level, values):
+    """Mirror a batch of insights_daily rows into the columnar metrics store."""
+    if level not in STORE_LEVELS or not values:
+        return 0
+    return get_metrics_store().write(
+        level, ((v["object_id"], v["date"], {metric: v[metric] for metric in METRICS}) for v in values)
+    )
+
+
+def write_rows_in_batches(level, rows, batch_size=WRITE_BATCH_SIZE):
+    """Write an iterable of Meta rows in fixed-size batches; never holds more than one batch."""
+    written = 0
+    batch = []
+    for row in rows:
+        batch.append(row_to_values(level, row))
+        if len(batch) >= batch_size:
+            written += write_insight_rows(batch)
+            write_store_rows(level, batch)
+            batch = []
+    written += write_insight_rows(batch)
+    write_store_rows(level, batch)
+    return written
+
+
+def ingest_insights(user_id, ad_account_id, level, since, until, access_token=None):
+    """Run one async insights report for an account, level and date range and store its rows.
+
+    Returns the InsightsReportRun row tracking the run.
+    """
+    if level not in LEVELS:
+        raise ValueError(f"level must be one of {', '.join(LEVELS)}")
+
+    run = InsightsReportRun(user_id=user_id, ad_account_id=str(ad_account_id), level=level, since=since, until=until)
+    db.session.add(run)
+    db.session.commit()
+
+    def on_progress(status, percent):
+        run.status = status or run.status
+        run.percent_complete = percent
+        db.session.commit()
+
+    try:
+        run.report_run_id = submit_report_run(ad_account_id, level, since, until, access_token=access_token)
+        db.session.commit()
+
+        wait_for_report_run(run.report_run_id, access_token=access_token, on_progress=on_progress)
+        run.rows_written = write_rows_in_batches(level, iter_report_rows(run.report_run_id, access_token=access_token))
+        run.status = "ingested"
+    except InsightsError as e:
+        db.session.rollback()
+        run.status = "failed"
+        run.error = str(e)
+        raise
+    finally:
+        run.finished_at = datetime.utcnow()
+        db.session.commit()
+
+    logger.info(f"Ingested {run.rows_written} {level} insights rows for act_{ad_account_id} ({since} - {until})")
+    return run
+
+
+def run_ingest_job(user_id, data):
+    """Job handler for `ingest_insights`. Returns (response_body, status_code)."""
+    try:
+        run = ingest_insights(
+            user_id,
+            data.get("ad_account_id") or os.getenv("AD_ACCOUNT_ID"),
+            data.get("level", "ad"),
+            date.fromisoformat(data["since"]),
+            date.fromisoformat(data["until"]),
+        )
+    except InsightsError as e:
+        return {"error": str(e)}, 502
+    return {"message": "Insights ingested", "report_run": run.to_dict()}, 200
@@ -0,0 +1,163 @@
+import logging
+import os
+from datetime import date, datetime, timedelta
+
+from sqlalchemy.dialects.sqlite import insert
+
+from backend.extensions import db
+from backend.insights import InsightsError, ingest_insights
+from backend.metrics_store import METRICS, get_metrics_store
+from backend.models import Campaign, AdGroup, Ad, InsightsCoverage
+
+logger = logging.getLogger(__name__)
+
+# Meta can still restate conversions (and spend) this many days after the fact
+DEFAULT_ATTRIBUTION_WINDOW_DAYS = 28
+# Days inside the window are refetched at most this often
+DEFAULT_MUTABLE_TTL = 60 * 60
+# Longest date range one /api/insights request may ask for
+DEFAULT_MAX_RANGE_DAYS = 93
+
+# Level -> column holding the Meta ID of the user's local objects at that level
+LOCAL_OBJECT_IDS = {
+    "campaign": (Campaign, Campaign.meta_campaign_id),
+    "adset": (AdGroup, AdGroup.meta_ad_group_id),
+    "ad": (Ad, Ad.meta_ad_id),
+}
+
+
+def attribution_window_days():
+    return int(os.getenv("INSIGHTS_ATTRIBUTION_WINDOW_DAYS", DEFAULT_ATTRIBUTION_WINDOW_DAYS))
+
+
+def mutable_ttl():
+    return int(os.getenv("INSIGHTS_MUTABLE_TTL", DEFAULT_MUTABLE_TTL))
+
+
+def max_range_days():
+    return int(os.getenv("INSIGHTS_MAX_RANGE_DAYS", DEFAULT_MAX_RANGE_DAYS))
+
+
+def missing_days(ad_account_id, level, since, until, today=None, now=None):
+    """Return the days in [since, until] that must be fetched from Meta.
+
+    A day is skipped when it is stored and final, or stored and fetched
+    less than INSIGHTS_MUTABLE_TTL seconds ago. Days after today are never
+    fetched.
+    """
+    today = today or date.today()
+    now = now or datetime.utcnow()
+    until = min(until, today)
+    if since > until:
+        return []
+
+    fresh_after = now - timedelta(seconds=mutable_ttl())
+    covered = {
+        day
+        for day, final, fetched_at in db.session.query(
+            InsightsCoverage.date, InsightsCoverage.final, InsightsCoverage.fetched_at
+        ).filter(
+            InsightsCoverage.ad_account_id == str(ad_account_id),
+            InsightsCoverage.level == level,
+            InsightsCoverage.date.between(since, until),
+        )
+        if final or fetched_at >= fresh_after
+    }
+    return [since + timedelta(days=i) for i in range((until - since).days + 1)
+            if since + timedelta(days=i) not in covered]
+
+
+def day_ranges(days):
+    """Collapse sorted days into (since, until) runs of consecutive days."""
+    ranges = []
+    for day in days:
+        if ranges and day == ranges[-1][1] + timedelta(days=1):
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return [tuple(r) for r in ranges]
+
+
+def mark_covered(ad_account_id, level, since, until, today=None):
+    """Record [since, until] as fetched; days past the attribution window become final."""
+    today = today or date.today()
+    now = datetime.utcnow()
+    final_before = today - timedelta(days=attribution_window_days())
+    values = [
+        {
+            "ad_account_id": str(ad_account_id),
+            "level": level,
+            "date": since + timedelta(days=i),
+            "final": since + timedelta(days=i) < final_before,
+            "fetched_at": now,
+        }
+        for i in range((until - since).days + 1)
+    ]
+    statement = insert(InsightsCoverage.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=["ad_account_id", "level", "date"],
+        set_={"final": statement.excluded.final, "fetched_at": statement.excluded.fetched_at},
+    )
+    db.session.execute(statement, values)
+    db.session.commit()
+
+
+def fill_insights(user_id, ad_account_id, level, since, until, access_token=None):
+    """Fetch only the missing or stale days of [since, until], one report run per consecutive range.
+
+    Returns the list of (since, until) ranges that were fetched.
+    """
+    fetched = []
+    for range_since, range_until in day_ranges(missing_days(ad_account_id, level, since, until)):
+        ingest_insights(user_id, ad_account_id, level, range_since, range_until, access_token=access_token)
+        mark_covered(ad_account_id, level, range_since, range_until)
+        fetched.append((range_since, range_until))
+    logger.info(f"Filled {level} insights for act_{ad_account_id} ({since} - {until}): fetched {fetched}")
+    return fetched
+
+
+def run_fill_insights_job(user_id, data):
+    """Job handler for `fill_insights`. Returns (response_body, status_code)."""
+    try:
+        fetched = fill_insights(
+            user_id,
+            data["ad_account_id"],
+            data["level"],
+            date.fromisoformat(data["since"]),
+            date.fromisoformat(data["until"]),
+        )
+    except InsightsError as e:
+        return {"error": str(e)}, 502
+    return {
+        "message": "Insights cache filled",
+        "fetched": [{"since": s.isoformat(), "until": u.isoformat()} for s, u in fetched],
+    }, 200
+
+
+def owned_object_ids(user_id, level, object_ids=None):
+    """The Meta IDs of the user's local objects at `level`.
+
+    With `object_ids`, keeps only those the user owns, in the given order.
+    """
+    model, column = LOCAL_OBJECT_IDS[level]
+    owned = [object_id for (object_id,) in db.session.query(column).filter(model.user_id == user_id, column.isnot(None))]
+    if object_ids is None:
+        return owned
+    owned = set(owned)
+    return [object_id for object_id in dict.fromkeys(str(object_id) for object_id in object_ids) if object_id in owned]
+
+
+def cached_insights(user_id, level, since, until, object_ids=None):
+    """Read daily metrics for [since, until] from the metrics store.
+
+    Without `object_ids`, returns the user's local objects at `level`;
+    `object_ids` the user does not own are dropped.
+    Returns {"object_ids", "dates", "metrics": {metric: matrix}}.
+    """
+    object_ids = owned_object_ids(user_id, level, object_ids)
+
+    store = get_metrics_store()
+    metrics = {}
+    for metric in METRICS:
+        object_ids, metrics[metric] = store.query(level, metric, since, until, object_ids=object_ids)
+    return {"object_ids": object_ids, "dates": store.dates(since, until), "metrics": metrics}
@@ -0,0 +1,286 @@
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+
+from flask import g, request
+
+from backend.extensions import db
+from backend.models import Job
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 2
+DEFAULT_POLL_INTERVAL = 1.0    # Seconds an idle worker sleeps before looking for new jobs
+DEFAULT_MAX_ATTEMPTS = 5
+RETRY_BASE_DELAY = 5           # Seconds before the first retry, doubled on every attempt
+# Only these are safe to retry: a 500 may come after Meta already created the object
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+LEASE_TIMEOUT = 15 * 60        # Running jobs untouched for this long are assumed orphaned
+HEARTBEAT_INTERVAL = LEASE_TIMEOUT / 3  # Long jobs refresh their lease this often
+LEASE_SWEEP_INTERVAL = LEASE_TIMEOUT / 3  # Each process looks for orphaned jobs this often
+
+# Job kind -> handler(user_id, payload) returning (response_body, status_code)
+_handlers = {}
+# Job kinds whose handlers may have changed something on Meta before raising
+_no_retry_on_exception = set()
+
+
+def register_job_handler(kind, handler, retry_on_exception=True):
+    """Register the function that runs jobs of `kind`.
+
+    Pass retry_on_exception=False for handlers that are not idempotent (creates):
+    an exception may come after Meta already made the object, so the job fails
+    instead of being retried.
+    """
+    _handlers[kind] = handler
+    if retry_on_exception:
+        _no_retry_on_exception.discard(kind)
+    else:
+        _no_retry_on_exception.add(kind)
+
+
+def wants_async():
+    """True when the client opted into async mode with `?async=true` or `Prefer: respond-async`."""
+    if request.args.get('async', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return 'respond-async' in request.headers.get('Prefer', '')
+
+
+def enqueue_job(kind, user_id, payload, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Persist a new queued job and wake up the workers."""
+    if kind not in _handlers:
+        raise ValueError(f"No handler registered for job kind '{kind}'")
+
+    job = Job(kind=kind, user_id=user_id, payload=payload, status='queued', max_attempts=max_attempts)
+    db.session.add(job)
+    db.session.commit()
+
+    if _pool is not None:
+        _pool.notify()
+    return job
+
+
+class JobWorkerPool:
+    """Threads that pull queued jobs from the `jobs` table and run them.
+
+    Jobs are claimed with a conditional UPDATE so several workers (and
+    several processes) can share one queue without running a job twice.
+    Handlers answer like a route: 2xx succeeds, 429/502/503/504 and
+    unexpected exceptions are retried with exponential backoff until
+    `max_attempts` (after which the job is dead-lettered), and any other
+    error fails the job. Exceptions from kinds registered with
+    retry_on_exception=False fail the job too.
+    """
+
+    def __init__(self, app, size=DEFAULT_WORKERS, poll_interval=DEFAULT_POLL_INTERVAL):
+        self.app = app
+        self.size = size
+        self.poll_interval = poll_interval
+        self._wakeup = threading.Condition()
+        self._stopping = threading.Event()
+        self._threads = []
+        self._sweep_lock = threading.Lock()
+        self._next_sweep = 0.0
+
+    def start(self):
+        for i in range(self.size):
+            worker_id = f"{socket.gethostname()}:{os.getpid()}:{i}"
+            thread = threading.Thread(target=self._run, args=(worker_id,), name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self.notify(all_workers=True)
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def notify(self, all_workers=False):
+        with self._wakeup:
+            if all_workers:
+                self._wakeup.notify_all()
+            else:
+                self._wakeup.notify()
+
+    def _run(self, worker_id):
+        while not self._stopping.is_set():
+            try:
+                with self.app.app_context():
+                    ran = self._run_one(worker_id)
+            except Exception:
+                logger.exception("Job worker loop failed")
+                ran = False
+
+            if not ran:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+
+    def _sweep_orphans(self):
+        """Requeue jobs whose worker died mid-run; one thread per process does this every LEASE_SWEEP_INTERVAL."""
+        with self._sweep_lock:
+            if time.monotonic() < self._next_sweep:
+                return
+            self._next_sweep = time.monotonic() + LEASE_SWEEP_INTERVAL
+
+        requeued = Job.query.filter(
+            Job.status == 'running', Job.updated_at < datetime.utcnow() - timedelta(seconds=LEASE_TIMEOUT)
+        ).update({'status': 'queued', 'locked_by': None}, synchronize_session=False)
+        if requeued:
+            db.session.commit()
+            logger.warning(f"Requeued {requeued} orphaned job(s)")
+        else:
+            db.session.rollback()
+
+    def _claim(self, worker_id):
+        self._sweep_orphans()
+
+        now = datetime.utcnow()
+        job_id = db.session.query(Job.id).filter(
+            Job.status == 'queued', Job.run_after <= now
+        ).order_by(Job.run_after, Job.id).limit(1).scalar()
+        if job_id is None:
+            # Nothing to claim: end the read transaction without a commit
+            db.session.rollback()
+            return None
+
+        claimed = Job.query.filter_by(id=job_id, status='queued').update(
+            {'status': 'running', 'locked_by': worker_id, 'attempts': Job.attempts + 1, 'updated_at': now},
+            synchronize_session=False,
+        )
+        db.session.commit()
+        return db.session.get(Job, job_id) if claimed else None
+
+    def _run_one(self, worker_id):
+        job = self._claim(worker_id)
+        if job is None:
+            return False
+
+        handler = _handlers.get(job.kind)
+        done = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(job.id, worker_id, done), daemon=True).start()
+        try:
+            return self._run_handler(job, handler)
+        finally:
+            done.set()
+
+    def _heartbeat(self, job_id, worker_id, done):
+        # Keep updated_at fresh so long jobs (report polling, syncs) are not mistaken for orphans
+        while not done.wait(HEARTBEAT_INTERVAL):
+            try:
+                with self.app.app_context():
+                    Job.query.filter_by(id=job_id, locked_by=worker_id).update(
+                        {'updated_at': datetime.utcnow()}, synchronize_session=False
+                    )
+                    db.session.commit()
+            except Exception:
+                logger.exception(f"Heartbeat for job {job_id} failed")
+
+    def _run_handler(self, job, handler):
+        try:
+            if handler is None:
+                raise LookupError(f"No handler registered for job kind '{job.kind}'")
+            body, status_code = handler(job.user_id, job.payload or {})
+            # Meta calls refused by the rate limit governor leave a retry-after hint behind
+            retry_after = g.pop('meta_retry_after', None)
+            if retry_after and status_code >= 400:
+                status_code = 429
+        except Exception as e:
+            db.session.rollback()
+            job = db.session.get(Job, job.id)
+            logger.error(f"Job {job.id} ({job.kind}) raised: {e}")
+            error = str(e) + "\n" + traceback.format_exc()
+            if job.kind in _no_retry_on_exception:
+                self._fail(job, error)
+            else:
+                self._retry_or_bury(job, error, None)
+            return True
+
+        job.result = body
+        job.result_status_code = status_code
+        if status_code < 400:
+            job.status = 'succeeded'
+            job.error = None
+            job.finished_at = datetime.utcnow()
+            job.locked_by = None
+            db.session.commit()
+        elif status_code in RETRYABLE_STATUS_CODES:
+            self._retry_or_bury(job, _error_message(body), retry_after)
+        else:
+            self._fail(job, _error_message(body))
+        return True
+
+    def _fail(self, job, error):
+        job.status = 'failed'
+        job.error = error
+        job.finished_at = datetime.utcnow()
+        job.locked_by = None
+        db.session.commit()
+
+    def _retry_or_bury(self, job, error, retry_after):
+        job.error = error
+        job.locked_by = None
+        if job.attempts >= job.max_attempts:
+            # Dead letter: kept for inspection, only rerun through the retry endpoint
+            job.status = 'dead'
+            job.finished_at = datetime.utcnow()
+            logger.warning(f"Job {job.id} ({job.kind}) dead-lettered after {job.attempts} attempts")
+        else:
+            delay = retry_after or RETRY_BASE_DELAY * 2 ** (job.attempts - 1)
+            job.status = 'queued'
+            job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+        db.session.commit()
+
+
+def _error_message(body):
+    if isinstance(body, dict):
+        error = body.get('error', body)
+        if isinstance(error, dict):
+            return error.get('error_user_msg') or error.get('message') or str(error)
+        return str(error)
+    return str(body)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def start_job_workers(app):
+    """Start this process's worker pool once; a no-op when JOB_WORKERS is 0."""
+    global _pool
+
+    if _pool is not None or app.config.get('JOB_WORKERS', DEFAULT_WORKERS) <= 0:
+        return _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = JobWorkerPool(
+                app,
+                size=app.config.get('JOB_WORKERS', DEFAULT_WORKERS),
+                poll_interval=app.config.get('JOB_POLL_INTERVAL', DEFAULT_POLL_INTERVAL),
+            )
+            _pool.start()
+    return _pool
+
+
+def stop_job_workers(timeout=None):
+    """Stop this process's worker pool, waiting up to `timeout` seconds per thread for its current job."""
+    global _pool
+
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.stop(timeout)
+
+
+def _reset_after_fork():
+    # Threads don't survive fork(); the child starts its own pool on first use
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
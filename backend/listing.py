@@ -0,0 +1,200 @@
+import base64
+import binascii
+import json
+import logging
+from datetime import date, datetime
+
+from flask import Response, current_app, jsonify, request, stream_with_context
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500        # Rows fetched from the database at a time while streaming
+STREAM_CHUNK_SIZE = 64 * 1024  # Approximate bytes per chunk written to the client
+NDJSON_MIMETYPE = "application/x-ndjson"
+
+
+class ListingError(ValueError):
+    """Raised for invalid pagination or field parameters; the message is safe to return to the client."""
+
+
+def encode_cursor(last_id, descending=False):
+    payload = json.dumps({"id": last_id, "desc": descending}, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return int(payload["id"]), bool(payload.get("desc"))
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        raise ListingError("Invalid cursor")
+
+
+def page_params():
+    """Read `limit`, `cursor` and `order` from the query string.
+
+    Returns (limit, after_id, descending), or None when the client asked
+    for no pagination at all (the old, unpaginated behaviour).
+    """
+    limit, cursor, order = request.args.get("limit"), request.args.get("cursor"), request.args.get("order")
+    if limit is None and cursor is None:
+        return None
+
+    try:
+        limit = int(limit) if limit is not None else DEFAULT_PAGE_SIZE
+    except ValueError:
+        raise ListingError("limit must be an integer")
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ListingError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+    if cursor:
+        # The cursor remembers the direction it was issued for
+        after_id, descending = decode_cursor(cursor)
+    else:
+        after_id, descending = None, order == "desc"
+    return limit, after_id, descending
+
+
+def sparse_columns(model, allowed=None):
+    """The columns named by `?fields=a,b,c`, or None when the client did not ask for a subset.
+
+    `allowed` limits the choice to the fields the endpoint normally returns
+    (default: every public column). The primary key is always included.
+    """
+    fields = request.args.get("fields")
+    if not fields:
+        return None
+
+    columns = {attr.key: attr for attr in model.__mapper__.column_attrs if not attr.key.startswith("_")}
+    allowed = set(allowed) if allowed is not None else set(columns)
+    names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in allowed or name not in columns]
+    if unknown:
+        raise ListingError(f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(sorted(allowed & set(columns)))}")
+
+    primary_key = model.__mapper__.primary_key[0].key
+    if primary_key not in names:
+        names.insert(0, primary_key)
+    return [getattr(model, name) for name in names]
+
+
+def _json_value(value):
+    # Match how to_dict() renders dates
+    return value.isoformat() if isinstance(value, (datetime, date)) else value
+
+
+def row_dict(row):
+    """Serialize a column-only result row (see `sparse_columns`)."""
+    return {key: _json_value(value) for key, value in row._asdict().items()}
+
+
+def sparse_query(query, model, serialize, allowed=None):
+    """Narrow `query` to the `?fields=` columns, if any. Returns (query, serialize).
+
+    Projected queries select just those columns: no ORM objects are built
+    and unrequested columns (such as JSON blobs) are never read.
+    """
+    columns = sparse_columns(model, allowed)
+    if columns is None:
+        return query, serialize
+    return query.with_entities(*columns), row_dict
+
+
+def one_response(query, model, serialize, not_found, allowed=None):
+    """Respond with the first row of `query`, projected to `?fields=` if given, or with `not_found`."""
+    try:
+        query, serialize = sparse_query(query, model, serialize, allowed)
+    except ListingError as e:
+        return jsonify({"error": str(e)}), 400
+
+    row = query.first()
+    if row is None:
+        return not_found
+    return jsonify(serialize(row)), 200
+
+
+def stream_format():
+    """The streaming format asked for with `?stream=json|ndjson` or `Accept: application/x-ndjson`, if any."""
+    stream = request.args.get("stream")
+    if stream is None and NDJSON_MIMETYPE in request.headers.get("Accept", ""):
+        stream = "ndjson"
+    if stream not in (None, "json", "ndjson"):
+        raise ListingError("stream must be json or ndjson")
+    return stream
+
+
+def _stream_rows(query, serialize, ndjson):
+    dumps = current_app.json.dumps
+    chunk, size = ["" if ndjson else "["], 1
+    first = True
+    try:
+        for row in query.yield_per(STREAM_BATCH_SIZE):
+            text = dumps(serialize(row), separators=(",", ":"))
+            if ndjson:
+                text += "\n"
+            elif not first:
+                text = "," + text
+            first = False
+            chunk.append(text)
+            size += len(text)
+            if size >= STREAM_CHUNK_SIZE:
+                yield "".join(chunk)
+                chunk, size = [], 0
+    except Exception:
+        # Headers are already sent; cutting the body short is the only way left to signal failure
+        logger.exception("Streaming list response failed")
+        return
+    if not ndjson:
+        chunk.append("]")
+    yield "".join(chunk)
+
+
+def stream_list(query, serialize, ndjson=False):
+    """Stream every row of `query` as a chunked JSON array (or NDJSON, one object per line).
+
+    Rows are fetched `STREAM_BATCH_SIZE` at a time and serialized as they
+    arrive, so memory stays flat however many rows there are.
+    """
+    return Response(
+        stream_with_context(_stream_rows(query, serialize, ndjson)),
+        mimetype=NDJSON_MIMETYPE if ndjson else "application/json",
+    )
+
+
+def list_response(query, id_column, serialize, allowed=None):
+    """Respond with `query` as a plain list, a stream, or one keyset page on `id_column`.
+
+    Without `limit`/`cursor` every row is returned as a plain JSON list, as
+    before; `stream=json|ndjson` streams that same list instead of building
+    it in memory. With `limit`/`cursor` the response is
+    {"data": [...], "next_cursor": ...}; each page seeks past the previous
+    page's last ID, so deep pages cost the same as the first. `?fields=`
+    narrows every mode to the named columns (out of `allowed`).
+    """
+    try:
+        stream = stream_format()
+        params = page_params()
+        query, serialize = sparse_query(query, id_column.class_, serialize, allowed)
+    except ListingError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if stream and params is not None:
+        return jsonify({"error": "stream cannot be combined with limit or cursor"}), 400
+    if stream:
+        return stream_list(query.order_by(id_column), serialize, ndjson=stream == "ndjson")
+    if params is None:
+        return jsonify([serialize(row) for row in query.order_by(id_column)]), 200
+
+    limit, after_id, descending = params
+    if after_id is not None:
+        query = query.filter(id_column < after_id if descending else id_column > after_id)
+    query = query.order_by(id_column.desc() if descending else id_column)
+
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].id, descending)
+    return jsonify({"data": [serialize(row) for row in rows], "next_cursor": next_cursor}), 200
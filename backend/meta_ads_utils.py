@@ -5,20 +5,20 @@ from dotenv import load_dotenv
 import json
 from flask import current_app as app  # Add this import to use app context
 from backend.models import Campaign  # Adjust the import path based on where your models are defined
+from backend.graph_client import GRAPH_API_URL, get_graph_client
 import logging
 
 # Load environment variables from .env file
 load_dotenv()
 
 # Initialize logger for error tracking
-logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 def create_meta_campaign(name, status, start_date, end_date):
     try:
         # Meta Ads API endpoint (using the AD_ACCOUNT_ID from .env)
         ad_account_id = os.getenv('AD_ACCOUNT_ID')  # Get the AD_ACCOUNT_ID from the .env file
-        url = f'https://graph.facebook.com/v22.0/act_{ad_account_id}/campaigns'
+        url = f'{GRAPH_API_URL}/act_{ad_account_id}/campaigns'
         
         access_token = os.getenv('META_ACCESS_TOKEN')  # Retrieve the Meta Ads access token from the environment
         
@@ -26,9 +26,7 @@ def create_meta_campaign(name, status, start_date, end_date):
         start_time = datetime.fromtimestamp(start_date, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")  # Convert Unix timestamp to ISO 8601 format with timezone
         end_time = datetime.fromtimestamp(end_date, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")  # Convert Unix timestamp to ISO 8601 format with timezone
 
-        # Debugging: print values for troubleshooting
-        print(f"Start Time: {start_time}, End Time: {end_time}")  # Debugging print
-        print(f"Name: {name}, Status: {status}, Access Token: {access_token}")  # Ensure these values are being passed correctly
+        logger.debug("Creating campaign %r (%s) from %s to %s", name, status, start_time, end_time)
 
         # Construct the payload (data) for the campaign
         payload = {
@@ -41,20 +39,16 @@ def create_meta_campaign(name, status, start_date, end_date):
         }
 
         # Use multipart/form-data as per Meta's example
-        response = requests.post(url, data=payload)
+        response = get_graph_client().post(url, data=payload)
         
-        # Debugging: print the response for troubleshooting
-        print(f"Response status code: {response.status_code}")
-        print(f"Response body: {response.text}")
+        logger.debug("Meta response %s: %s", response.status_code, response.text)
 
         # Check if the response status is 200 or 201 and process accordingly
         if response.status_code in [200, 201]:
             data = response.json()  # Parse the JSON response body
-            print(f"Campaign created successfully. Response: {data}")
+            logger.info(f"Created Meta campaign {data['id']}")
             return data['id']  # Return the Meta campaign ID from the response
         else:
-            # If the API request failed, print the response content for debugging
-            print(f"Error response received: {response.text}")
             raise Exception(f"Error creating campaign on Meta Ads: {response.text}")
     
     except requests.exceptions.RequestException as e:
@@ -69,7 +63,7 @@ def create_meta_campaign(name, status, start_date, end_date):
 def delete_meta_campaign(campaign_id):
     try:
         # Meta Ads API endpoint to delete the campaign (using the campaign ID)
-        url = f'https://graph.facebook.com/v22.0/{campaign_id}'
+        url = f'{GRAPH_API_URL}/{campaign_id}'
         
         # Access token from environment
         access_token = os.getenv('META_ACCESS_TOKEN')
@@ -80,17 +74,15 @@ def delete_meta_campaign(campaign_id):
         }
 
         # Send DELETE request to Facebook
-        response = requests.delete(url, params=params)
+        response = get_graph_client().delete(url, params=params)
 
-        # Debugging: print the response for troubleshooting
-        print(f"Delete Response status code: {response.status_code}")
-        print(f"Delete Response body: {response.text}")
+        logger.debug("Meta response %s: %s", response.status_code, response.text)
 
         if response.status_code == 200:
-            print(f"Campaign {campaign_id} deleted successfully.")
+            logger.info(f"Deleted Meta campaign {campaign_id}")
             return True
         else:
-            print(f"Error deleting campaign {campaign_id}: {response.text}")
+            logger.warning(f"Deleting Meta campaign {campaign_id} failed: {response.text}")
             return False
     
     except requests.exceptions.RequestException as e:
@@ -177,7 +169,7 @@ def create_meta_ad_group(name, campaign_id, daily_budget, conversion_location, o
         app.logger.info(f"Using default optimization goal '{optimization_goal}' for objective '{objective}' and conversion location '{conversion_location}'.")
 
     # Prepare the data to send to Meta API
-    url = f'https://graph.facebook.com/v22.0/act_{ad_account_id}/adsets'
+    url = f'{GRAPH_API_URL}/act_{ad_account_id}/adsets'
     
     # Prepare the data to send to Meta API (same as before)
     payload = {
@@ -190,7 +182,7 @@ def create_meta_ad_group(name, campaign_id, daily_budget, conversion_location, o
     }
     
     # Send POST request to Meta API and handle the response
-    response = requests.post(url, data=payload)
+    response = get_graph_client().post(url, data=payload)
     
     if response.status_code == 200:
         data = response.json()
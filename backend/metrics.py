@@ -0,0 +1,463 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+INSTANCE_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), "instance")
+DEFAULT_DIR = os.path.join(INSTANCE_DIR, "metrics")
+DEFAULT_FLUSH_INTERVAL = 5.0  # Seconds between snapshots of this process's metrics for the other workers
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+GRAPH_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+
+# name -> (type, help, buckets)
+_metrics = {}
+
+
+def describe(name, kind, help_text, buckets=None):
+    _metrics[name] = (kind, help_text, tuple(buckets) if buckets else None)
+
+
+describe("http_requests_total", "counter", "Requests handled, by Flask endpoint, method and status.")
+describe("http_request_duration_seconds", "histogram", "Time to produce a response (streamed bodies excluded).",
+         REQUEST_BUCKETS)
+describe("meta_graph_requests_total", "counter", "Graph API calls, by method, path template and HTTP status.")
+describe("meta_graph_request_duration_seconds", "histogram", "Graph API call latency by method and path template.",
+         GRAPH_BUCKETS)
+describe("meta_graph_errors_total", "counter", "Graph API error responses, by path template and Meta error code.")
+describe("meta_graph_retries_total", "counter", "Graph API calls retried after throttling, by path template.")
+describe("meta_graph_backoff_seconds_total", "counter", "Seconds of backoff imposed after throttling, by path template.")
+describe("meta_graph_rate_limited_total", "counter", "Graph API calls refused locally by the rate limit governor.")
+describe("meta_rate_limit_wait_seconds_total", "counter", "Seconds Graph calls waited for the rate limit governor, by path template.")
+describe("meta_usage_percent", "gauge", "Latest usage Meta reported in its usage headers, by bucket and scope.")
+describe("meta_rate_limit_blocked_seconds", "gauge", "Seconds until the governor lets calls through again, by bucket.")
+describe("meta_graph_pool_requests_total", "counter", "Graph requests sent through the connection pool.")
+describe("meta_graph_pool_connections_total", "counter", "Connections the Graph pool had to open.")
+describe("meta_graph_pool_idle_connections", "gauge", "Idle kept-alive Graph connections.")
+describe("db_queries_total", "counter", "SQL statements executed, by verb.")
+describe("db_query_duration_seconds", "histogram", "SQL statement latency by verb.", QUERY_BUCKETS)
+describe("db_session_commits_total", "counter", "Session commits.")
+describe("db_session_rollbacks_total", "counter", "Session rollbacks.")
+describe("db_pool_checkouts_total", "counter", "Connections checked out of the pool.")
+describe("db_pool_connects_total", "counter", "New DB connections opened by the pool.")
+describe("db_pool_size", "gauge", "Configured DB pool size.")
+describe("db_pool_checked_out", "gauge", "DB connections in use.")
+describe("db_pool_overflow", "gauge", "DB connections open beyond the pool size.")
+describe("response_cache_lookups_total", "counter", "Response cache lookups, by cache and result.")
+describe("response_cache_entries", "gauge", "Entries in the response cache, by cache.")
+describe("response_cache_bytes", "gauge", "Bytes of cached bodies, by cache.")
+describe("auth_cache_lookups_total", "counter", "Token and user cache lookups, by cache and result.")
+describe("events_connections", "gauge", "Open /api/events streams.")
+
+
+class _Shard:
+    """One thread's counters and histograms. Only that thread writes to it, so recording takes no lock."""
+
+    __slots__ = ("counters", "histograms", "thread")
+
+    def __init__(self, thread):
+        self.counters = {}    # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [count per bucket..., count above the last, sum]
+        self.thread = thread
+
+
+_local = threading.local()
+_shards = []
+_retired = _Shard(None)  # Totals of threads that have exited
+_gauges = {}             # (name, labels) -> value; last write wins
+_process_collectors = []  # Called when this process snapshots its metrics
+_scrape_collectors = []   # Called once per scrape, for host-wide values
+_lock = threading.Lock()
+_writer = None
+
+
+def _shard():
+    try:
+        return _local.shard
+    except AttributeError:
+        shard = _local.shard = _Shard(threading.current_thread())
+        with _lock:
+            _shards.append(shard)
+        _ensure_writer()
+        return shard
+
+
+def inc(name, labels=(), value=1):
+    """Add `value` to a counter. `labels` is a tuple of (name, value) pairs."""
+    counters = _shard().counters
+    key = (name, labels)
+    counters[key] = counters.get(key, 0) + value
+
+
+def observe(name, value, labels=()):
+    """Record `value` in a histogram."""
+    histograms = _shard().histograms
+    key = (name, labels)
+    entry = histograms.get(key)
+    if entry is None:
+        entry = histograms[key] = [0] * (len(_metrics[name][2]) + 1) + [0.0]
+    entry[bisect_left(_metrics[name][2], value)] += 1
+    entry[-1] += value
+
+
+def set_gauge(name, value, labels=()):
+    _gauges[(name, labels)] = value
+
+
+def register_process_collector(collector):
+    """`collector()` returns (kind, name, labels, value) samples describing this process, e.g. its pool."""
+    _process_collectors.append(collector)
+
+
+def register_scrape_collector(collector):
+    """`collector()` returns (kind, name, labels, value) samples that are the same in every process."""
+    _scrape_collectors.append(collector)
+
+
+def _merge(counters, histograms, shard_counters, shard_histograms):
+    for key, value in shard_counters.items():
+        counters[key] = counters.get(key, 0) + value
+    for key, entry in shard_histograms.items():
+        total = histograms.get(key)
+        if total is None:
+            histograms[key] = list(entry)
+        else:
+            for i, value in enumerate(entry):
+                total[i] += value
+
+
+def _collect(collectors, counters, gauges):
+    for collector in collectors:
+        try:
+            samples = collector()
+        except Exception:
+            continue  # A broken collector must not take the endpoint down
+        for kind, name, labels, value in samples:
+            if kind == "counter":
+                counters[(name, labels)] = counters.get((name, labels), 0) + value
+            else:
+                gauges[(name, labels)] = value
+
+
+def snapshot():
+    """This process's metrics: {"counters", "histograms", "gauges"}, keyed by (name, labels)."""
+    with _lock:
+        alive = []
+        for shard in _shards:
+            if shard.thread.is_alive():
+                alive.append(shard)
+            else:
+                # It will never write again, so folding it in needs no coordination
+                _merge(_retired.counters, _retired.histograms, shard.counters, shard.histograms)
+        _shards[:] = alive
+        shards = [_retired, *alive]
+
+    counters, histograms = {}, {}
+    for shard in shards:
+        # dict.copy() is atomic under the GIL, so the owning thread may keep writing
+        _merge(counters, histograms, shard.counters.copy(), {k: list(v) for k, v in shard.histograms.copy().items()})
+    gauges = dict(_gauges)
+    _collect(_process_collectors, counters, gauges)
+    return {"counters": counters, "histograms": histograms, "gauges": gauges}
+
+
+# ==========================
+# Sharing between worker processes
+# ==========================
+def metrics_dir():
+    return os.getenv("METRICS_DIR", DEFAULT_DIR)
+
+
+def _encode(snap):
+    return {kind: [[name, [list(pair) for pair in labels], value] for (name, labels), value in values.items()]
+            for kind, values in snap.items()}
+
+
+def _decode(data):
+    return {kind: {(name, tuple(tuple(pair) for pair in labels)): value for name, labels, value in data.get(kind, [])}
+            for kind in ("counters", "histograms", "gauges")}
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return _decode(json.load(f))
+    except (OSError, ValueError):
+        return None
+
+
+def _write(path, snap):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(_encode(snap), f, separators=(",", ":"))
+    os.replace(tmp, path)
+
+
+def write_snapshot():
+    """Publish this process's metrics for /metrics in the other worker processes."""
+    directory = metrics_dir()
+    os.makedirs(directory, exist_ok=True)
+    _write(os.path.join(directory, f"{os.getpid()}.json"), snapshot())
+
+
+def clear_snapshots():
+    """Forget the snapshots left behind by an earlier run."""
+    directory = metrics_dir()
+    if os.path.isdir(directory):
+        for filename in os.listdir(directory):
+            if filename.endswith(".json"):
+                os.unlink(os.path.join(directory, filename))
+
+
+def _write_periodically(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            write_snapshot()
+        except OSError:
+            pass
+
+
+def _ensure_writer():
+    global _writer
+
+    if _writer is None and os.getenv("METRICS_MULTIPROCESS", "true").lower() in ("1", "true", "yes"):
+        with _lock:
+            if _writer is None:
+                interval = float(os.getenv("METRICS_FLUSH_INTERVAL", DEFAULT_FLUSH_INTERVAL))
+                _writer = threading.Thread(target=_write_periodically, args=(interval,), name="metrics-writer",
+                                           daemon=True)
+                _writer.start()
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _host_snapshots():
+    """Every worker's latest snapshot plus the totals of exited workers; gauges keep a `pid` label."""
+    own = snapshot()
+    if os.getenv("METRICS_MULTIPROCESS", "true").lower() not in ("1", "true", "yes"):
+        return [(os.getpid(), own)]
+
+    directory = metrics_dir()
+    os.makedirs(directory, exist_ok=True)
+    snapshots = [(os.getpid(), own)]
+    with open(os.path.join(directory, ".lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            retired_path = os.path.join(directory, "retired.json")
+            retired = _read(retired_path) or {"counters": {}, "histograms": {}, "gauges": {}}
+            folded = False
+            for filename in os.listdir(directory):
+                pid = filename[:-len(".json")]
+                if not filename.endswith(".json") or not pid.isdigit() or int(pid) == os.getpid():
+                    continue
+                path = os.path.join(directory, filename)
+                snap = _read(path)
+                if snap is None:
+                    continue
+                if _pid_alive(int(pid)):
+                    snapshots.append((int(pid), snap))
+                else:
+                    # An exited worker's counts stay in the totals; its gauges no longer mean anything
+                    _merge(retired["counters"], retired["histograms"], snap["counters"], snap["histograms"])
+                    os.unlink(path)
+                    folded = True
+            if folded:
+                _write(retired_path, retired)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    snapshots.append((None, retired))
+    return snapshots
+
+
+# ==========================
+# Exposition
+# ==========================
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(labels, extra=()):
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_metrics():
+    """All worker processes' metrics in the Prometheus text format."""
+    counters, histograms, gauges = {}, {}, {}
+    for pid, snap in _host_snapshots():
+        _merge(counters, histograms, snap["counters"], snap["histograms"])
+        for (name, labels), value in snap["gauges"].items():
+            gauges[(name, labels + (("pid", pid),))] = value
+    _collect(_scrape_collectors, counters, gauges)
+
+    samples = {}
+    for values in (counters, histograms, gauges):
+        for (name, labels), value in values.items():
+            samples.setdefault(name, []).append((labels, value))
+
+    lines = []
+    for name in sorted(samples):
+        kind, help_text, buckets = _metrics.get(name, ("untyped", "", None))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in sorted(samples[name], key=lambda sample: repr(sample[0])):
+            if kind != "histogram":
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                continue
+            cumulative = 0
+            for bound, count in zip((*buckets, float("inf")), value[:-1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, (('le', _number(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {_number(value[-1])}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+    return "\n".join(lines) + "\n"
+
+
+# ==========================
+# Instrumentation
+# ==========================
+def register_metrics(app):
+    """Time every request, SQL statement and session commit of `app`, and report its pools and caches."""
+    from flask import g, request
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+
+    from backend.extensions import db
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def record_request(response):
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            endpoint = request.endpoint or "unmatched"
+            inc("http_requests_total", (("endpoint", endpoint), ("method", request.method),
+                                        ("status", response.status_code)))
+            observe("http_request_duration_seconds", time.perf_counter() - started,
+                    (("endpoint", endpoint), ("method", request.method)))
+        return response
+
+    with app.app_context():
+        engine = db.engine
+    if not event.contains(engine, "before_cursor_execute", _start_query_timer):
+        event.listen(engine, "before_cursor_execute", _start_query_timer)
+        event.listen(engine, "after_cursor_execute", _record_query)
+        # Pool events registered on the engine survive engine.dispose()
+        event.listen(engine, "checkout", lambda *args: inc("db_pool_checkouts_total"))
+        event.listen(engine, "connect", lambda *args: inc("db_pool_connects_total"))
+        event.listen(Session, "after_commit", lambda session: inc("db_session_commits_total"))
+        event.listen(Session, "after_rollback", lambda session: inc("db_session_rollbacks_total"))
+        register_process_collector(lambda: _pool_samples(engine))
+        register_process_collector(_cache_samples)
+        register_scrape_collector(_host_samples)
+
+
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    # On the statement's own context: a statement that raises never reaches after_cursor_execute,
+    # and its start time goes away with the context
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _record_query(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    labels = (("verb", statement.lstrip()[:6].upper().rstrip()),)
+    inc("db_queries_total", labels)
+    observe("db_query_duration_seconds", time.perf_counter() - started, labels)
+
+
+def _pool_samples(engine):
+    pool = engine.pool
+    samples = []
+    for name, method in (("db_pool_size", "size"), ("db_pool_checked_out", "checkedout"),
+                         ("db_pool_overflow", "overflow")):
+        if hasattr(pool, method):
+            samples.append(("gauge", name, (), getattr(pool, method)()))
+    return samples
+
+
+def _cache_samples():
+    from backend import auth_cache, events, graph_client, response_cache, shared_cache
+    from backend.extensions import jwt
+
+    samples = []
+    for cache_name, cache in (("local", response_cache._cache), ("shared", shared_cache._shared)):
+        if cache is None:
+            continue
+        stats = cache._stats.copy()
+        for result in ("hits", "misses"):
+            samples.append(("counter", "response_cache_lookups_total", (("cache", cache_name), ("result", result)),
+                            stats[result]))
+        if cache_name == "local":
+            samples.append(("gauge", "response_cache_entries", (("cache", cache_name),), len(cache._entries)))
+            samples.append(("gauge", "response_cache_bytes", (("cache", cache_name),), cache._bytes))
+    for cache_name, cache in (("token", jwt.token_cache), ("user", auth_cache._user_cache)):
+        if cache is not None:
+            samples.append(("counter", "auth_cache_lookups_total", (("cache", cache_name), ("result", "hits")), cache.hits))
+            samples.append(("counter", "auth_cache_lookups_total", (("cache", cache_name), ("result", "misses")),
+                            cache.misses))
+    client = graph_client._client if graph_client._client_pid == os.getpid() else None
+    if client is not None:
+        stats = client.pool_stats()
+        samples.append(("counter", "meta_graph_pool_requests_total", (), stats["requests"]))
+        samples.append(("counter", "meta_graph_pool_connections_total", (), stats["misses"]))
+        samples.append(("gauge", "meta_graph_pool_idle_connections", (), stats["idle_connections"]))
+    if events._broker is not None:
+        samples.append(("gauge", "events_connections", (), events._broker.connections()))
+    return samples
+
+
+def _host_samples():
+    # Shared by every process on the host, so reported once per scrape
+    from backend import rate_limit, shared_cache
+
+    samples = []
+    if os.getenv("META_RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes"):
+        for key, state in rate_limit.get_governor().state().items():
+            samples.append(("gauge", "meta_rate_limit_blocked_seconds", (("key", key),), state["blocked_for"]))
+    shared = shared_cache.get_shared_cache()
+    stats = shared.stats() if shared is not None else {}
+    if stats.get("entries") is not None:
+        samples.append(("gauge", "response_cache_entries", (("cache", "shared"),), stats["entries"]))
+        samples.append(("gauge", "response_cache_bytes", (("cache", "shared"),), stats["bytes"]))
+    return samples
+
+
+def _reset_after_fork():
+    # The parent's counts are the parent's; the child starts from zero and writes its own snapshot
+    global _local, _shards, _retired, _gauges, _lock, _writer
+    _local = threading.local()
+    _shards = []
+    _retired = _Shard(None)
+    _gauges = {}
+    _lock = threading.Lock()
+    _writer = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
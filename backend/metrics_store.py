@@ -0,0 +1,222 @@
+import calendar
+import fcntl
+import json
+import os
+import threading
+from collections import defaultdict
+from datetime import timedelta
+
+import numpy as np
+
+DEFAULT_ROOT = os.path.join(os.path.abspath(os.path.dirname(__file__)), "instance", "metrics")
+
+# Metric name -> on-disk dtype
+METRICS = {
+    "spend": np.float64,
+    "impressions": np.int64,
+    "clicks": np.int64,
+    "conversions": np.float64,
+}
+LEVELS = ("campaign", "adset", "ad")
+
+
+def _months(since, until):
+    """Yield (year, month, first_day_index, last_day_index) for every month touched by [since, until]."""
+    year, month = since.year, since.month
+    while (year, month) <= (until.year, until.month):
+        days = calendar.monthrange(year, month)[1]
+        first = since.day - 1 if (year, month) == (since.year, since.month) else 0
+        last = until.day - 1 if (year, month) == (until.year, until.month) else days - 1
+        yield year, month, first, last
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+class _Partition:
+    """One level and month: an object list plus one (objects x days) array file per metric."""
+
+    def __init__(self, directory, year, month):
+        self.directory = directory
+        self.days = calendar.monthrange(year, month)[1]
+        self.objects_path = os.path.join(directory, "objects.json")
+        self._objects = []
+        self._index = {}
+        self._mtime = None
+
+    def path(self, metric):
+        return os.path.join(self.directory, f"{metric}.bin")
+
+    def objects(self):
+        """Return (object_ids, index) as of the last write, reloading when another process appended."""
+        try:
+            mtime = os.stat(self.objects_path).st_mtime_ns
+        except FileNotFoundError:
+            return [], {}
+        if mtime != self._mtime:
+            with open(self.objects_path) as f:
+                self._objects = json.load(f)
+            self._index = {object_id: i for i, object_id in enumerate(self._objects)}
+            self._mtime = mtime
+        return self._objects, self._index
+
+    def array(self, metric, rows, mode="r"):
+        if rows == 0:
+            return np.zeros((0, self.days), dtype=METRICS[metric])
+        return np.memmap(self.path(metric), dtype=METRICS[metric], mode=mode, shape=(rows, self.days))
+
+    def append_objects(self, new_ids):
+        """Grow every metric file by len(new_ids) zero rows, then publish the new object list.
+
+        Files are extended before objects.json is replaced, so readers never
+        see an object whose row is not on disk yet. Caller holds the lock.
+        """
+        objects, _ = self.objects()
+        objects = objects + new_ids
+        for metric, dtype in METRICS.items():
+            with open(self.path(metric), "ab") as f:
+                f.truncate(len(objects) * self.days * np.dtype(dtype).itemsize)
+
+        tmp_path = self.objects_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(objects, f)
+        os.replace(tmp_path, self.objects_path)
+        self._mtime = None
+
+
+class MetricsStore:
+    """Column-oriented, memory-mapped storage for per-object daily metrics.
+
+    Data is partitioned by level (campaign, adset, ad) and month. Each
+    partition holds the list of Meta object IDs it has seen and, per metric,
+    a packed typed array of shape (objects, days in month) memory-mapped
+    from disk. Range queries slice those arrays directly and never build a
+    Python object per row.
+    """
+
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root
+        self._partitions = {}
+        self._lock = threading.Lock()
+
+    def _partition(self, level, year, month, create=False):
+        if level not in LEVELS:
+            raise ValueError(f"level must be one of {', '.join(LEVELS)}")
+        key = (level, year, month)
+        partition = self._partitions.get(key)
+        if partition is None:
+            directory = os.path.join(self.root, level, f"{year:04d}-{month:02d}")
+            if not create and not os.path.isdir(directory):
+                return None
+            os.makedirs(directory, exist_ok=True)
+            with self._lock:
+                partition = self._partitions.setdefault(key, _Partition(directory, year, month))
+        return partition
+
+    def write(self, level, rows):
+        """Store daily metrics.
+
+        `rows` is an iterable of (object_id, day, {metric: value}) tuples;
+        metrics missing from a row are left untouched. Returns the number of
+        rows written.
+        """
+        by_month = defaultdict(list)
+        for object_id, day, values in rows:
+            by_month[(day.year, day.month)].append((str(object_id), day.day - 1, values))
+
+        written = 0
+        for (year, month), month_rows in by_month.items():
+            partition = self._partition(level, year, month, create=True)
+            with open(os.path.join(partition.directory, ".lock"), "w") as lock_file:
+                # Serialise writers across threads and worker processes
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+                _, index = partition.objects()
+                new_ids = list(dict.fromkeys(oid for oid, _, _ in month_rows if oid not in index))
+                if new_ids:
+                    partition.append_objects(new_ids)
+                objects, index = partition.objects()
+
+                row_idx = np.fromiter((index[oid] for oid, _, _ in month_rows), dtype=np.int64, count=len(month_rows))
+                day_idx = np.fromiter((d for _, d, _ in month_rows), dtype=np.int64, count=len(month_rows))
+                for metric, dtype in METRICS.items():
+                    mask = np.fromiter((metric in v for _, _, v in month_rows), dtype=bool, count=len(month_rows))
+                    if not mask.any():
+                        continue
+                    values = np.fromiter(
+                        (v[metric] for _, _, v in month_rows if metric in v), dtype=dtype, count=int(mask.sum())
+                    )
+                    array = partition.array(metric, len(objects), mode="r+")
+                    array[row_idx[mask], day_idx[mask]] = values
+                    array.flush()
+                    del array
+            written += len(month_rows)
+        return written
+
+    def query(self, level, metric, since, until, object_ids=None):
+        """Return (object_ids, matrix) for `metric` over [since, until].
+
+        `matrix` has one row per object and one column per day. Without
+        `object_ids` every object stored in the range is returned; unknown
+        objects and days without data are zero.
+        """
+        if metric not in METRICS:
+            raise ValueError(f"metric must be one of {', '.join(METRICS)}")
+        n_days = (until - since).days + 1
+        months = list(_months(since, until))
+
+        if object_ids is None:
+            seen = {}
+            for year, month, _, _ in months:
+                partition = self._partition(level, year, month)
+                if partition is not None:
+                    seen.update(dict.fromkeys(partition.objects()[0]))
+            object_ids = list(seen)
+        else:
+            object_ids = [str(object_id) for object_id in object_ids]
+
+        position = {object_id: i for i, object_id in enumerate(object_ids)}
+        result = np.zeros((len(object_ids), max(n_days, 0)), dtype=METRICS[metric])
+
+        column = 0
+        for year, month, first, last in months:
+            width = last - first + 1
+            partition = self._partition(level, year, month)
+            if partition is not None:
+                objects, _ = partition.objects()
+                # Map partition rows to output rows, skipping objects the caller did not ask for
+                target = np.fromiter((position.get(oid, -1) for oid in objects), dtype=np.int64, count=len(objects))
+                keep = target >= 0
+                if keep.any():
+                    array = partition.array(metric, len(objects))
+                    result[target[keep], column:column + width] = array[keep, first:last + 1]
+                    del array
+            column += width
+
+        return object_ids, result
+
+    def totals(self, level, metrics, since, until, object_ids=None):
+        """Return (object_ids, {metric: vector}) with each metric summed over the range."""
+        totals = {}
+        for metric in metrics:
+            object_ids, matrix = self.query(level, metric, since, until, object_ids=object_ids)
+            totals[metric] = matrix.sum(axis=1)
+        return object_ids, totals
+
+    @staticmethod
+    def dates(since, until):
+        """Return the day for each column of a `query` result."""
+        return [since + timedelta(days=i) for i in range((until - since).days + 1)]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_metrics_store():
+    """Return the process-wide MetricsStore rooted at METRICS_STORE_DIR."""
+    global _store
+
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = MetricsStore(os.getenv("METRICS_STORE_DIR", DEFAULT_ROOT))
+    return _store
@@ -1,7 +1,9 @@
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
+from backend.password_hashing import hash_method
 from backend.extensions import db, login_manager  # Import from extensions.py
 import uuid  # For generating unique meta_campaign_id
+from datetime import datetime
 
 # ==========================
 # User Model
@@ -11,7 +13,7 @@ class User(UserMixin, db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    _password = db.Column(db.String(128), nullable=False)
+    _password = db.Column(db.String(256), nullable=False)  # Fits pbkdf2:sha512, see check_hash_method
 
     # Define relationships to fix missing properties
     campaigns = db.relationship('Campaign', back_populates='user', lazy=True)
@@ -25,7 +27,7 @@ class User(UserMixin, db.Model):
 
     @password.setter
     def password(self, password):
-        self._password = generate_password_hash(password)
+        self._password = generate_password_hash(password, method=hash_method())
 
     def check_password(self, password):
         return check_password_hash(self._password, password)
@@ -53,11 +55,17 @@ class Campaign(db.Model):
     special_ad_categories = db.Column(db.String(50), nullable=True, default="NONE")
     meta_campaign_id = db.Column(db.String(50), nullable=False, unique=True)
 
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # Corrected relationship (match with `User`)
     user = db.relationship('User', back_populates='campaigns', lazy=True)
 
+    __table_args__ = (
+        # Dashboard `since` reads: what changed for a user after a point in time
+        db.Index('ix_campaigns_user_id_updated_at', 'user_id', 'updated_at'),
+    )
+
     def __init__(self, name, objective, status, user_id, special_ad_categories=None, meta_campaign_id=None):
         self.name = name
         self.objective = objective
@@ -98,16 +106,23 @@ class AdGroup(db.Model):
     roas_average_floor = db.Column(db.Float, nullable=True)  # New field
     optimization_goal = db.Column(db.String(50), nullable=True)  # New field
     campaign_id = db.Column(db.Integer, db.ForeignKey('campaigns.id', ondelete="CASCADE"), nullable=False)
-    meta_ad_group_id = db.Column(db.String(255), nullable=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    meta_ad_group_id = db.Column(db.String(255), nullable=True, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
 
     # Add the targeting field to the model
     targeting = db.Column(db.JSON, nullable=True)  # This will store targeting data
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # Relationships
     campaign = db.relationship('Campaign', backref=db.backref('ad_groups', cascade="all, delete-orphan", lazy=True))
     user = db.relationship('User', back_populates='ad_groups', lazy=True)
 
+    __table_args__ = (
+        # Children of a campaign, and their Meta IDs for cascade deletes, without touching the table
+        db.Index('ix_ad_groups_campaign_id_meta_ad_group_id', 'campaign_id', 'meta_ad_group_id'),
+        db.Index('ix_ad_groups_user_id_updated_at', 'user_id', 'updated_at'),
+    )
+
     def __repr__(self):
         return f'<AdGroup {self.name}>'
 
@@ -140,14 +155,20 @@ class Ad(db.Model):
     name = db.Column(db.String(100), nullable=False)
     status = db.Column(db.String(50), nullable=False)
     ad_group_id = db.Column(db.Integer, db.ForeignKey('ad_groups.id'), nullable=False)
-    meta_ad_id = db.Column(db.String(255), nullable=True)
+    meta_ad_id = db.Column(db.String(255), nullable=True, index=True)
     meta_creative_id = db.Column(db.String(255), nullable=True)  # New field for Meta Creative ID
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # Relationships
     ad_group = db.relationship('AdGroup', backref=db.backref('ads', lazy=True))
     user = db.relationship('User', back_populates='ads', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_ads_ad_group_id_meta_ad_id', 'ad_group_id', 'meta_ad_id'),
+        db.Index('ix_ads_user_id_updated_at', 'user_id', 'updated_at'),
+    )
+
     def to_dict(self):
         return {
             'id': self.id,
@@ -174,12 +195,17 @@ class AdCreative(db.Model):
     message = db.Column(db.String(255), nullable=False)
     image = db.Column(db.String(255), nullable=False)
     cta_type = db.Column(db.String(50), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     caption = db.Column(db.String(255), nullable=True)  # Add the caption field
+    updated_at = db.Column(db.DateTime, nullable=True, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # Relationship
     user = db.relationship('User', back_populates='ad_creatives', lazy=True)
 
+    __table_args__ = (
+        db.Index('ix_ad_creatives_user_id_updated_at', 'user_id', 'updated_at'),
+    )
+
     def __repr__(self):
         return f"<AdCreative {self.name}>"
 
@@ -196,3 +222,278 @@ class AdCreative(db.Model):
             'user_id': self.user_id,
             'caption': self.caption,  # Include the caption field in the dictionary
         }
+
+    def to_summary_dict(self):
+        # The fields the creative list and dashboard return
+        return {
+            'id': self.id,
+            'creative_id': self.creative_id,
+            'name': self.name,
+            'page_id': self.page_id,
+            'link': self.link,
+            'message': self.message,
+            'image': self.image,
+            'cta_type': self.cta_type
+        }
+
+
+# ==========================
+# Job Model
+# ==========================
+class Job(db.Model):
+    __tablename__ = 'jobs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)  # Name of the registered job handler
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, succeeded, failed, dead
+    payload = db.Column(db.JSON, nullable=True)
+    result = db.Column(db.JSON, nullable=True)
+    result_status_code = db.Column(db.Integer, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Not picked up before this time
+    locked_by = db.Column(db.String(100), nullable=True)  # Worker currently running the job
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+
+    __table_args__ = (
+        db.Index('ix_jobs_status_run_after', 'status', 'run_after'),
+    )
+
+    def __repr__(self):
+        return f'<Job {self.id} {self.kind} {self.status}>'
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "result": self.result,
+            "result_status_code": self.result_status_code,
+            "error": self.error,
+            "attempts": self.attempts,
+            "max_attempts": self.max_attempts,
+            "run_after": self.run_after.isoformat() if self.run_after else None,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "user_id": self.user_id,
+        }
+
+
+# ==========================
+# SyncState Model
+# ==========================
+class SyncState(db.Model):
+    __tablename__ = 'sync_state'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    ad_account_id = db.Column(db.String(50), nullable=False)
+    object_type = db.Column(db.String(20), nullable=False)  # campaigns, adsets or ads
+    high_water_mark = db.Column(db.Integer, nullable=True)  # Largest Meta updated_time seen (unix seconds)
+    last_synced_at = db.Column(db.DateTime, nullable=True)
+    last_stats = db.Column(db.JSON, nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'ad_account_id', 'object_type', name='uq_sync_state_account_object'),
+    )
+
+    def __repr__(self):
+        return f'<SyncState {self.ad_account_id} {self.object_type}>'
+
+    def to_dict(self):
+        return {
+            "ad_account_id": self.ad_account_id,
+            "object_type": self.object_type,
+            "high_water_mark": self.high_water_mark,
+            "last_synced_at": self.last_synced_at.isoformat() if self.last_synced_at else None,
+            "last_stats": self.last_stats,
+        }
+
+
+# ==========================
+# InsightsReportRun Model
+# ==========================
+class InsightsReportRun(db.Model):
+    __tablename__ = 'insights_report_runs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    ad_account_id = db.Column(db.String(50), nullable=False)
+    level = db.Column(db.String(20), nullable=False)  # account, campaign, adset or ad
+    since = db.Column(db.Date, nullable=False)
+    until = db.Column(db.Date, nullable=False)
+    report_run_id = db.Column(db.String(50), nullable=True)  # Meta's async report run ID
+    status = db.Column(db.String(30), nullable=False, default='submitted')
+    percent_complete = db.Column(db.Integer, nullable=False, default=0)
+    rows_written = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<InsightsReportRun {self.report_run_id} {self.status}>'
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "ad_account_id": self.ad_account_id,
+            "level": self.level,
+            "since": self.since.isoformat(),
+            "until": self.until.isoformat(),
+            "report_run_id": self.report_run_id,
+            "status": self.status,
+            "percent_complete": self.percent_complete,
+            "rows_written": self.rows_written,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+# ==========================
+# DailyInsight Model
+# ==========================
+class DailyInsight(db.Model):
+    __tablename__ = 'insights_daily'
+
+    id = db.Column(db.Integer, primary_key=True)
+    level = db.Column(db.String(20), nullable=False)
+    object_id = db.Column(db.String(50), nullable=False)  # Meta ID of the object at `level`
+    date = db.Column(db.Date, nullable=False)
+    ad_account_id = db.Column(db.String(50), nullable=True)
+    meta_campaign_id = db.Column(db.String(50), nullable=True)
+    meta_ad_group_id = db.Column(db.String(255), nullable=True)
+    meta_ad_id = db.Column(db.String(255), nullable=True)
+    spend = db.Column(db.Float, nullable=False, default=0)
+    impressions = db.Column(db.BigInteger, nullable=False, default=0)
+    clicks = db.Column(db.BigInteger, nullable=False, default=0)
+    conversions = db.Column(db.Float, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('level', 'object_id', 'date', name='uq_insights_daily_object_date'),
+    )
+
+    def to_dict(self):
+        return {
+            "level": self.level,
+            "object_id": self.object_id,
+            "date": self.date.isoformat(),
+            "meta_campaign_id": self.meta_campaign_id,
+            "meta_ad_group_id": self.meta_ad_group_id,
+            "meta_ad_id": self.meta_ad_id,
+            "spend": self.spend,
+            "impressions": self.impressions,
+            "clicks": self.clicks,
+            "conversions": self.conversions,
+        }
+
+
+# ==========================
+# InsightsCoverage Model
+# ==========================
+class InsightsCoverage(db.Model):
+    """Which days of an account's insights at a level are already stored, and whether they can still change.
+
+    A report run returns every object of the level for each day it covers,
+    so one row stands for all (object, day) cells of that account and day.
+    """
+    __tablename__ = 'insights_coverage'
+
+    id = db.Column(db.Integer, primary_key=True)
+    ad_account_id = db.Column(db.String(50), nullable=False)
+    level = db.Column(db.String(20), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    final = db.Column(db.Boolean, nullable=False, default=False)  # Older than the attribution window; never refetched
+    fetched_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('ad_account_id', 'level', 'date', name='uq_insights_coverage_account_level_date'),
+    )
+
+    def to_dict(self):
+        return {
+            "ad_account_id": self.ad_account_id,
+            "level": self.level,
+            "date": self.date.isoformat(),
+            "final": self.final,
+            "fetched_at": self.fetched_at.isoformat() if self.fetched_at else None,
+        }
+
+
+# ==========================
+# PendingRefresh Model
+# ==========================
+class PendingRefresh(db.Model):
+    """A Meta object reported changed by a webhook and not re-read yet; one row per object however often it changed."""
+    __tablename__ = 'pending_refreshes'
+
+    id = db.Column(db.Integer, primary_key=True)
+    meta_object_id = db.Column(db.String(50), nullable=False, unique=True)
+    level = db.Column(db.String(20), nullable=False)  # campaign, adset or ad
+    ad_account_id = db.Column(db.String(50), nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    received_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)  # Latest notification
+
+    def __repr__(self):
+        return f'<PendingRefresh {self.level} {self.meta_object_id}>'
+
+
+# ==========================
+# UserDataVersion Model
+# ==========================
+class UserDataVersion(db.Model):
+    """A counter bumped whenever one of the user's campaigns, ad sets, ads or creatives changes (see versions.py)."""
+    __tablename__ = 'user_data_versions'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True, autoincrement=False)
+    version = db.Column(db.BigInteger, nullable=False, default=0)
+
+
+# ==========================
+# ChangeLogEntry Model
+# ==========================
+class ChangeLogEntry(db.Model):
+    """One create, update or delete of a campaign, ad set, ad or creative, written in the same transaction.
+
+    The ID is the cursor of /api/changes.
+    """
+    __tablename__ = 'change_log'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    entity = db.Column(db.String(20), nullable=False)  # campaigns, ad_groups, ads or ad_creatives
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(10), nullable=False)  # create, update or delete
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Reading a user's feed from a cursor
+        db.Index('ix_change_log_user_id_id', 'user_id', 'id'),
+        # Compaction keeps the newest entry per entity
+        db.Index('ix_change_log_user_id_entity_entity_id', 'user_id', 'entity', 'entity_id'),
+        # Never reuse the IDs of compacted entries, or old cursors would skip new changes
+        {'sqlite_autoincrement': True},
+    )
+
+    def __repr__(self):
+        return f'<ChangeLogEntry {self.op} {self.entity} {self.entity_id}>'
+
+
+# ==========================
+# ChangeLogCompaction Model
+# ==========================
+class ChangeLogCompaction(db.Model):
+    """A run of `flask compact-change-log`; cursors at or below `expired_through` can no longer be served."""
+    __tablename__ = 'change_log_compactions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    expired_through = db.Column(db.Integer, nullable=False, default=0)  # Highest change log ID removed by age
+    superseded = db.Column(db.Integer, nullable=False, default=0)  # Entries dropped for a newer one of the same entity
+    expired = db.Column(db.Integer, nullable=False, default=0)  # Entries dropped for being older than the retention
+    ran_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
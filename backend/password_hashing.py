@@ -0,0 +1,172 @@
+import hashlib
+import multiprocessing
+import os
+import threading
+import logging
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+DEFAULT_METHOD = f"pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}"
+DEFAULT_WORKERS = 2
+DEFAULT_QUEUE_DEPTH = 8   # Hashes waiting for a free worker before callers are turned away
+DEFAULT_TIMEOUT = 10.0    # Seconds a caller waits for its hash
+RETRY_AFTER = 1           # Seconds clients are told to wait when the pool is full
+SALT_LENGTH = 16          # generate_password_hash's default
+
+logger = logging.getLogger(__name__)
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool already has as many hashes queued as it accepts."""
+
+
+def hash_method():
+    """The werkzeug hash method new password hashes use (PASSWORD_HASH_METHOD), with its cost spelled out."""
+    method = os.getenv("PASSWORD_HASH_METHOD", DEFAULT_METHOD)
+    if method.startswith("pbkdf2") and method.count(":") == 1:
+        # Spell out werkzeug's default iterations, so stored hashes compare equal in needs_rehash
+        method = f"{method}:{DEFAULT_PBKDF2_ITERATIONS}"
+    return method
+
+
+def hash_length(method=None):
+    """Length of the hashes `method` produces: werkzeug's "method$salt$hexdigest"."""
+    method = method or hash_method()
+    digest = method.split(":")[1] if method.startswith("pbkdf2:") else method
+    return len(method) + 1 + SALT_LENGTH + 1 + 2 * hashlib.new(digest).digest_size
+
+
+def check_hash_method(max_length):
+    """Raise ValueError unless PASSWORD_HASH_METHOD is usable and its hashes fit in `max_length` characters."""
+    method = hash_method()
+    try:
+        length = hash_length(method)
+    except (IndexError, ValueError) as e:
+        raise ValueError(f"PASSWORD_HASH_METHOD={method} is not a supported hash method: {e}") from None
+    if length > max_length:
+        raise ValueError(
+            f"PASSWORD_HASH_METHOD={method} makes {length} character hashes; the password column holds {max_length}"
+        )
+
+
+def needs_rehash(pwhash, method=None):
+    """True when `pwhash` was made with other parameters than the configured method."""
+    return pwhash.split("$", 1)[0] != (method or hash_method())
+
+
+class PasswordHasher:
+    """Runs password hashing and verification in a pool of worker processes.
+
+    PBKDF2 is pure CPU for hundreds of milliseconds, so inline it holds the
+    GIL and stalls every other request of the process. At most `workers`
+    hashes run at once and `queue_depth` more may wait; beyond that callers
+    get HashingBusy right away instead of piling up. With `workers` 0 the
+    hashing runs inline, as before.
+    """
+
+    def __init__(self, workers=DEFAULT_WORKERS, queue_depth=DEFAULT_QUEUE_DEPTH, timeout=DEFAULT_TIMEOUT):
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_depth) if workers else None
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    # spawn: the workers must not inherit this process's threads and locks
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                    )
+        return self._executor
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+        executor = self._pool()
+        try:
+            return self._submit(executor, fn, *args)
+        except BrokenProcessPool:
+            # A worker died (OOM kill, segfault) and took the pool with it; start a new one and try once more
+            logger.warning("Password hashing pool broke; restarting it")
+            self._discard(executor)
+        executor = self._pool()
+        try:
+            return self._submit(executor, fn, *args)
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise HashingBusy("The password hashing pool broke twice in a row") from None
+
+    def _submit(self, executor, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy(f"{self.workers + self.queue_depth} password hashes are already pending")
+        try:
+            future = executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is held until the hash is done, even if the caller gives up waiting
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            raise HashingBusy(f"No password hash finished within {self.timeout}s") from None
+
+    def _discard(self, executor):
+        # Only the failed pool: another thread may already have started its replacement
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def hash(self, password, method=None):
+        return self._run(generate_password_hash, password, method or hash_method())
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+_hasher = None
+_hasher_lock = threading.Lock()
+
+
+def get_password_hasher():
+    """Return the process-wide PasswordHasher, creating it on first use."""
+    global _hasher
+
+    if _hasher is None:
+        with _hasher_lock:
+            if _hasher is None:
+                _hasher = PasswordHasher(
+                    workers=int(os.getenv("PASSWORD_HASH_WORKERS", DEFAULT_WORKERS)),
+                    queue_depth=int(os.getenv("PASSWORD_HASH_QUEUE_DEPTH", DEFAULT_QUEUE_DEPTH)),
+                    timeout=float(os.getenv("PASSWORD_HASH_TIMEOUT", DEFAULT_TIMEOUT)),
+                )
+    return _hasher
+
+
+def shutdown_password_hasher():
+    """Stop this process's hashing workers, if it started any."""
+    if _hasher is not None:
+        _hasher.shutdown()
+
+
+def _reset_after_fork():
+    # The pool's processes and management thread belong to the parent; the child starts its own on first use
+    global _hasher, _hasher_lock
+    _hasher = None
+    _hasher_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,121 @@
+from datetime import datetime
+
+from sqlalchemy import create_engine, delete, insert, select, text
+
+from backend.extensions import db
+from backend.change_log import superseded_entries
+from backend.models import User, Campaign, AdGroup, Ad, AdCreative, ChangeLogEntry
+
+# Synthetic account shape for the plan check: per user, and children per parent
+DEFAULT_USERS = 20
+CAMPAIGNS_PER_USER = 50
+AD_GROUPS_PER_CAMPAIGN = 10
+ADS_PER_AD_GROUP = 5
+CREATIVES_PER_USER = 100
+
+USER_ID = 1
+CAMPAIGN_ID = 1
+AD_GROUP_ID = 1
+META_IDS = ["m-1", "m-2", "m-3"]
+
+
+def hot_queries():
+    """The queries behind the list endpoints, cascade deletes and sync upserts, as (name, statement)."""
+    return [
+        ("get_campaigns", select(Campaign).where(Campaign.user_id == USER_ID)),
+        ("get_ad_groups / get_ad_sets", select(AdGroup).where(AdGroup.user_id == USER_ID)),
+        ("get_ads", select(Ad).where(Ad.user_id == USER_ID)),
+        ("get_ads: keyset page",
+         select(Ad).where(Ad.user_id == USER_ID, Ad.id > 1000).order_by(Ad.id).limit(101)),
+        ("get_dashboard: ads changed since",
+         select(Ad).where(Ad.user_id == USER_ID, Ad.updated_at > datetime(2025, 1, 1)).order_by(Ad.id)),
+        ("get_ad_creatives", select(AdCreative).where(AdCreative.user_id == USER_ID)),
+        ("get_changes: log after cursor",
+         select(ChangeLogEntry).where(ChangeLogEntry.user_id == USER_ID, ChangeLogEntry.id > 1000)
+         .order_by(ChangeLogEntry.id).limit(1001)),
+        ("compact_change_log: superseded entries",
+         select(ChangeLogEntry.id).where(ChangeLogEntry.id > 1000, superseded_entries())
+         .order_by(ChangeLogEntry.id).limit(5000)),
+        ("delete_campaign: child ad Meta IDs",
+         select(Ad.meta_ad_id).join(AdGroup, Ad.ad_group_id == AdGroup.id)
+         .where(AdGroup.campaign_id == CAMPAIGN_ID, Ad.meta_ad_id.isnot(None))),
+        ("delete_campaign: child ad set Meta IDs",
+         select(AdGroup.meta_ad_group_id)
+         .where(AdGroup.campaign_id == CAMPAIGN_ID, AdGroup.meta_ad_group_id.isnot(None))),
+        ("delete_campaign: delete ads",
+         delete(Ad).where(Ad.ad_group_id.in_(select(AdGroup.id).where(AdGroup.campaign_id == CAMPAIGN_ID)))),
+        ("delete_campaign: delete ad sets", delete(AdGroup).where(AdGroup.campaign_id == CAMPAIGN_ID)),
+        ("delete_ad_group: ads", select(Ad).where(Ad.ad_group_id == AD_GROUP_ID)),
+        ("delete_ad_group: delete ads", delete(Ad).where(Ad.ad_group_id == AD_GROUP_ID)),
+        ("sync: campaigns by Meta ID",
+         select(Campaign).where(Campaign.user_id == USER_ID, Campaign.meta_campaign_id.in_(META_IDS))),
+        ("sync: ad sets by Meta ID",
+         select(AdGroup).where(AdGroup.user_id == USER_ID, AdGroup.meta_ad_group_id.in_(META_IDS))),
+        ("sync: ads by Meta ID",
+         select(Ad).where(Ad.user_id == USER_ID, Ad.meta_ad_id.in_(META_IDS))),
+    ]
+
+
+def build_synthetic_database(users=DEFAULT_USERS):
+    """Create every table in a fresh in-memory SQLite database and fill it with a synthetic account tree."""
+    engine = create_engine("sqlite://")
+    db.metadata.create_all(engine)
+
+    campaigns_total = users * CAMPAIGNS_PER_USER
+    ad_groups_total = campaigns_total * AD_GROUPS_PER_CAMPAIGN
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {"id": u, "email": f"user{u}@example.com", "_password": "x"} for u in range(1, users + 1)
+        ])
+        conn.execute(insert(Campaign), [
+            {"id": c, "name": f"Campaign {c}", "objective": "OUTCOME_SALES", "status": "PAUSED",
+             "special_ad_categories": "NONE", "meta_campaign_id": f"c-{c}",
+             "user_id": (c - 1) // CAMPAIGNS_PER_USER + 1}
+            for c in range(1, campaigns_total + 1)
+        ])
+        conn.execute(insert(AdGroup), [
+            {"id": g, "name": f"Ad set {g}", "status": "PAUSED", "daily_budget": 10.0,
+             "campaign_id": (g - 1) // AD_GROUPS_PER_CAMPAIGN + 1, "meta_ad_group_id": f"g-{g}",
+             "user_id": (g - 1) // (AD_GROUPS_PER_CAMPAIGN * CAMPAIGNS_PER_USER) + 1}
+            for g in range(1, ad_groups_total + 1)
+        ])
+        conn.execute(insert(Ad), [
+            {"id": a, "name": f"Ad {a}", "status": "PAUSED", "ad_group_id": (a - 1) // ADS_PER_AD_GROUP + 1,
+             "meta_ad_id": f"a-{a}",
+             "user_id": (a - 1) // (ADS_PER_AD_GROUP * AD_GROUPS_PER_CAMPAIGN * CAMPAIGNS_PER_USER) + 1}
+            for a in range(1, ad_groups_total * ADS_PER_AD_GROUP + 1)
+        ])
+        conn.execute(insert(AdCreative), [
+            {"id": c, "creative_id": f"cr-{c}", "name": f"Creative {c}", "page_id": "p", "link": "https://example.com",
+             "message": "m", "image": "i", "cta_type": "LEARN_MORE", "user_id": (c - 1) // CREATIVES_PER_USER + 1}
+            for c in range(1, users * CREATIVES_PER_USER + 1)
+        ])
+        # Give the planner real statistics, as a long-running database would have
+        conn.execute(text("ANALYZE"))
+    return engine
+
+
+def is_full_scan(detail):
+    # "SCAN ads" (or "SCAN TABLE ads" on older SQLite) without an index is a full table scan
+    return detail.startswith("SCAN ") and "INDEX" not in detail and "INTEGER PRIMARY KEY" not in detail
+
+
+def explain(conn, statement):
+    """The detail lines of SQLite's EXPLAIN QUERY PLAN for `statement`."""
+    sql = str(statement.compile(conn.engine, compile_kwargs={"literal_binds": True}))
+    return [row[-1] for row in conn.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+
+
+def check_query_plans(users=DEFAULT_USERS):
+    """Run EXPLAIN QUERY PLAN for every hot query.
+
+    Returns a list of (name, plan_details, full_scan) tuples.
+    """
+    engine = build_synthetic_database(users)
+    results = []
+    with engine.connect() as conn:
+        for name, statement in hot_queries():
+            details = explain(conn, statement)
+            results.append((name, details, any(is_full_scan(detail) for detail in details)))
+    engine.dispose()
+    return results
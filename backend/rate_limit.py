@@ -0,0 +1,283 @@
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from dotenv import load_dotenv
+from flask import g, has_app_context
+
+# Load environment variables from .env file
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB_PATH = os.path.join(os.path.abspath(os.path.dirname(__file__)), "instance", "rate_limit.db")
+
+# Token bucket defaults, per ad account (or business) key
+DEFAULT_BUCKET_CAPACITY = 20      # Burst size
+DEFAULT_REFILL_RATE = 5.0         # Calls per second while Meta reports low usage
+DEFAULT_SLOWDOWN_PCT = 75.0       # Start slowing down once usage passes this percentage
+DEFAULT_MAX_WAIT = 2.0            # Longest we are willing to block a caller, in seconds
+MIN_RATE_FACTOR = 0.05            # Never slow down to less than 5% of the refill rate
+
+APP_KEY = "app"
+ACCOUNT_RE = re.compile(r"/act_(\d+)")
+
+
+class RateLimited(Exception):
+    """Raised when a Graph call would have to wait longer than allowed for its rate limit."""
+
+    def __init__(self, key, retry_after):
+        self.key = key
+        self.retry_after = max(1, int(math.ceil(retry_after)))
+        super().__init__(f"Meta API rate limit reached for {key}, retry after {self.retry_after} seconds")
+
+
+def rate_limit_key(url):
+    """Return the bucket key for a Graph URL: its ad account, or the configured one."""
+    match = ACCOUNT_RE.search(url or "")
+    account_id = match.group(1) if match else os.getenv("AD_ACCOUNT_ID")
+    return f"act_{account_id}" if account_id else APP_KEY
+
+
+def _parse_json_header(value):
+    if not value:
+        return None
+    try:
+        return json.loads(value)
+    except (TypeError, ValueError):
+        logger.warning(f"Could not parse rate limit header: {value!r}")
+        return None
+
+
+def parse_usage_headers(headers):
+    """Extract usage percentages and regain-access hints from Meta's usage headers.
+
+    Returns a dict with `account_pct`, `app_pct` (0-100, or None when the
+    header is missing) and `block_seconds` (how long Meta told us to back
+    off, 0 if it did not).
+    """
+    account_pct = None
+    app_pct = None
+    block_seconds = 0
+
+    app_usage = _parse_json_header(headers.get("X-App-Usage"))
+    if isinstance(app_usage, dict):
+        app_pct = max(float(app_usage.get(k) or 0) for k in ("call_count", "total_cputime", "total_time"))
+
+    account_usage = _parse_json_header(headers.get("X-Ad-Account-Usage"))
+    if isinstance(account_usage, dict):
+        account_pct = float(account_usage.get("acc_id_util_pct") or 0)
+        if account_pct >= 100:
+            block_seconds = max(block_seconds, float(account_usage.get("reset_time_duration") or 0))
+
+    business_usage = _parse_json_header(headers.get("X-Business-Use-Case-Usage"))
+    if isinstance(business_usage, dict):
+        for limits in business_usage.values():
+            for limit in limits or []:
+                pct = max(float(limit.get(k) or 0) for k in ("call_count", "total_cputime", "total_time"))
+                account_pct = pct if account_pct is None else max(account_pct, pct)
+                # Meta reports the time to regain access in minutes
+                block_seconds = max(block_seconds, float(limit.get("estimated_time_to_regain_access") or 0) * 60)
+
+    return {"account_pct": account_pct, "app_pct": app_pct, "block_seconds": block_seconds}
+
+
+def _rollback(conn):
+    try:
+        conn.execute("ROLLBACK")
+    except sqlite3.Error:
+        pass  # The failed statement may already have ended the transaction
+
+
+class RateLimitGovernor:
+    """Token bucket rate limiter shared by every worker process on the host.
+
+    Bucket state lives in a small SQLite database so all processes draw from
+    the same budget. The refill rate shrinks as Meta's reported usage climbs
+    past `slowdown_pct`, and keys Meta has throttled are blocked until their
+    regain-access time. Callers never wait longer than `max_wait`; past that
+    `acquire` raises `RateLimited` with a retry-after hint instead.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH, capacity=DEFAULT_BUCKET_CAPACITY, refill_rate=DEFAULT_REFILL_RATE,
+                 slowdown_pct=DEFAULT_SLOWDOWN_PCT, max_wait=DEFAULT_MAX_WAIT):
+        self.path = path
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.slowdown_pct = slowdown_pct
+        self.max_wait = max_wait
+        self._local = threading.local()
+
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit_state ("
+                " key TEXT PRIMARY KEY,"
+                " tokens REAL NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " blocked_until REAL NOT NULL DEFAULT 0,"
+                " usage_pct REAL NOT NULL DEFAULT 0)"
+            )
+
+    def _connect(self):
+        # One connection per thread and per process (connections must not cross a fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _rate(self, usage_pct):
+        if usage_pct <= self.slowdown_pct:
+            return self.refill_rate
+        headroom = max(0.0, 100.0 - usage_pct) / (100.0 - self.slowdown_pct)
+        return self.refill_rate * max(MIN_RATE_FACTOR, headroom)
+
+    def _load(self, conn, key, now):
+        row = conn.execute(
+            "SELECT tokens, updated_at, blocked_until, usage_pct FROM rate_limit_state WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return float(self.capacity), 0.0, 0.0
+        tokens, updated_at, blocked_until, usage_pct = row
+        tokens = min(self.capacity, tokens + max(0.0, now - updated_at) * self._rate(usage_pct))
+        return tokens, blocked_until, usage_pct
+
+    def _store(self, conn, key, tokens, now, blocked_until, usage_pct):
+        conn.execute(
+            "INSERT INTO rate_limit_state (key, tokens, updated_at, blocked_until, usage_pct) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at, "
+            "blocked_until = excluded.blocked_until, usage_pct = excluded.usage_pct",
+            (key, tokens, now, blocked_until, usage_pct),
+        )
+
+    def acquire(self, key, max_wait=None):
+        """Take one call from `key`'s budget, sleeping at most `max_wait` seconds.
+
+        Returns the number of seconds waited. Raises `RateLimited` without
+        consuming anything when the wait would be longer, or when the shared
+        bucket state cannot be read (e.g. the database stays locked).
+        """
+        max_wait = self.max_wait if max_wait is None else max_wait
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                tokens, blocked_until, usage_pct = self._load(conn, key, now)
+                app_blocked = conn.execute(
+                    "SELECT blocked_until FROM rate_limit_state WHERE key = ?", (APP_KEY,)
+                ).fetchone()
+
+                wait = max(0.0, blocked_until - now, (app_blocked[0] - now) if app_blocked else 0.0)
+                if tokens < 1:
+                    wait = max(wait, (1 - tokens) / self._rate(usage_pct))
+                if wait > max_wait:
+                    conn.execute("ROLLBACK")
+                    raise RateLimited(key, wait)
+
+                # Reserve the token now so concurrent callers queue up behind us
+                self._store(conn, key, tokens - 1, now, blocked_until, usage_pct)
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                _rollback(conn)
+                raise
+        except sqlite3.Error as e:
+            # e.g. "database is locked" under heavy contention: without the budget, don't call Meta blind
+            logger.warning(f"Rate limit state for {key} is unavailable ({e}); asking the caller to retry")
+            raise RateLimited(key, 1) from e
+
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def record_response(self, key, headers):
+        """Update `key` (and the app-wide budget) from a Graph response's usage headers."""
+        usage = parse_usage_headers(headers)
+        if usage["account_pct"] is None and usage["app_pct"] is None:
+            return usage
+
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for bucket_key, pct in ((key, usage["account_pct"]), (APP_KEY, usage["app_pct"])):
+                    if pct is None:
+                        continue
+                    tokens, blocked_until, _ = self._load(conn, bucket_key, now)
+                    if bucket_key == key and usage["block_seconds"]:
+                        blocked_until = max(blocked_until, now + usage["block_seconds"])
+                    self._store(conn, bucket_key, tokens, now, blocked_until, pct)
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                _rollback(conn)
+                raise
+        except sqlite3.Error as e:
+            # The call itself succeeded; losing one usage update only delays the slowdown
+            logger.warning(f"Could not record Meta usage for {key}: {e}")
+
+        if (usage["account_pct"] or 0) > self.slowdown_pct or (usage["app_pct"] or 0) > self.slowdown_pct:
+            logger.info(f"Meta usage for {key} is high ({usage}); slowing down Graph calls")
+        return usage
+
+    def block(self, key, seconds):
+        """Stop all calls for `key` for `seconds`, e.g. after Meta returned a throttling error."""
+        now = time.time()
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                tokens, blocked_until, usage_pct = self._load(conn, key, now)
+                self._store(conn, key, tokens, now, max(blocked_until, now + seconds), usage_pct)
+                conn.execute("COMMIT")
+            except sqlite3.Error:
+                _rollback(conn)
+                raise
+        except sqlite3.Error as e:
+            logger.warning(f"Could not block {key} for {seconds} seconds: {e}")
+
+    def state(self):
+        """Return the current usage percentage and blocked time of every key."""
+        now = time.time()
+        rows = self._connect().execute("SELECT key, usage_pct, blocked_until FROM rate_limit_state").fetchall()
+        return {
+            key: {"usage_pct": usage_pct, "blocked_for": max(0.0, blocked_until - now)}
+            for key, usage_pct, blocked_until in rows
+        }
+
+
+def note_retry_after(seconds):
+    """Remember a retry-after hint so the current response (or background job) can surface it."""
+    if has_app_context():
+        g.meta_retry_after = max(int(seconds), getattr(g, "meta_retry_after", 0))
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_governor():
+    """Return the process-wide RateLimitGovernor, creating it on first use."""
+    global _governor
+
+    if _governor is None:
+        with _governor_lock:
+            if _governor is None:
+                _governor = RateLimitGovernor(
+                    path=os.getenv("META_RATE_LIMIT_DB", DEFAULT_DB_PATH),
+                    capacity=int(os.getenv("META_RATE_LIMIT_BURST", DEFAULT_BUCKET_CAPACITY)),
+                    refill_rate=float(os.getenv("META_RATE_LIMIT_RATE", DEFAULT_REFILL_RATE)),
+                    slowdown_pct=float(os.getenv("META_RATE_LIMIT_SLOWDOWN_PCT", DEFAULT_SLOWDOWN_PCT)),
+                    max_wait=float(os.getenv("META_RATE_LIMIT_MAX_WAIT", DEFAULT_MAX_WAIT)),
+                )
+    return _governor
@@ -0,0 +1,204 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, g, make_response, request
+from flask_jwt_extended import get_jwt_identity
+
+from backend.listing import stream_format
+from backend.shared_cache import get_invalidation_bus, get_shared_cache
+from backend.versions import data_version, on_versions_committed
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 2048
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL = 300  # Seconds
+
+
+class ResponseCache:
+    """A thread-safe LRU of serialized response bodies, bounded by entry count, total bytes and age.
+
+    Keys start with the user ID so a user's entries can be dropped together.
+    Each entry remembers the data version it was rendered at; a lookup with
+    a different version is a miss, so an entry can never outlive a change
+    that did not go through this process.
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (version, expires_at, body, mimetype)
+        self._by_user = {}             # user_id -> set of keys
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get(self, key, version):
+        """Return (body, mimetype) for `key` at `version`, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            if entry[0] != version:
+                self._remove(key)
+                self._stats["invalidations"] += 1
+                self._stats["misses"] += 1
+                return None
+            if entry[1] <= time.monotonic():
+                self._remove(key)
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[2], entry[3]
+
+    def set(self, key, version, body, mimetype):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (version, time.monotonic() + self.ttl, body, mimetype)
+            self._by_user.setdefault(key[0], set()).add(key)
+            self._bytes += len(body)
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def invalidate_users(self, user_ids):
+        """Drop every entry belonging to any of `user_ids`."""
+        with self._lock:
+            for user_id in user_ids:
+                for key in list(self._by_user.get(user_id, ())):
+                    self._remove(key)
+                    self._stats["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                **self._stats,
+                "hit_ratio": self._stats["hits"] / lookups if lookups else None,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+            }
+
+    def _remove(self, key):
+        # Caller holds the lock
+        version, expires_at, body, mimetype = self._entries.pop(key)
+        self._bytes -= len(body)
+        keys = self._by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[key[0]]
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    """Return the process-wide ResponseCache, or None when RESPONSE_CACHE_ENABLED is false."""
+    global _cache
+
+    if _cache is None:
+        if os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() not in ("1", "true", "yes"):
+            return None
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResponseCache(
+                    max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+                    max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+                    ttl=float(os.getenv("RESPONSE_CACHE_TTL", DEFAULT_TTL)),
+                )
+    return _cache
+
+
+def invalidate_cached_responses(user_ids, changes=None):
+    """Drop the cached responses of `user_ids` here, in the shared cache, and (via the bus) in every other process."""
+    cache, shared, bus = get_response_cache(), get_shared_cache(), get_invalidation_bus()
+    if cache is not None:
+        cache.invalidate_users(user_ids)
+    if shared is not None:
+        shared.invalidate_users(user_ids)  # Logs and carries on when SQLite fails
+    if bus is not None:
+        try:
+            bus.publish(user_ids)
+        except OSError as e:
+            # Runs after the commit: the write succeeded, and other processes' version checks catch the change
+            logger.warning(f"Could not announce invalidated users on the bus: {e}")
+
+
+def register_response_cache():
+    """Invalidate cached responses after every commit that changes a user's data."""
+    on_versions_committed(invalidate_cached_responses)
+
+
+def _apply_remote_invalidations(cache):
+    # Other processes' writes, announced on the bus; one memory read when there is nothing new
+    bus = get_invalidation_bus()
+    if bus is None:
+        return
+    user_ids = bus.poll()
+    if user_ids is None:
+        cache.clear()
+    elif user_ids:
+        cache.invalidate_users(user_ids)
+
+
+def cached_response(view):
+    """Serve a GET endpoint's 200 responses from the response cache.
+
+    This process's LRU is checked first, then the cache shared by all
+    worker processes. The key is the user, the endpoint, the query string
+    and the Accept header. Streamed responses are never cached. Must sit
+    below @versioned (or @jwt_required()).
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        cache, shared = get_response_cache(), get_shared_cache()
+        if (cache is None and shared is None) or stream_format():
+            return view(*args, **kwargs)
+
+        user_id = int(get_jwt_identity())
+        version = g.data_version if "data_version" in g else data_version(user_id)
+        key = (user_id, request.endpoint, request.full_path, request.headers.get("Accept", ""))
+        cached = None
+        if cache is not None:
+            _apply_remote_invalidations(cache)
+            cached = cache.get(key, version)
+        if cached is None and shared is not None:
+            cached = shared.get(key, version)
+            if cached is not None and cache is not None:
+                cache.set(key, version, *cached)
+        if cached is not None:
+            body, mimetype = cached
+            return Response(body, mimetype=mimetype)
+
+        response = make_response(view(*args, **kwargs))
+        if response.status_code == 200 and not response.is_streamed:
+            body = response.get_data()
+            if cache is not None:
+                cache.set(key, version, body, response.mimetype)
+            if shared is not None:
+                shared.set(key, version, body, response.mimetype)
+        return response
+    return wrapper
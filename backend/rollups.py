@@ -0,0 +1,143 @@
+import numpy as np
+
+from backend.extensions import db
+from backend.metrics_store import METRICS, get_metrics_store
+from backend.models import Campaign, AdGroup, Ad
+
+# Ratios computed at every level: name -> (numerator, denominator, scale)
+DERIVED = {
+    "ctr": ("clicks", "impressions", 100.0),  # Percent
+    "cpc": ("spend", "clicks", 1.0),
+    "cpa": ("spend", "conversions", 1.0),
+}
+
+
+class Hierarchy:
+    """A user's campaigns, ad sets and ads as flat columns plus parent index arrays.
+
+    `ad_parent[i]` is the position in `ad_groups` of ad i's ad set and
+    `ad_group_parent[j]` the position in `campaigns` of ad set j's campaign
+    (-1 when the parent is not one of the user's rows).
+    """
+
+    def __init__(self, campaigns, ad_groups, ads):
+        self.campaigns = campaigns
+        self.ad_groups = ad_groups
+        self.ads = ads
+
+        campaign_position = {row.id: i for i, row in enumerate(campaigns)}
+        ad_group_position = {row.id: i for i, row in enumerate(ad_groups)}
+        self.ad_group_parent = np.fromiter(
+            (campaign_position.get(row.campaign_id, -1) for row in ad_groups), dtype=np.int64, count=len(ad_groups)
+        )
+        self.ad_parent = np.fromiter(
+            (ad_group_position.get(row.ad_group_id, -1) for row in ads), dtype=np.int64, count=len(ads)
+        )
+
+    @classmethod
+    def load(cls, user_id):
+        """Read the hierarchy with three column-only queries."""
+        campaigns = db.session.query(
+            Campaign.id, Campaign.meta_campaign_id, Campaign.name, Campaign.status
+        ).filter(Campaign.user_id == user_id).order_by(Campaign.id).all()
+        ad_groups = db.session.query(
+            AdGroup.id, AdGroup.campaign_id, AdGroup.meta_ad_group_id, AdGroup.name, AdGroup.status
+        ).filter(AdGroup.user_id == user_id).order_by(AdGroup.id).all()
+        ads = db.session.query(
+            Ad.id, Ad.ad_group_id, Ad.meta_ad_id, Ad.name, Ad.status
+        ).filter(Ad.user_id == user_id).order_by(Ad.id).all()
+        return cls(campaigns, ad_groups, ads)
+
+
+def group_sum(values, parent, size):
+    """Sum `values` into `size` buckets by parent position, dropping rows without a parent."""
+    keep = parent >= 0
+    totals = np.bincount(parent[keep], weights=values[keep], minlength=size)
+    # bincount always returns floats; counts stay exact well past any realistic total
+    return totals.astype(values.dtype, copy=False)
+
+
+def derive(metrics):
+    """Add the DERIVED ratios to a {metric: vector} dict; NaN where the denominator is 0."""
+    for name, (numerator, denominator, scale) in DERIVED.items():
+        num = metrics[numerator].astype(np.float64)
+        den = metrics[denominator].astype(np.float64)
+        ratio = np.full(num.shape, np.nan)
+        np.divide(num * scale, den, out=ratio, where=den > 0)
+        metrics[name] = ratio
+    return metrics
+
+
+def rollup(hierarchy, ad_metrics):
+    """Aggregate ad-level metric vectors up to ad sets, campaigns and the account.
+
+    `ad_metrics` maps each METRICS name to a vector aligned with
+    `hierarchy.ads`. Returns {level: {metric: vector}} for levels ad,
+    adset, campaign and account, with DERIVED ratios added.
+    """
+    n_ad_groups, n_campaigns = len(hierarchy.ad_groups), len(hierarchy.campaigns)
+    ad_group_metrics = {
+        metric: group_sum(values, hierarchy.ad_parent, n_ad_groups) for metric, values in ad_metrics.items()
+    }
+    campaign_metrics = {
+        metric: group_sum(values, hierarchy.ad_group_parent, n_campaigns) for metric, values in ad_group_metrics.items()
+    }
+    account_metrics = {metric: values.sum(keepdims=True) for metric, values in campaign_metrics.items()}
+
+    return {
+        "ad": derive(dict(ad_metrics)),
+        "adset": derive(ad_group_metrics),
+        "campaign": derive(campaign_metrics),
+        "account": derive(account_metrics),
+    }
+
+
+def ad_metrics_for_range(hierarchy, since, until):
+    """Total each metric per ad over [since, until] from the columnar metrics store."""
+    ad_ids = [row.meta_ad_id or "" for row in hierarchy.ads]
+    _, totals = get_metrics_store().totals("ad", list(METRICS), since, until, object_ids=ad_ids)
+    return totals
+
+
+def _records(metrics, count):
+    # Columns -> one dict per row; NaN ratios become None so the result is valid JSON
+    columns = {name: values.tolist() for name, values in metrics.items()}
+    records = [{} for _ in range(count)]
+    for name, values in columns.items():
+        for record, value in zip(records, values):
+            record[name] = None if value != value else value
+    return records
+
+
+def rollup_tree(user_id, since, until):
+    """Return the user's whole campaign -> ad set -> ad tree with metrics rolled up at every level."""
+    hierarchy = Hierarchy.load(user_id)
+    levels = rollup(hierarchy, ad_metrics_for_range(hierarchy, since, until))
+
+    campaigns = [
+        {"id": row.id, "meta_campaign_id": row.meta_campaign_id, "name": row.name, "status": row.status,
+         "metrics": metrics, "ad_groups": []}
+        for row, metrics in zip(hierarchy.campaigns, _records(levels["campaign"], len(hierarchy.campaigns)))
+    ]
+    ad_groups = [
+        {"id": row.id, "meta_ad_group_id": row.meta_ad_group_id, "name": row.name, "status": row.status,
+         "metrics": metrics, "ads": []}
+        for row, metrics in zip(hierarchy.ad_groups, _records(levels["adset"], len(hierarchy.ad_groups)))
+    ]
+    for ad_group, parent in zip(ad_groups, hierarchy.ad_group_parent.tolist()):
+        if parent >= 0:
+            campaigns[parent]["ad_groups"].append(ad_group)
+    for row, metrics, parent in zip(hierarchy.ads, _records(levels["ad"], len(hierarchy.ads)),
+                                    hierarchy.ad_parent.tolist()):
+        if parent >= 0:
+            ad_groups[parent]["ads"].append(
+                {"id": row.id, "meta_ad_id": row.meta_ad_id, "name": row.name, "status": row.status,
+                 "metrics": metrics}
+            )
+
+    return {
+        "since": since.isoformat(),
+        "until": until.isoformat(),
+        "account": _records(levels["account"], 1)[0],
+        "campaigns": campaigns,
+    }
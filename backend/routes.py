@@ -1,22 +1,44 @@
 import json
 from sqlite3 import IntegrityError
-from flask import Blueprint, jsonify, make_response, request, session, current_app
+from flask import Blueprint, Response, jsonify, make_response, request, session, current_app, g
 from flask_login import current_user
-from werkzeug.security import generate_password_hash, check_password_hash
-from backend.models import User, Campaign, AdGroup, Ad, AdCreative
+from backend.models import User, Campaign, AdGroup, Ad, AdCreative, Job, SyncState, InsightsReportRun
 from backend.app import db
 import requests
 import os
 from dotenv import load_dotenv
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from sqlalchemy import text
 from backend.meta_ads_utils import create_meta_campaign, delete_meta_campaign, create_meta_ad_group  # Import the utility function
+from backend.graph_client import get_graph_client, graph_path_template
+from backend import metrics
+from backend.graph_batch import delete_meta_objects, is_missing_object
+from backend.rate_limit import RateLimited, note_retry_after, rate_limit_key
+from backend.jobs import enqueue_job, register_job_handler, wants_async
+from backend.sync import run_sync_job
+from backend.insights import LEVELS as INSIGHTS_LEVELS, run_ingest_job
+from backend.metrics_store import LEVELS as METRICS_LEVELS, METRICS, get_metrics_store
+from backend.rollups import rollup_tree
+from backend.listing import (ListingError, MAX_PAGE_SIZE, decode_cursor, encode_cursor, list_response, one_response,
+                             sparse_query)
+from backend.change_log import ChangeLogExpired, changes_since, current_cursor_id
+from backend.dashboard import dashboard_data
+from backend.versions import versioned
+from backend.response_cache import cached_response, get_response_cache
+from backend.shared_cache import get_shared_cache
+from backend.events import DEFAULT_HEARTBEAT as EVENTS_HEARTBEAT, event_stream, get_event_broker
+from backend.streaming import DETACH_STREAM_ENVIRON
+from backend.password_hashing import RETRY_AFTER as HASHING_RETRY_AFTER, HashingBusy, get_password_hasher, needs_rehash
+from backend.insights_cache import (cached_insights, max_range_days, missing_days, owned_object_ids,
+                                    run_fill_insights_job)
+from backend.webhooks import parse_changes, record_changes, run_refresh_job, verify_signature
+import hmac
 import logging
 from flask import current_app as app  # Add this import
 from flask import request, jsonify, make_response, url_for, redirect, abort
 from urllib.parse import urlparse  # Import urlparse from urllib.parse
 from flask_jwt_extended import create_access_token
-from flask_jwt_extended import jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
 import time
 from sqlalchemy.orm import joinedload
 
@@ -36,6 +58,41 @@ META_ADS_API_URL = "https://graph.facebook.com/v22.0/{ad_group_id}/"  # You can
 load_dotenv()
 
 routes_bp = Blueprint('routes', __name__)
+logger = logging.getLogger(__name__)
+
+
+@routes_bp.after_request
+def add_retry_after(response):
+    # Meta calls that were refused by the rate limit governor leave a retry-after hint behind
+    retry_after = g.pop('meta_retry_after', None)
+    if retry_after and response.status_code >= 400:
+        response.status_code = 429
+        response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+@routes_bp.errorhandler(HashingBusy)
+def hashing_busy(error):
+    # Too many logins/registrations in flight: fail fast rather than queue behind them
+    response = jsonify({"message": "Too many login attempts in progress, please retry shortly"})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(HASHING_RETRY_AFTER)
+    return response
+
+
+@routes_bp.errorhandler(ListingError)
+def listing_error(error):
+    # Bad `fields`, `limit` or `cursor` query parameters
+    return jsonify({"error": str(error)}), 400
+
+
+# Fields each endpoint can be narrowed to with `?fields=` (the keys its to_dict returns)
+AD_CREATIVE_LIST_FIELDS = ('id', 'creative_id', 'name', 'page_id', 'link', 'message', 'image', 'cta_type')
+JOB_FIELDS = ('id', 'kind', 'status', 'result', 'result_status_code', 'error', 'attempts', 'max_attempts',
+              'run_after', 'created_at', 'updated_at', 'finished_at', 'user_id')
+SYNC_STATE_FIELDS = ('ad_account_id', 'object_type', 'high_water_mark', 'last_synced_at', 'last_stats')
+REPORT_RUN_FIELDS = ('id', 'ad_account_id', 'level', 'since', 'until', 'report_run_id', 'status', 'percent_complete',
+                     'rows_written', 'error', 'created_at', 'finished_at')
 
 
 
@@ -54,10 +111,13 @@ def register_user():
     email = data.get('email')
     password = data.get('password')
 
-    try:
-        # Hash the password using werkzeug's generate_password_hash
-        hashed_password = generate_password_hash(password)
+    if not email or not password:
+        return jsonify({"message": "Missing email or password"}), 400
 
+    # Hashed in the hashing pool; raises HashingBusy (429) when it is full
+    hashed_password = get_password_hasher().hash(password)
+
+    try:
         # Try to create and save the new user with the hashed password
         user = User(email=email, _password=hashed_password)
         db.session.add(user)
@@ -97,7 +157,15 @@ def login():
     # Authenticate user
     user = User.query.filter_by(email=email).first()
 
-    if user and check_password_hash(user.password, password):
+    hasher = get_password_hasher()
+    if user and hasher.verify(user.password, password):
+        if needs_rehash(user.password):
+            # Hash parameters changed since this hash was made: upgrade it now that we know the password
+            try:
+                user._password = hasher.hash(password)
+                db.session.commit()
+            except HashingBusy:
+                pass  # Next login will try again
 
         # Generate the JWT token here
         access_token = create_access_token(identity=user.id)
@@ -119,6 +187,7 @@ def login():
 
 
 
+EVENTS_RETRY_AFTER = 5  # Seconds a client turned away by a full worker waits before reconnecting
 MAX_RETRIES = 5
 BASE_WAIT_TIME = 1.0  # Start with 1 second delay
 
@@ -135,16 +204,20 @@ BASE_WAIT_TIME = 1.0  # Start with 1 second delay
 def make_meta_api_request(url, payload=None, method="POST", headers=None):
     retries = 0
     wait_time = BASE_WAIT_TIME
+    path = graph_path_template(url)
 
     while retries < MAX_RETRIES:
         try:
+            client = get_graph_client()
             if method == "POST":
-                response = requests.post(url, data=payload, headers=headers)
+                response = client.post(url, data=payload, headers=headers)
             elif method == "DELETE":
                 # DELETE requests typically use json or params
-                response = requests.delete(url, json=payload, headers=headers) if payload else requests.delete(url, headers=headers)
+                response = client.delete(url, json=payload, headers=headers) if payload else client.delete(url, headers=headers)
+            elif method == "GET":
+                response = client.get(url, params=payload, headers=headers)
             else:
-                response = requests.request(method, url, json=payload, headers=headers)
+                response = client.request(method, url, json=payload, headers=headers)
 
             data = response.json()
 
@@ -153,17 +226,22 @@ def make_meta_api_request(url, payload=None, method="POST", headers=None):
 
             # Handle rate limiting error
             error_data = data.get("error", {})
+            metrics.inc("meta_graph_errors_total", (("path", path), ("code", error_data.get("code", "none"))))
             if error_data.get("code") == 80004 and error_data.get("error_subcode") == 2446079:
-                print("Rate limit reached. Checking X-Business-Use-Case-Usage header...")
                 rate_limit_info = response.headers.get("X-Business-Use-Case-Usage")
-                if rate_limit_info:
-                    estimated_time = extract_estimated_time(rate_limit_info)
-                    if estimated_time:
-                        print(f"Rate limit detected. Waiting {estimated_time} minutes before retrying...")
-                        time.sleep(estimated_time * 60)
-                        continue
-                print(f"No estimated recovery time. Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
+                estimated_time = extract_estimated_time(rate_limit_info) if rate_limit_info else None
+                backoff = estimated_time * 60 if estimated_time else wait_time
+
+                if client.governor is not None:
+                    # Block the account for every worker; the next acquire() waits briefly or fails fast
+                    logger.warning(f"Meta rate limit reached; blocking Meta calls for {backoff} seconds")
+                    client.governor.block(rate_limit_key(url), backoff)
+                else:
+                    logger.warning(f"Meta rate limit reached; retrying in {wait_time} seconds")
+                    time.sleep(wait_time)
+                    backoff = wait_time
+                metrics.inc("meta_graph_retries_total", (("path", path),))
+                metrics.inc("meta_graph_backoff_seconds_total", (("path", path),), backoff)
                 wait_time *= 2  # Exponential backoff
                 retries += 1
                 continue
@@ -174,14 +252,22 @@ def make_meta_api_request(url, payload=None, method="POST", headers=None):
             if error_user_msg:
                 return {"error": error_user_msg}
 
-            print(f"Meta API Error: {data}")
+            logger.warning("Meta API error: %s", data)
             return data  # Return only the error data
 
+        except RateLimited as e:
+            # Fail fast instead of holding the request thread until Meta lets us back in
+            logger.info(f"Rate limit reached for {e.key}; retry after {e.retry_after} seconds")
+            metrics.inc("meta_graph_rate_limited_total", (("path", path),))
+            note_retry_after(e.retry_after)
+            return {"error": {"message": str(e), "error_user_msg": str(e), "retry_after": e.retry_after}}
+
         except requests.exceptions.RequestException as e:
-            print(f"Network error: {e}")
+            logger.warning(f"Network error calling Meta: {e}")
             return {"error": str(e)}
 
-    print("Max retries reached. Request failed.")
+    logger.error("Max retries reached calling Meta")
+    note_retry_after(wait_time)
     return {"error": "Rate limit exceeded, retries exhausted"}
 
 
@@ -210,7 +296,7 @@ def extract_estimated_time(rate_limit_info):
                 if "estimated_time_to_regain_access" in limit:
                     return limit["estimated_time_to_regain_access"]
     except json.JSONDecodeError:
-        print("Error parsing rate limit info.")
+        logger.warning("Could not parse X-Business-Use-Case-Usage")
     return None
 
 
@@ -234,6 +320,15 @@ def campaigns():
     data = request.get_json()
     user_id = get_jwt_identity()
 
+    if wants_async():
+        return enqueue_job_response('create_campaign', user_id, data)
+
+    body, status_code = create_campaign_for_user(user_id, data)
+    return jsonify(body), status_code
+
+
+def create_campaign_for_user(user_id, data):
+    """Create a campaign on Meta and store it locally. Returns (response_body, status_code)."""
     # Retrieve form data
     name = data.get("name")
     objective = data.get("objective")
@@ -253,15 +348,16 @@ def campaigns():
     api_url = f"https://graph.facebook.com/v22.0/act_{AD_ACCOUNT_ID}/campaigns"
     
     
-    print('Payload: ', payload)
+    logger.debug("Create campaign payload: %s", payload)
     
     # Make the request and unpack the response
     response_data = make_meta_api_request(api_url, payload, method="POST")
 
     # Check if the response contains an error
     if 'error' in response_data:
-        error_msg = response_data.get('error', {}).get('error_user_msg', 'Failed to create campaign due to rate limits or other errors.')
-        return jsonify({"error": error_msg}), 400
+        error = response_data.get('error', {})
+        error_msg = error.get('error_user_msg', 'Failed to create campaign due to rate limits or other errors.') if isinstance(error, dict) else error
+        return {"error": error_msg}, 400
 
     if 'id' in response_data:
         meta_campaign_id = response_data['id']  # Get the Meta campaign ID from the response
@@ -281,14 +377,14 @@ def campaigns():
         db.session.commit()
 
         # Return success response
-        return jsonify({
+        return {
             "message": "Campaign created successfully!",
             "id": new_campaign.id,  # Local DB ID
             "meta_campaign_id": meta_campaign_id  # Meta Campaign ID
-        }), 201
+        }, 201
 
     else:
-        return jsonify({"error": "Failed to create campaign. No 'id' returned from Meta API."}), 500
+        return {"error": "Failed to create campaign. No 'id' returned from Meta API."}, 500
 
 
 
@@ -305,17 +401,106 @@ def campaigns():
 
 @routes_bp.route('/api/campaigns', methods=['GET'])
 @jwt_required()
+@versioned
+@cached_response
 def get_campaigns():
     # Get the current user's identity (user_id) from the JWT
     current_user_id = get_jwt_identity()  # This retrieves the user ID from the token
 
     # Now, you can use the current_user_id to query the database for that user's campaigns
-    campaigns = Campaign.query.filter_by(user_id=current_user_id).all()
+    return list_response(Campaign.query.filter_by(user_id=current_user_id), Campaign.id, Campaign.to_dict)
+
+
 
-    return jsonify([campaign.to_dict() for campaign in campaigns])
 
 
 
+@routes_bp.route('/api/dashboard', methods=['GET'])
+@jwt_required()
+@versioned
+@cached_response
+def get_dashboard():
+    """Campaigns, ad sets, ads and creatives in one call.
+
+    With `since` (the `server_time` of a previous response) only rows
+    changed after it are returned, plus the current IDs of each list.
+    """
+    current_user_id = get_jwt_identity()
+
+    since = request.args.get('since')
+    if since:
+        try:
+            since = datetime.fromisoformat(since)
+        except ValueError:
+            return jsonify({"error": "since must be an ISO 8601 timestamp"}), 400
+        if since.tzinfo is not None:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+
+    return jsonify(dashboard_data(current_user_id, since or None)), 200
+
+
+
+
+
+@routes_bp.route('/api/changes', methods=['GET'])
+@jwt_required()
+@versioned
+def get_changes():
+    """Campaigns, ad sets, ads and creatives changed since a cursor, each once and in its current state.
+
+    Without `since` only a starting cursor is returned. Pass `next_cursor`
+    back as `since`, until `has_more` is false. A 410 means the cursor is
+    older than the retained log: reload everything and start over.
+    """
+    user_id = get_jwt_identity()
+    try:
+        limit = int(request.args.get('limit', MAX_PAGE_SIZE))
+    except ValueError:
+        return jsonify({"error": "limit must be an integer"}), 400
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        return jsonify({"error": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400
+
+    since = request.args.get('since')
+    if not since:
+        return jsonify({"changes": [], "next_cursor": encode_cursor(current_cursor_id()), "has_more": False}), 200
+
+    after_id, _ = decode_cursor(since)
+    try:
+        result = changes_since(user_id, after_id, limit)
+    except ChangeLogExpired as e:
+        return jsonify({"error": str(e)}), 410
+    return jsonify({
+        "changes": result["changes"],
+        "next_cursor": encode_cursor(result["last_id"]),
+        "has_more": result["has_more"],
+    }), 200
+
+
+
+@routes_bp.route('/api/events', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])  # EventSource cannot send headers: pass ?jwt=<token>
+def get_events():
+    """Server-Sent Events with the user's campaign, ad set, ad and creative changes.
+
+    `change` events carry {entity, op, id, data} with `entity` named as in
+    /api/dashboard; `resync` means changes were missed and the client should
+    refetch (e.g. /api/dashboard?since=...).
+    """
+    # Under backend.serve a stream gets its own slot instead of holding one of the worker's request threads
+    detach = request.environ.get(DETACH_STREAM_ENVIRON)
+    if detach is not None and not detach():
+        response = jsonify({"error": "Too many open event streams, try again later"})
+        response.headers['Retry-After'] = str(EVENTS_RETRY_AFTER)
+        return response, 503
+
+    broker = get_event_broker()
+    subscription = broker.subscribe(get_jwt_identity())
+    heartbeat = float(os.getenv('EVENTS_HEARTBEAT', EVENTS_HEARTBEAT))
+    response = Response(event_stream(broker, subscription, heartbeat=heartbeat, expires_at=get_jwt().get('exp')),
+                        mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Don't let nginx hold events back
+    return response
 
 
 
@@ -323,16 +508,26 @@ def get_campaigns():
 @jwt_required()
 def create_adgroup():
     data = request.json
+    user_id = get_jwt_identity()
+
+    if wants_async():
+        return enqueue_job_response('create_ad_group', user_id, data)
+
+    body, status_code = create_ad_group_for_user(user_id, data)
+    return jsonify(body), status_code
 
+
+def create_ad_group_for_user(user_id, data):
+    """Create an ad set on Meta and store it locally. Returns (response_body, status_code)."""
     # Extract campaign_id from the request
     campaign_id = data.get('campaign_id')
     if not campaign_id:
-        return jsonify({'error': 'Campaign ID is required'}), 400
+        return {'error': 'Campaign ID is required'}, 400
 
     # Retrieve campaign from the database
     campaign = db.session.query(Campaign).filter_by(id=campaign_id).first()
     if not campaign:
-        return jsonify({'error': 'Campaign not found'}), 404
+        return {'error': 'Campaign not found'}, 404
 
     # Use the Meta campaign ID instead
     meta_campaign_id = campaign.meta_campaign_id
@@ -343,10 +538,10 @@ def create_adgroup():
         try:
             targeting = json.loads(targeting)  # Convert string to dictionary
         except json.JSONDecodeError:
-            return jsonify({'error': 'Invalid JSON for targeting'}), 400
+            return {'error': 'Invalid JSON for targeting'}, 400
 
     if not isinstance(targeting, dict):
-        return jsonify({'error': 'Targeting must be a dictionary'}), 400
+        return {'error': 'Targeting must be a dictionary'}, 400
 
     # Validate bid strategy-specific fields
     bid_strategy = data.get('bid_strategy')
@@ -355,26 +550,26 @@ def create_adgroup():
     optimization_goal = data.get('optimization_goal')
 
     if bid_strategy == 'LOWEST_COST_WITH_BID_CAP' and not bid_amount:
-        return jsonify({'error': 'Bid amount required for LOWEST_COST_WITH_BID_CAP'}), 400
+        return {'error': 'Bid amount required for LOWEST_COST_WITH_BID_CAP'}, 400
 
     if bid_strategy == 'LOWEST_COST_WITH_MIN_ROAS' and (not roas_average_floor or not optimization_goal):
-        return jsonify({'error': 'ROAS floor & optimization goal required for LOWEST_COST_WITH_MIN_ROAS'}), 400
+        return {'error': 'ROAS floor & optimization goal required for LOWEST_COST_WITH_MIN_ROAS'}, 400
 
     # Ensure proper type conversion for numeric fields
     try:
         daily_budget = int(float(data['daily_budget']))  # Convert to integer
     except (ValueError, TypeError):
-        return jsonify({'error': 'Invalid value for daily_budget'}), 400
+        return {'error': 'Invalid value for daily_budget'}, 400
 
     try:
         bid_amount = int(float(bid_amount)) if bid_amount else None  # Convert bid amount to integer
     except (ValueError, TypeError):
-        return jsonify({'error': 'Invalid value for bid_amount'}), 400
+        return {'error': 'Invalid value for bid_amount'}, 400
 
     try:
         roas_average_floor = int(float(roas_average_floor)) if roas_average_floor else None  # Convert ROAS floor to integer
     except (ValueError, TypeError):
-        return jsonify({'error': 'Invalid value for roas_average_floor'}), 400
+        return {'error': 'Invalid value for roas_average_floor'}, 400
 
     # Prepare data for Meta API request
     ad_group_data = {
@@ -399,7 +594,6 @@ def create_adgroup():
     if response_data and response_data.get('id'):
         # Store ad group in database with all fields
         meta_ad_group_id = response_data.get('id')
-        user_id = get_jwt_identity()
 
         ad_group = AdGroup(
             name=data['name'],
@@ -420,11 +614,12 @@ def create_adgroup():
         db.session.add(ad_group)
         db.session.commit()
 
-        return jsonify({'message': 'Ad group created successfully', 'ad_group_id': ad_group.id}), 201
+        return {'message': 'Ad group created successfully', 'ad_group_id': ad_group.id}, 201
 
     # Handle failure for Meta API request
-    error_message = response_data.get('error', {}).get('message', 'Unknown error')
-    return jsonify({'error': 'Failed to create ad group due to Meta API error', 'details': error_message}), 400
+    error = response_data.get('error', {})
+    error_message = error.get('message', 'Unknown error') if isinstance(error, dict) else error
+    return {'error': 'Failed to create ad group due to Meta API error', 'details': error_message}, 400
 
 
 
@@ -447,20 +642,17 @@ def create_adgroup():
     
 @routes_bp.route('/api/ad-groups', methods=['GET'])
 @jwt_required()  # Ensure the request has a valid JWT token
+@versioned
+@cached_response
 def get_ad_groups():
     try:
         # Get the user_id from the JWT token
         user_id = get_jwt_identity()
 
-        # Querying ad_groups for the logged-in user using ORM
-        ad_groups = AdGroup.query.filter_by(user_id=user_id).all()
-
-        # Convert each AdGroup to dictionary
-        ad_groups_data = [ad_group.to_dict() for ad_group in ad_groups]
-
-        return jsonify(ad_groups_data), 200
+        # Querying ad_groups for the logged-in user using ORM, one page at a time if asked to
+        return list_response(AdGroup.query.filter_by(user_id=user_id), AdGroup.id, AdGroup.to_dict)
     except Exception as e:
-        logging.error(f"Error occurred: {str(e)}")  # Log the error for debugging
+        logger.exception("Listing failed")
         return jsonify({"error": "Internal server error", "details": str(e)}), 500
   
 
@@ -471,17 +663,17 @@ def get_ad_groups():
 # /api/ads route
 @routes_bp.route('/api/ads', methods=['GET'])
 @jwt_required()  # Ensure the request has a valid JWT token
+@versioned
+@cached_response
 def get_ads():
     user_id = get_jwt_identity()  # Get the user_id from the JWT token
 
     try:
         # Query ads for the logged-in user
-        ads = Ad.query.filter_by(user_id=user_id).all()
-
         # Return the ads as a list of dictionaries
-        return jsonify([ad.to_dict() for ad in ads]), 200
+        return list_response(Ad.query.filter_by(user_id=user_id), Ad.id, Ad.to_dict)
     except Exception as e:
-        logging.error(f"Error occurred: {str(e)}")  # Log the error for debugging
+        logger.exception("Listing failed")
         return jsonify({"error": "Internal server error", "details": str(e)}), 500
     
     
@@ -542,11 +734,8 @@ def edit_campaign(id):
 @routes_bp.route('/api/campaigns/<int:id>', methods=['GET'])
 @jwt_required()  # Ensure the request has a valid JWT token
 def get_campaign(id):
-    campaign = Campaign.query.get(id)
-    if not campaign:
-        return jsonify({"error": "Campaign not found"}), 404
-    
-    return jsonify(campaign.to_dict())
+    return one_response(Campaign.query.filter_by(id=id), Campaign, Campaign.to_dict,
+                        (jsonify({"error": "Campaign not found"}), 404))
 
 
 
@@ -554,11 +743,8 @@ def get_campaign(id):
 @routes_bp.route('/api/ad-groups/<int:id>', methods=['GET'])
 @jwt_required()  # Ensure the request has a valid JWT token
 def get_ad_route(id):
-    adgroup = AdGroup.query.get(id)
-    if not adgroup:
-        return jsonify({"error": "Ad Group not found"}), 404
-    
-    return jsonify(adgroup.to_dict())
+    return one_response(AdGroup.query.filter_by(id=id), AdGroup, AdGroup.to_dict,
+                        (jsonify({"error": "Ad Group not found"}), 404))
 
 
 
@@ -574,14 +760,45 @@ def get_ad_route(id):
 @routes_bp.route("/api/campaigns/<int:campaign_id>", methods=["DELETE"])
 @jwt_required()
 def delete_campaign(campaign_id):
+    user_id = get_jwt_identity()
+
+    if wants_async():
+        if not Campaign.query.get(campaign_id):
+            return jsonify({"error": "Campaign not found"}), 404
+        return enqueue_job_response('delete_campaign', user_id, {'campaign_id': campaign_id})
+
+    body, status_code = delete_campaign_for_user(user_id, {'campaign_id': campaign_id})
+    return jsonify(body), status_code
+
+
+def delete_campaign_for_user(user_id, data):
+    """Delete a campaign with its ad sets and ads, on Meta and locally. Returns (response_body, status_code)."""
+    campaign_id = data.get('campaign_id')
     campaign = Campaign.query.get(campaign_id)
 
     if not campaign:
-        return jsonify({"error": "Campaign not found"}), 404
+        return {"error": "Campaign not found"}, 404
 
     meta_campaign_id = campaign.meta_campaign_id  # Ensure this exists in your model
 
-    # Step 1: Delete from Meta Ads API with rate limit handling
+    # Step 1: Delete the campaign's ads and ad sets from Meta in batch requests. Children Meta already removed
+    # (e.g. an ad deleted along with its ad set in the same batch) count as deleted
+    child_meta_ids = [
+        meta_ad_id for (meta_ad_id,) in db.session.query(Ad.meta_ad_id).join(AdGroup, Ad.ad_group_id == AdGroup.id)
+        .filter(AdGroup.campaign_id == campaign_id, Ad.meta_ad_id.isnot(None))
+    ]
+    child_meta_ids += [
+        meta_ad_group_id for (meta_ad_group_id,) in db.session.query(AdGroup.meta_ad_group_id)
+        .filter(AdGroup.campaign_id == campaign_id, AdGroup.meta_ad_group_id.isnot(None))
+    ]
+    if child_meta_ids:
+        results = delete_meta_objects(child_meta_ids, access_token=META_ACCESS_TOKEN)
+        failed = {meta_id: response['error'] for meta_id, response in results.items() if response.get('error')}
+        if failed:
+            meta_id, error = next(iter(failed.items()))
+            return {"error": f"Failed to delete {len(failed)} ads/ad sets from Meta API (first: {meta_id}: {error.get('message')})"}, 500
+
+    # Step 2: Delete the campaign itself from Meta Ads API with rate limit handling
     meta_url = f"https://graph.facebook.com/v22.0/{meta_campaign_id}"
     headers = {"Authorization": f"Bearer {META_ACCESS_TOKEN}"}
 
@@ -591,12 +808,13 @@ def delete_campaign(campaign_id):
     # Make request to Meta API
     meta_response_data = make_meta_api_request(meta_url, payload=payload, method="DELETE", headers=headers)
 
-    # Check if the response contains an error or not
-    if 'error' in meta_response_data:
-        error_msg = meta_response_data.get('error', {}).get('error_user_msg', 'Failed to delete from Meta API due to rate limits or other errors')
-        return jsonify({"error": error_msg}), 500
+    # Check if the response contains an error or not; a campaign already gone from Meta only needs the local cleanup
+    if 'error' in meta_response_data and not is_missing_object(meta_response_data):
+        error = meta_response_data.get('error', {})
+        error_msg = error.get('error_user_msg', 'Failed to delete from Meta API due to rate limits or other errors') if isinstance(error, dict) else error
+        return {"error": error_msg}, 500
 
-    # Step 2: Delete related records from our database
+    # Step 3: Delete related records from our database
     try:
         # Delete related ads efficiently
         Ad.query.filter(Ad.ad_group_id.in_(
@@ -610,11 +828,11 @@ def delete_campaign(campaign_id):
         db.session.delete(campaign)
         db.session.commit()
 
-        return jsonify({"message": "Campaign deleted successfully"}), 200
+        return {"message": "Campaign deleted successfully"}, 200
 
     except Exception as e:
         db.session.rollback()
-        return jsonify({"error": f"Database deletion failed: {str(e)}"}), 500
+        return {"error": f"Database deletion failed: {str(e)}"}, 500
 
 
 
@@ -691,23 +909,17 @@ def update_ad_group(ad_group_id):
         headers = {"Authorization": f"Bearer {META_ACCESS_TOKEN}"}
         response_data = make_meta_api_request(url, meta_update_data, method="POST", headers=headers)
         
-        print('Response data: ', response_data)
-        print(type(response_data))
+        logger.debug("Meta response: %s", response_data)
 
         if isinstance(response_data, dict) and 'error' in response_data:
-            print('I get here')
-
             # Access the error message from the dictionary
             error_msg = response_data.get('error', '')
-            print(f"Error message: {error_msg}")
             
             if error_msg:
-                print('Returning error_msg')
                 return jsonify({"error": error_msg}), 400  # Return the error message if no 'error_user_msg'
 
         elif isinstance(response_data, str):
             # If response_data is a string, directly return it
-            print('Returning error string')
             return jsonify({"error": response_data}), 400
 
         # If update is successful, update the database
@@ -723,8 +935,7 @@ def update_ad_group(ad_group_id):
 
     except Exception as e:
         db.session.rollback()
-        print('Error: ', e)
-        print("Error updating ad group:", str(e))
+        logger.exception("Updating ad group failed")
         return jsonify({"error": "Server error", "details": str(e)}), 500
 
 
@@ -760,22 +971,19 @@ def delete_ad_group(ad_group_id):
     
         headers = {"Authorization": f"Bearer {META_ACCESS_TOKEN}"}
 
-        # If there are ads to delete from Meta
+        # If there are ads to delete from Meta, send them in batch requests of up to 50
         if meta_ad_ids:
-            url = "https://graph.facebook.com/v22.0"
-            headers = {"Authorization": f"Bearer {META_ACCESS_TOKEN}"}
-            for meta_ad_id in meta_ad_ids:
-                delete_url = f"{url}/{meta_ad_id}"
-                response = make_meta_api_request(delete_url, method="DELETE", headers=headers)
+            results = delete_meta_objects(meta_ad_ids, access_token=META_ACCESS_TOKEN)
 
-                # Check if Meta API delete was successful
+            # Check if every Meta API delete was successful
+            for meta_ad_id, response in results.items():
                 if response.get('error'):
-                    raise Exception(f"Error deleting Meta ad: {response['error']['message']}")
+                    raise Exception(f"Error deleting Meta ad {meta_ad_id}: {response['error'].get('message')}")
 
         # Delete the ad group from Meta (even if there are no ads)
         delete_url = f"https://graph.facebook.com/v22.0/{ad_group.meta_ad_group_id}"
         response = make_meta_api_request(delete_url, method="DELETE", headers=headers)
-        print('Ad group delete response: ', response)
+        logger.debug("Meta response: %s", response)
 
         # Check if the Meta API delete was successful
         if response.get('error'):
@@ -792,7 +1000,7 @@ def delete_ad_group(ad_group_id):
 
     except Exception as e:
         db.session.rollback()
-        print(e)
+        logger.exception("Deleting ad group failed")
         return jsonify({"error": "Error deleting ad group or ads", "details": str(e)}), 500
 
 
@@ -805,7 +1013,7 @@ def create_meta_ad(ad_account_id, adset_id, creative_id, name, status):
 
     # Ensure all required parameters are provided
     if not (ad_account_id and adset_id and creative_id and name):
-        print("Error: Missing required parameters for ad creation.")
+        logger.warning("Missing required parameters for ad creation")
         return None
 
     payload = {
@@ -820,10 +1028,10 @@ def create_meta_ad(ad_account_id, adset_id, creative_id, name, status):
     response_data = make_meta_api_request(url, payload, method="POST")
 
     if response_data is not None:  # If request was successful
-        print(f"✅ Ad '{name}' created successfully on Meta.")
+        logger.info(f"Ad '{name}' created on Meta")
         return response_data
     else:
-        print(f"❌ Failed to create ad '{name}'.")
+        logger.warning(f"Failed to create ad '{name}' on Meta")
         return None
 
 
@@ -873,29 +1081,16 @@ def create_ad():
     
 @routes_bp.route('/api/ad-creatives', methods=['GET'])
 @jwt_required()  # Ensure the request has a valid JWT token
+@versioned
+@cached_response
 def get_ad_creatives():
     user_id = get_jwt_identity()  # Get the user_id from the JWT token
 
     try:
         # Fetch ad creatives for the logged-in user by filtering with user_id
-        ad_creatives = AdCreative.query.filter_by(user_id=user_id).all()
-
-        # Convert the query result to a list of dictionaries
-        result = []
-        for ad_creative in ad_creatives:
-            result.append({
-                'id': ad_creative.id,
-                'creative_id': ad_creative.creative_id,
-                'name': ad_creative.name,
-                'page_id': ad_creative.page_id,
-                'link': ad_creative.link,
-                'message': ad_creative.message,
-                'image': ad_creative.image,
-                'cta_type': ad_creative.cta_type
-            })
-
         # Return the list of ad creatives as JSON
-        return jsonify(result), 200
+        return list_response(AdCreative.query.filter_by(user_id=user_id), AdCreative.id, AdCreative.to_summary_dict,
+                             allowed=AD_CREATIVE_LIST_FIELDS)
     
     except Exception as e:
         # Handle any errors that occur during the process
@@ -935,7 +1130,7 @@ def create_ad_creative():
         meta_url = "https://graph.facebook.com/v22.0/act_635629056834628/adcreatives"
         response_data = make_meta_api_request(meta_url, payload, method="POST", headers=None)
         
-        print('Response data: ', response_data)
+        logger.debug("Meta response: %s", response_data)
 
         # If there was an error in the response data, return the error message
         if 'error' in response_data:
@@ -977,15 +1172,10 @@ def create_ad_creative():
 
 @routes_bp.route('/api/ad-creatives/<int:id>', methods=['GET'])
 def get_ad_creative(id):
-    # Fetch the ad creative by id from the database
-    ad_creative = AdCreative.query.get(id)
-    
-    # If the ad creative is not found, return a 404 error
-    if not ad_creative:
-        return jsonify({'message': 'AdCreative not found'}), 404
-    
-    # Return the ad creative data as JSON
-    return jsonify(ad_creative.to_dict()), 200
+    # Fetch the ad creative by id from the database (only the `fields` asked for, if any);
+    # 404 if it is not found
+    return one_response(AdCreative.query.filter_by(id=id), AdCreative, AdCreative.to_dict,
+                        (jsonify({'message': 'AdCreative not found'}), 404))
 
 
 
@@ -1040,7 +1230,7 @@ def update_ad_creative(id):
         meta_url = f"https://graph.facebook.com/v22.0/{ad_creative.creative_id}"
         response_data = make_meta_api_request(meta_url, meta_payload, method="POST")
         
-        print('Response data: ', response_data)
+        logger.debug("Meta response: %s", response_data)
 
         # Check for error in response_data and extract the user message
         if isinstance(response_data, dict) and response_data.get('error'):
@@ -1055,7 +1245,7 @@ def update_ad_creative(id):
 
     except Exception as e:
         db.session.rollback()  # Rollback in case of error
-        print('ERROR: ', str(e))
+        logger.exception("Updating ad creative failed")
         return jsonify({'error': str(e)}), 500
 
 
@@ -1074,12 +1264,21 @@ def update_ad_creative(id):
 @jwt_required()  # Ensure the request has a valid JWT token
 def create_ad_v2():
     """Creates an ad in Meta Ads API and stores it in the local database."""
-    try:
-        # JWT identity will give the user ID from the token
-        user_id = get_jwt_identity()
-        data = request.get_json()
-        print('Received Data:', data)
+    # JWT identity will give the user ID from the token
+    user_id = get_jwt_identity()
+    data = request.get_json()
+    logger.debug("Create ad request: %s", data)
+
+    if wants_async():
+        return enqueue_job_response('create_ad', user_id, data)
+
+    body, status_code = create_ad_for_user(user_id, data)
+    return jsonify(body), status_code
 
+
+def create_ad_for_user(user_id, data):
+    """Create an ad on Meta and store it locally. Returns (response_body, status_code)."""
+    try:
         # Validate incoming data
         name = data.get('name')
         ad_group_id = data.get('adsetId')  # Local ad group ID
@@ -1087,17 +1286,17 @@ def create_ad_v2():
         status = data.get('status', 'ACTIVE')
 
         if not all([name, ad_group_id, creative_id]):
-            return jsonify({"error": "Missing required parameters (name, adset_id, creative_id)"}), 400
+            return {"error": "Missing required parameters (name, adset_id, creative_id)"}, 400
 
         # Query the ad_groups table to get the corresponding meta_ad_group_id
         ad_group = AdGroup.query.get(ad_group_id)
         if not ad_group:
-            return jsonify({"error": "Ad group not found"}), 404
+            return {"error": "Ad group not found"}, 404
 
         # Extract the Meta ad group ID
         meta_ad_group_id = ad_group.meta_ad_group_id
         if not meta_ad_group_id:
-            return jsonify({"error": "meta_ad_group_id not found for the provided ad group"}), 404
+            return {"error": "meta_ad_group_id not found for the provided ad group"}, 404
 
         # Prepare the payload for Meta API
         payload = {
@@ -1114,13 +1313,12 @@ def create_ad_v2():
         # Make request to Meta API
         meta_response = make_meta_api_request(url, payload, method="POST", headers=None)
         
-        print('Meta Response:', meta_response)
-        print('Meta Response Type:', type(meta_response))
+        logger.debug("Meta response: %s", meta_response)
 
         # Check if the response contains the 'id' field (indicating the ad was created successfully)
         if 'error' not in meta_response and 'id' in meta_response:
             meta_ad_id = meta_response['id']
-            print('Created Ad ID from Meta:', meta_ad_id)
+            logger.info(f"Created Meta ad {meta_ad_id}")
 
             # Insert the new ad into the database, including the meta_creative_id
             try:
@@ -1135,22 +1333,23 @@ def create_ad_v2():
                 db.session.add(new_ad)
                 db.session.commit()
 
-                return jsonify({"message": "Ad created successfully", "ad_data": meta_response}), 201
+                return {"message": "Ad created successfully", "ad_data": meta_response}, 201
 
             except Exception as db_error:
-                print(f'Database Error: {db_error}')
+                logger.exception("Saving the ad failed")
                 db.session.rollback()
-                return jsonify({"error": "Failed to save ad to database"}), 500
+                return {"error": "Failed to save ad to database"}, 500
 
         else:
             # Handle Meta API error
-            error_msg = meta_response.get('error', {}).get('error_user_msg', 'An unknown error occurred')
-            print('Meta API Error:', error_msg)
-            return jsonify({"error": error_msg}), 500
+            error = meta_response.get('error', {})
+            error_msg = error.get('error_user_msg', 'An unknown error occurred') if isinstance(error, dict) else error
+            logger.warning(f"Meta API error creating ad: {error_msg}")
+            return {"error": error_msg}, 500
 
     except Exception as e:
-        print(f'Request Exception: {e}')
-        return jsonify({"error": "Failed to connect to Meta API"}), 500
+        logger.exception("Creating ad failed")
+        return {"error": "Failed to connect to Meta API"}, 500
 
     
     
@@ -1204,22 +1403,15 @@ def delete_ad_creative(id):
     
 @routes_bp.route('/api/ad-sets', methods=['GET'])
 @jwt_required()  # Ensure the request has a valid JWT token
+@versioned
+@cached_response
 def get_ad_sets():
     try:
         # Get the user ID from the JWT
         user_id = get_jwt_identity()
 
-        # Query the database to get ad sets belonging to the logged-in user
-        ad_sets = AdGroup.query.filter_by(user_id=user_id).all()
-
-        # If no ad sets found
-        if not ad_sets:
-            return jsonify([]), 200  # Return an empty list instead of an error
-
-        # Convert ad sets to dictionary format for JSON response
-        ad_sets_data = [ad_set.to_dict() for ad_set in ad_sets]
-
-        return jsonify(ad_sets_data), 200
+        # Query the database to get ad sets belonging to the logged-in user (an empty list if none)
+        return list_response(AdGroup.query.filter_by(user_id=user_id), AdGroup.id, AdGroup.to_dict)
 
     except Exception as e:
         return jsonify({'error': 'An error occurred', 'message': str(e)}), 500    
@@ -1236,7 +1428,7 @@ def get_ad_sets():
 def delete_ad(id):
     """Deletes an ad from Meta Ads API and removes it from the database."""
     
-    print('Received request to delete ad with local DB ID:', id)
+    logger.debug("Deleting ad %s", id)
 
     # Query the database using the local DB ID to get the ad
     ad = Ad.query.filter_by(id=id).first()
@@ -1250,7 +1442,7 @@ def delete_ad(id):
     if not meta_ad_id:
         return jsonify({"error": "Meta Ad ID not found for this ad"}), 400
 
-    print(f"Meta Ad ID to be deleted: {meta_ad_id}")
+    logger.debug("Deleting Meta ad %s", meta_ad_id)
 
     # Meta Ads API URL for deleting the ad
     url = f'https://graph.facebook.com/v22.0/{meta_ad_id}'
@@ -1262,7 +1454,7 @@ def delete_ad(id):
         # Use make_meta_api_request to handle the request and retries
         meta_response = make_meta_api_request(url, payload, method="DELETE")
         
-        print('Meta response: ', meta_response)
+        logger.debug("Meta response: %s", meta_response)
 
         # Check if the response contains 'success': True
         if meta_response.get('success') == True:
@@ -1274,14 +1466,14 @@ def delete_ad(id):
                 return jsonify({"message": "Ad deleted successfully"}), 200
             except Exception as db_error:
                 db.session.rollback()
-                print(f'Database Error: {db_error}')
+                logger.exception("Deleting the ad from the database failed")
                 return jsonify({"error": "Failed to delete ad from database"}), 500
         else:
             # If Meta API deletion was unsuccessful
             return jsonify({"error": "Failed to delete ad from Meta"}), 400
 
     except requests.exceptions.RequestException as e:
-        print(f'Request Exception: {e}')
+        logger.warning(f"Network error deleting ad: {e}")
         return jsonify({"error": "Failed to connect to Meta API"}), 500
 
 
@@ -1304,7 +1496,7 @@ def edit_ad(ad_id):
             return jsonify({'error': 'Ad not found'}), 404
 
         data = request.json
-        print('Data: ', data)
+        logger.debug("Edit ad request: %s", data)
         
         ad.name = data['name']
         ad.status = data['status']
@@ -1332,7 +1524,7 @@ def edit_ad(ad_id):
         # If Meta API returns success
         if response_data.get('success'):
             db.session.commit()  # Commit changes to the database
-            print('Ad updated successfully')
+            logger.info(f"Updated ad {ad_id}")
             return jsonify({'message': 'Ad updated successfully'}), 200
         else:
             return jsonify({'error': 'Unexpected error response from Meta API', 'details': response_data}), 500
@@ -1347,15 +1539,8 @@ def edit_ad(ad_id):
 @jwt_required()  # Ensure the request has a valid JWT token
 def get_ad(ad_id):
     try:
-        # Query the ad by the given ad_id and load the related ad group
-        ad = Ad.query.options(joinedload(Ad.ad_group)).get(ad_id)
-        
-        # Check if the ad exists
-        if not ad:
-            return jsonify({'error': 'Ad not found'}), 404
-
-        # Return the ad data in a structured way, including the related ad group
-        return jsonify(ad.to_dict()), 200
+        # Query the ad by the given ad_id (to_dict doesn't use the ad group, so it isn't loaded)
+        return one_response(Ad.query.filter_by(id=ad_id), Ad, Ad.to_dict, (jsonify({'error': 'Ad not found'}), 404))
 
     except Exception as e:
         # Log the error (you can replace print with proper logging)
@@ -1418,3 +1603,365 @@ def edit_ad_v2(ad_id):
     db.session.commit()  # Commit the changes to the database
 
     return jsonify({'message': 'Ad updated successfully'}), 200
+
+
+
+
+
+
+
+
+
+
+def enqueue_job_response(kind, user_id, data):
+    """Queue `kind` as a background job and answer 202 Accepted with its status URL."""
+    return job_accepted_response(enqueue_job(kind, user_id, data))
+
+
+def job_accepted_response(job):
+    status_url = url_for('routes.get_job', job_id=job.id)
+    response = jsonify({"message": "Request accepted", "job_id": job.id, "status": job.status, "status_url": status_url})
+    response.status_code = 202
+    response.headers['Location'] = status_url
+    return response
+
+
+# Creates are not retried after an exception: Meta may already have made the object
+register_job_handler('create_campaign', create_campaign_for_user, retry_on_exception=False)
+register_job_handler('create_ad_group', create_ad_group_for_user, retry_on_exception=False)
+register_job_handler('create_ad', create_ad_for_user, retry_on_exception=False)
+register_job_handler('delete_campaign', delete_campaign_for_user)
+register_job_handler('sync_account', run_sync_job)
+register_job_handler('ingest_insights', run_ingest_job)
+register_job_handler('fill_insights', run_fill_insights_job)
+register_job_handler('refresh_objects', run_refresh_job)
+
+
+
+@routes_bp.route('/api/jobs/<int:job_id>', methods=['GET'])
+@jwt_required()  # Ensure the request has a valid JWT token
+def get_job(job_id):
+    user_id = get_jwt_identity()
+    return one_response(Job.query.filter_by(id=job_id, user_id=user_id), Job, Job.to_dict,
+                        (jsonify({"error": "Job not found"}), 404), allowed=JOB_FIELDS)
+
+
+
+@routes_bp.route('/api/jobs', methods=['GET'])
+@jwt_required()  # Ensure the request has a valid JWT token
+def get_jobs():
+    """List the user's jobs, optionally filtered by `status` (e.g. `dead`) and/or a comma separated `ids` list."""
+    user_id = get_jwt_identity()
+    query = Job.query.filter_by(user_id=user_id)
+
+    status = request.args.get('status')
+    if status:
+        query = query.filter(Job.status.in_(status.split(',')))
+
+    ids = request.args.get('ids')
+    if ids:
+        try:
+            query = query.filter(Job.id.in_([int(job_id) for job_id in ids.split(',')]))
+        except ValueError:
+            return jsonify({"error": "ids must be a comma separated list of job IDs"}), 400
+
+    limit = min(request.args.get('limit', 100, type=int), 500)
+    query, serialize = sparse_query(query, Job, Job.to_dict, allowed=JOB_FIELDS)
+    jobs = query.order_by(Job.id.desc()).limit(limit).all()
+
+    return jsonify([serialize(job) for job in jobs]), 200
+
+
+
+@routes_bp.route('/api/jobs/<int:job_id>/retry', methods=['POST'])
+@jwt_required()  # Ensure the request has a valid JWT token
+def retry_job(job_id):
+    """Put a dead-lettered or failed job back on the queue."""
+    user_id = get_jwt_identity()
+    job = Job.query.filter_by(id=job_id, user_id=user_id).first()
+
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    if job.status not in ('dead', 'failed'):
+        return jsonify({"error": f"Only dead or failed jobs can be retried (job is {job.status})"}), 400
+
+    job.status = 'queued'
+    job.attempts = 0
+    job.error = None
+    job.finished_at = None
+    job.run_after = datetime.utcnow()
+    db.session.commit()
+
+    return jsonify(job.to_dict()), 200
+
+
+def configured_ad_account(ad_account_id):
+    """Return `ad_account_id` without its act_ prefix when it is the configured account, else None.
+
+    Missing values mean the configured account. Syncs and insights read with
+    the server's Meta token, so they may only touch that account.
+    """
+    ad_account_id = str(ad_account_id or AD_ACCOUNT_ID or '')
+    if ad_account_id.startswith('act_'):
+        ad_account_id = ad_account_id[len('act_'):]
+    if not AD_ACCOUNT_ID or ad_account_id != str(AD_ACCOUNT_ID):
+        return None
+    return ad_account_id
+
+
+@routes_bp.route('/api/sync', methods=['POST'])
+@jwt_required()  # Ensure the request has a valid JWT token
+def sync_ad_account():
+    """Queue a sync of the ad account's campaigns, ad sets and ads from Meta into the local database."""
+    user_id = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+
+    ad_account_id = configured_ad_account(data.get('ad_account_id'))
+    if ad_account_id is None:
+        return jsonify({"error": "Syncing is only allowed for the configured ad account"}), 403
+
+    payload = {
+        'ad_account_id': ad_account_id,
+        'full': bool(data.get('full', False)),  # Ignore the high-water marks and rescan everything
+    }
+    # A sync pages through the whole account, so it always runs as a background job
+    return enqueue_job_response('sync_account', user_id, payload)
+
+
+
+@routes_bp.route('/api/sync', methods=['GET'])
+@jwt_required()  # Ensure the request has a valid JWT token
+def get_sync_state():
+    user_id = get_jwt_identity()
+    query, serialize = sparse_query(SyncState.query.filter_by(user_id=user_id), SyncState, SyncState.to_dict,
+                                    allowed=SYNC_STATE_FIELDS)
+
+    return jsonify([serialize(state) for state in query]), 200
+
+
+
+@routes_bp.route('/api/insights/ingest', methods=['POST'])
+@jwt_required()  # Ensure the request has a valid JWT token
+def ingest_insights_route():
+    """Queue an async insights report run for an account, level and date range."""
+    user_id = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+
+    level = data.get('level', 'ad')
+    if level not in INSIGHTS_LEVELS:
+        return jsonify({"error": f"level must be one of {', '.join(INSIGHTS_LEVELS)}"}), 400
+
+    try:
+        since = datetime.strptime(data.get('since', ''), '%Y-%m-%d').date()
+        until = datetime.strptime(data.get('until', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({"error": "since and until are required, as YYYY-MM-DD"}), 400
+    if since > until:
+        return jsonify({"error": "since must not be after until"}), 400
+    ad_account_id = configured_ad_account(data.get('ad_account_id'))
+    if ad_account_id is None:
+        return jsonify({"error": "Insights are only available for the configured ad account"}), 403
+
+    payload = {
+        'ad_account_id': ad_account_id,
+        'level': level,
+        'since': since.isoformat(),
+        'until': until.isoformat(),
+    }
+    # Report runs take minutes for large accounts, so this always runs as a background job
+    return enqueue_job_response('ingest_insights', user_id, payload)
+
+
+
+@routes_bp.route('/api/insights/runs', methods=['GET'])
+@jwt_required()  # Ensure the request has a valid JWT token
+def get_insights_runs():
+    user_id = get_jwt_identity()
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    query, serialize = sparse_query(InsightsReportRun.query.filter_by(user_id=user_id), InsightsReportRun,
+                                    InsightsReportRun.to_dict, allowed=REPORT_RUN_FIELDS)
+    runs = query.order_by(InsightsReportRun.id.desc()).limit(limit).all()
+
+    return jsonify([serialize(run) for run in runs]), 200
+
+
+
+def parse_date_range(default_days=None, max_days=None):
+    """Read `since` and `until` (YYYY-MM-DD) from the query string.
+
+    Returns (since, until, error). With `default_days`, missing values mean
+    the last `default_days` days up to today. With `max_days`, longer ranges
+    are an error.
+    """
+    since, until = request.args.get('since'), request.args.get('until')
+    try:
+        until = datetime.strptime(until, '%Y-%m-%d').date() if until else None
+        since = datetime.strptime(since, '%Y-%m-%d').date() if since else None
+    except ValueError:
+        return None, None, "since and until must be dates as YYYY-MM-DD"
+
+    if default_days:
+        until = until or datetime.now(timezone.utc).date()
+        since = since or until - timedelta(days=default_days - 1)
+    if since is None or until is None:
+        return None, None, "since and until are required, as YYYY-MM-DD"
+    if since > until:
+        return None, None, "since must not be after until"
+    if max_days and (until - since).days + 1 > max_days:
+        return None, None, f"since and until must be at most {max_days} days apart"
+    return since, until, None
+
+
+@routes_bp.route('/api/insights/metrics', methods=['GET'])
+@jwt_required()  # Ensure the request has a valid JWT token
+def get_insights_metrics():
+    """Daily values of one metric for a date range, one row per object and one column per day.
+
+    Only the user's own objects are returned; `ids` not owned by the user are dropped.
+    """
+    current_user_id = get_jwt_identity()
+    level = request.args.get('level', 'ad')
+    metric = request.args.get('metric', 'spend')
+    if level not in METRICS_LEVELS:
+        return jsonify({"error": f"level must be one of {', '.join(METRICS_LEVELS)}"}), 400
+    if metric not in METRICS:
+        return jsonify({"error": f"metric must be one of {', '.join(METRICS)}"}), 400
+
+    since, until, error = parse_date_range()
+    if error:
+        return jsonify({"error": error}), 400
+
+    ids = request.args.get('ids')
+    object_ids = owned_object_ids(current_user_id, level, ids.split(',') if ids else None)
+    object_ids, values = get_metrics_store().query(level, metric, since, until, object_ids=object_ids)
+
+    return jsonify({
+        "level": level,
+        "metric": metric,
+        "dates": [day.isoformat() for day in get_metrics_store().dates(since, until)],
+        "object_ids": object_ids,
+        "values": values.tolist(),
+    }), 200
+
+
+@routes_bp.route('/api/rollups', methods=['GET'])
+@jwt_required()  # Ensure the request has a valid JWT token
+def get_rollups():
+    """The user's campaign -> ad set -> ad tree with spend, CTR, CPC and CPA at every level.
+
+    Defaults to the last 30 days when `since`/`until` are not given.
+    """
+    current_user_id = get_jwt_identity()
+    since, until, error = parse_date_range(default_days=30)
+    if error:
+        return jsonify({"error": error}), 400
+    return jsonify(rollup_tree(current_user_id, since, until)), 200
+
+
+@routes_bp.route('/api/insights', methods=['GET'])
+@jwt_required()  # Ensure the request has a valid JWT token
+def get_insights():
+    """Daily metrics for a level and date range, fetching from Meta only the days not cached yet.
+
+    When every day is cached (final, or fetched recently) the data is returned
+    right away. Otherwise a background job fetches just the missing days and
+    the response is 202 with its status URL; repeat the request once it is done.
+    """
+    user_id = get_jwt_identity()
+    level = request.args.get('level', 'ad')
+    if level not in METRICS_LEVELS:
+        return jsonify({"error": f"level must be one of {', '.join(METRICS_LEVELS)}"}), 400
+    since, until, error = parse_date_range(default_days=7, max_days=max_range_days())
+    if error:
+        return jsonify({"error": error}), 400
+    ad_account_id = configured_ad_account(request.args.get('ad_account_id'))
+    if ad_account_id is None:
+        return jsonify({"error": "Insights are only available for the configured ad account"}), 403
+
+    missing = missing_days(ad_account_id, level, since, until)
+    if missing:
+        payload = {
+            'ad_account_id': ad_account_id,
+            'level': level,
+            'since': missing[0].isoformat(),
+            'until': missing[-1].isoformat(),
+        }
+        # Overlapping requests share one pending fill instead of queueing duplicates
+        pending = Job.query.filter(
+            Job.user_id == user_id, Job.kind == 'fill_insights', Job.status.in_(('queued', 'running'))
+        ).all()
+        for job in pending:
+            if job.payload == payload:
+                return job_accepted_response(job)
+        return enqueue_job_response('fill_insights', user_id, payload)
+
+    ids = request.args.get('ids')
+    result = cached_insights(user_id, level, since, until, object_ids=ids.split(',') if ids else None)
+    return jsonify({
+        "level": level,
+        "dates": [day.isoformat() for day in result["dates"]],
+        "object_ids": result["object_ids"],
+        "metrics": {metric: matrix.tolist() for metric, matrix in result["metrics"].items()},
+    }), 200
+
+
+@routes_bp.route('/api/webhooks/meta', methods=['GET'])
+def verify_meta_webhook():
+    """Meta's subscription handshake: echo hub.challenge when the verify token matches."""
+    verify_token = current_app.config.get('META_WEBHOOK_VERIFY_TOKEN')
+    if (request.args.get('hub.mode') == 'subscribe' and verify_token
+            and hmac.compare_digest(request.args.get('hub.verify_token', ''), verify_token)):
+        return request.args.get('hub.challenge', ''), 200, {'Content-Type': 'text/plain'}
+    return jsonify({"error": "Verification failed"}), 403
+
+
+@routes_bp.route('/api/webhooks/meta', methods=['POST'])
+def receive_meta_webhook():
+    """Record ad object change notifications; the refresh itself runs as a background job."""
+    body = request.get_data()
+    if not verify_signature(body, request.headers.get('X-Hub-Signature-256'), current_app.config.get('META_APP_SECRET')):
+        logger.warning("Rejected Meta webhook with a missing or invalid signature")
+        return jsonify({"error": "Invalid signature"}), 403
+
+    try:
+        payload = json.loads(body or b'{}')
+    except ValueError:
+        return jsonify({"error": "Invalid JSON"}), 400
+
+    recorded = record_changes(parse_changes(payload))
+    # Always 200 for signed payloads, or Meta keeps redelivering them
+    return jsonify({"message": "Received", "recorded": recorded}), 200
+
+
+@routes_bp.route('/api/ready', methods=['GET'])
+def ready():
+    """Readiness probe: 503 while this worker drains before exiting or when the database is unreachable."""
+    if app.config.get('SERVE_DRAINING'):
+        return jsonify({"status": "draining"}), 503
+    try:
+        db.session.execute(text('SELECT 1'))
+    except Exception:
+        return jsonify({"status": "database unavailable"}), 503
+    return jsonify({"status": "ready"}), 200
+
+
+@routes_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics of every worker process. Requires `Authorization: Bearer <METRICS_TOKEN>` when that is set."""
+    token = os.getenv("METRICS_TOKEN")
+    if token:
+        scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+        if scheme != 'Bearer' or not hmac.compare_digest(credentials.strip().encode(), token.encode()):
+            return jsonify({"error": "Unauthorized"}), 401
+    return Response(metrics.render_metrics(), content_type=metrics.CONTENT_TYPE)
+
+
+@routes_bp.route('/api/cache/stats', methods=['GET'])
+@jwt_required()  # Ensure the request has a valid JWT token
+def get_cache_stats():
+    """Hit, miss and eviction counters of this process's response cache and of the shared one."""
+    cache, shared = get_response_cache(), get_shared_cache()
+    return jsonify({
+        "local": cache.stats() if cache is not None else {"enabled": False},
+        "shared": shared.stats() if shared is not None else {"enabled": False},
+    }), 200
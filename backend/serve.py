@@ -0,0 +1,451 @@
+import logging
+import multiprocessing
+import os
+import random
+import select
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+from backend import metrics
+from backend.streaming import DETACH_STREAM_ENVIRON
+from backend.structured_logging import configure_logging, flush_logging
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HOST = "0.0.0.0"
+DEFAULT_PORT = 5000
+DEFAULT_THREADS = 8               # Requests each worker process handles at once
+DEFAULT_MAX_REQUESTS = 10000      # Requests before a worker is replaced, 0 for never
+DEFAULT_MAX_REQUESTS_JITTER = 0.1  # Up to this fraction more, so workers are not all replaced at once
+DEFAULT_GRACEFUL_TIMEOUT = 30.0   # Seconds a stopping worker gets to finish its requests
+DEFAULT_KEEPALIVE = 5.0           # Seconds an idle keep-alive connection holds a thread
+DEFAULT_MAX_STREAMS = 32          # Long-lived streams (/api/events) each worker holds on top of its threads
+LISTEN_BACKLOG = 2048
+MIN_WORKER_LIFETIME = 1.0         # Workers dying sooner than this are respawned with a pause
+
+# Handed from a reloading master to the one it execs
+LISTEN_FD_ENV = "SERVE_LISTEN_FD"
+RETIRING_PIDS_ENV = "SERVE_RETIRING_PIDS"
+
+
+def default_workers():
+    return int(os.getenv("SERVE_WORKERS", os.cpu_count() or 2))
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """Werkzeug's WSGI server fed from a shared listening socket into a fixed pool of threads.
+
+    A connection is only accepted while a thread is free to take it, so a
+    busy worker leaves new connections in the kernel's backlog for the
+    other workers instead of queueing them itself.
+
+    A request that will stream for a long time calls
+    `environ[DETACH_STREAM_ENVIRON]()` first: it moves to one of
+    `max_streams` stream slots and frees its thread slot, so open streams
+    never stop the worker from accepting requests. It returns False when
+    every stream slot is taken.
+    """
+
+    multithread = True
+    multiprocess = True
+
+    def __init__(self, app, listener, threads=DEFAULT_THREADS, keepalive=DEFAULT_KEEPALIVE,
+                 max_streams=DEFAULT_MAX_STREAMS):
+        handler = type("RequestHandler", (WSGIRequestHandler,), {"protocol_version": "HTTP/1.1", "timeout": keepalive})
+        host, port = listener.getsockname()[:2]
+        self._app = app
+        super().__init__(host, port, self._with_detach, handler=handler, fd=listener.fileno())
+        self.socket.setblocking(False)
+        self.threads = threads
+        self.max_streams = max_streams
+        self.draining = threading.Event()
+        self._slots = threading.Semaphore(threads)
+        self._stream_slots = threading.Semaphore(max_streams)
+        self._local = threading.local()
+        self._pool = ThreadPoolExecutor(max_workers=threads + max_streams, thread_name_prefix="request")
+
+    def serve(self):
+        """Accept connections until `draining` is set."""
+        while not self.draining.is_set():
+            if not self._slots.acquire(timeout=0.5):
+                continue
+            connection = None
+            try:
+                if select.select([self.socket], [], [], 0.5)[0] and not self.draining.is_set():
+                    connection, address = self.socket.accept()
+            except (BlockingIOError, InterruptedError):
+                pass  # Another worker took it
+            if connection is None:
+                self._slots.release()
+                continue
+            connection.setblocking(True)
+            self._pool.submit(self._handle, connection, address)
+
+    def _handle(self, connection, address):
+        detached = []
+
+        def detach():
+            if not detached:
+                if not self._stream_slots.acquire(blocking=False):
+                    return False
+                detached.append(True)
+                self._slots.release()
+            return True
+
+        self._local.detach = detach
+        try:
+            self.finish_request(connection, address)
+        except Exception:
+            self.handle_error(connection, address)
+        finally:
+            self.shutdown_request(connection)
+            (self._stream_slots if detached else self._slots).release()
+
+    def _with_detach(self, environ, start_response):
+        environ[DETACH_STREAM_ENVIRON] = self._local.detach
+        return self._app(environ, start_response)
+
+    def finish(self, timeout):
+        """Wait up to `timeout` seconds for the requests in progress; True when they all finished."""
+        waiter = threading.Thread(target=self._pool.shutdown, daemon=True)
+        waiter.start()
+        waiter.join(timeout)
+        return not waiter.is_alive()
+
+
+class Arbiter:
+    """The master process: holds the preloaded app and the listening socket, and keeps `workers` children running.
+
+    SIGTERM/SIGINT stop gracefully: workers stop accepting, finish their
+    requests (up to `graceful_timeout`) and exit. SIGHUP reloads: the
+    master execs a fresh copy of itself that inherits the socket, boots
+    new workers from the new code, then retires the old ones, so no
+    connection is refused in between. SIGTTIN/SIGTTOU add or remove a
+    worker.
+    """
+
+    def __init__(self, app, listener, workers, threads=DEFAULT_THREADS, max_requests=DEFAULT_MAX_REQUESTS,
+                 max_requests_jitter=DEFAULT_MAX_REQUESTS_JITTER, graceful_timeout=DEFAULT_GRACEFUL_TIMEOUT,
+                 keepalive=DEFAULT_KEEPALIVE, max_streams=DEFAULT_MAX_STREAMS):
+        self.app = app
+        self.listener = listener
+        self.workers = workers
+        self.threads = threads
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.keepalive = keepalive
+        self.max_streams = max_streams
+        self._children = {}    # pid -> start time
+        self._retiring = set()  # Told to stop, not reaped yet
+        self._stopping_at = None
+        self._reload = False
+
+    def run(self, inherited=()):
+        """Run until stopped; `inherited` are the workers of the master this one was reloaded from."""
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        signal.signal(signal.SIGHUP, self._on_reload)
+        signal.signal(signal.SIGTTIN, lambda *_: self._resize(1))
+        signal.signal(signal.SIGTTOU, lambda *_: self._resize(-1))
+        host, port = self.listener.getsockname()[:2]
+        logger.info(f"Listening on http://{host}:{port} with {self.workers} workers x {self.threads} threads")
+
+        while True:
+            self._reap()
+            if self._stopping_at is not None:
+                if not self._children and not self._retiring:
+                    break
+                if time.monotonic() > self._stopping_at + self.graceful_timeout + 5:
+                    self._signal_all(signal.SIGKILL)
+            elif self._reload:
+                self._reexec()
+            else:
+                while len(self._children) < self.workers:
+                    self._spawn()
+                while len(self._children) > self.workers:
+                    newest = max(self._children, key=self._children.get)
+                    del self._children[newest]
+                    self._retire([newest])
+                if inherited:
+                    # Our own workers are up, so the old master's can go
+                    self._retire(inherited)
+                    inherited = ()
+            time.sleep(0.2)
+        logger.info("All workers stopped")
+
+    def _on_stop(self, signum, frame):
+        if self._stopping_at is None:
+            logger.info(f"Got {signal.Signals(signum).name}, stopping gracefully")
+            self._stopping_at = time.monotonic()
+            self._signal_all(signal.SIGTERM)
+
+    def _on_reload(self, signum, frame):
+        self._reload = True
+
+    def _resize(self, delta):
+        self.workers = max(1, self.workers + delta)
+        logger.info(f"Now running {self.workers} workers")
+
+    def _retire(self, pids):
+        self._retiring.update(pids)
+        self._signal_all(signal.SIGTERM, pids)
+
+    def _signal_all(self, signum, pids=None):
+        for pid in list(pids if pids is not None else (*self._children, *self._retiring)):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                self._retiring.clear()  # Nothing left to wait for
+                return
+            if pid == 0:
+                return
+            self._retiring.discard(pid)
+            started = self._children.pop(pid, None)
+            if started is None or self._stopping_at is not None:
+                continue
+            code = os.waitstatus_to_exitcode(status) if hasattr(os, "waitstatus_to_exitcode") else status
+            if code != 0:
+                logger.warning(f"Worker {pid} exited with {code}")
+            if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                # Crashing on boot: don't fork in a tight loop
+                time.sleep(MIN_WORKER_LIFETIME)
+
+    def _spawn(self):
+        limit = self.max_requests
+        if limit:
+            limit += random.randint(0, int(limit * self.max_requests_jitter))
+        pid = os.fork()
+        if pid:
+            self._children[pid] = time.monotonic()
+            return
+        code = 0
+        try:
+            Worker(self.app, self.listener, self.threads, limit, self.graceful_timeout, self.keepalive,
+                   self.max_streams).run()
+        except BaseException:
+            logger.exception("Worker failed")
+            code = 1
+        finally:
+            flush_logging()
+            # Never fall back into the master's loop; also skips the atexit handlers inherited from it
+            os._exit(code)
+
+    def _reexec(self):
+        self._reload = False
+        logger.info("Reloading: starting a new master that takes over the socket")
+        os.set_inheritable(self.listener.fileno(), True)
+        env = dict(os.environ)
+        env[LISTEN_FD_ENV] = str(self.listener.fileno())
+        env[RETIRING_PIDS_ENV] = ",".join(str(pid) for pid in (*self._children, *self._retiring))
+        try:
+            os.execve(sys.executable, [sys.executable, "-m", "backend.serve"], env)
+        except OSError:
+            logger.exception("Reload failed; keeping the current workers")
+
+
+class Worker:
+    """One forked worker process: serves requests on the shared socket until told to stop or `max_requests` is reached."""
+
+    def __init__(self, app, listener, threads, max_requests, graceful_timeout, keepalive, max_streams):
+        self.app = app
+        self.max_requests = max_requests
+        self.graceful_timeout = graceful_timeout
+        self.server = PooledWSGIServer(self._count_requests(app.wsgi_app), listener, threads, keepalive, max_streams)
+        self._served = 0
+        self._lock = threading.Lock()
+
+    def run(self):
+        signal.signal(signal.SIGTERM, lambda *_: self.drain("stop requested"))
+        signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C reaches the whole group; the master decides
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        for signum in (signal.SIGTTIN, signal.SIGTTOU):
+            signal.signal(signum, signal.SIG_DFL)
+
+        from backend.extensions import db
+        with self.app.app_context():
+            # Pooled connections opened before the fork belong to the master; never use them here
+            db.engine.dispose(close=False)
+
+        self.server.serve()
+        if not self.server.finish(self.graceful_timeout):
+            logger.warning(f"Worker {os.getpid()} still had requests running after {self.graceful_timeout}s")
+
+        from backend.jobs import stop_job_workers
+        from backend.password_hashing import shutdown_password_hasher
+        stop_job_workers(timeout=5)
+        shutdown_password_hasher()
+        # Final counts; the next scrape folds them into the totals of exited workers
+        metrics.write_snapshot()
+
+    def drain(self, reason):
+        if not self.server.draining.is_set():
+            logger.info(f"Worker {os.getpid()} draining after {self._served} requests: {reason}")
+            # /api/ready answers 503 from here on
+            self.app.config["SERVE_DRAINING"] = True
+            self.server.draining.set()
+            # Open /api/events streams end now (their clients reconnect to another worker) instead of
+            # holding the worker until the graceful timeout
+            from backend.events import close_event_streams
+            close_event_streams()
+
+    def _count_requests(self, wsgi_app):
+        def counted(environ, start_response):
+            try:
+                return wsgi_app(environ, start_response)
+            finally:
+                with self._lock:
+                    self._served += 1
+                    recycle = self.max_requests and self._served >= self.max_requests
+                if recycle:
+                    self.drain("max requests reached")
+        return counted
+
+
+def _listen(host, port):
+    inherited = os.environ.pop(LISTEN_FD_ENV, None)
+    if inherited is not None:
+        listener = socket.socket(fileno=int(inherited))
+    else:
+        listener = socket.create_server((host, port), backlog=LISTEN_BACKLOG, reuse_port=False)
+    listener.set_inheritable(False)
+    return listener
+
+
+def main():
+    configure_logging()
+    inherited = [int(pid) for pid in os.environ.pop(RETIRING_PIDS_ENV, "").split(",") if pid]
+    if not inherited:
+        # A fresh start, not a reload: counters start over, as they would with a single process
+        metrics.clear_snapshots()
+    listener = _listen(os.getenv("SERVE_HOST", DEFAULT_HOST), int(os.getenv("SERVE_PORT", DEFAULT_PORT)))
+
+    # Preload: import and configure everything once, before forking, so workers start instantly and share the pages
+    from backend.app import create_app
+    app = create_app()
+
+    Arbiter(
+        app,
+        listener,
+        workers=default_workers(),
+        threads=int(os.getenv("SERVE_THREADS", DEFAULT_THREADS)),
+        max_requests=int(os.getenv("SERVE_MAX_REQUESTS", DEFAULT_MAX_REQUESTS)),
+        max_requests_jitter=float(os.getenv("SERVE_MAX_REQUESTS_JITTER", DEFAULT_MAX_REQUESTS_JITTER)),
+        graceful_timeout=float(os.getenv("SERVE_GRACEFUL_TIMEOUT", DEFAULT_GRACEFUL_TIMEOUT)),
+        keepalive=float(os.getenv("SERVE_KEEPALIVE", DEFAULT_KEEPALIVE)),
+        max_streams=int(os.getenv("SERVE_MAX_STREAMS", DEFAULT_MAX_STREAMS)),
+    ).run(inherited)
+
+
+# ==========================
+# Benchmark: this server against `flask run`
+# ==========================
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _load(url, headers, duration, connections):
+    # Runs in a load generator process: `connections` keep-alive clients hammering `url` for `duration` seconds
+    import http.client
+    from urllib.parse import urlsplit
+
+    target = urlsplit(url)
+    latencies, errors = [], [0]
+    deadline = time.monotonic() + duration
+
+    def client():
+        conn = http.client.HTTPConnection(target.hostname, target.port, timeout=30)
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                conn.request("GET", target.path + (f"?{target.query}" if target.query else ""), headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.status >= 500:
+                    errors[0] += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+            except (OSError, http.client.HTTPException):
+                errors[0] += 1
+                conn.close()
+                conn = http.client.HTTPConnection(target.hostname, target.port, timeout=30)
+
+    threads = [threading.Thread(target=client) for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+def _wait_until_up(url, headers, timeout=30):
+    import urllib.request
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=2):
+                return
+        except Exception:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def benchmark_servers(path, duration=5.0, concurrency=32, headers=None, env=None):
+    """Start `flask run` and `python -m backend.serve` in turn and load `path` on each.
+
+    Returns {server: {"requests_per_second", "p50_ms", "p99_ms", "errors"}}.
+    The load comes from several processes so the client is not the bottleneck.
+    """
+    headers = headers or {}
+    base_env = dict(os.environ, **(env or {}), FLASK_APP="backend.app:create_app", JOB_WORKERS="0")
+    processes = min(concurrency, max(1, (os.cpu_count() or 2) // 2))
+    servers = {
+        "flask run": [sys.executable, "-m", "flask", "run", "--port", "{port}", "--no-reload", "--no-debugger"],
+        "backend.serve": [sys.executable, "-m", "backend.serve"],
+    }
+    results = {}
+    for name, command in servers.items():
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        server = subprocess.Popen(
+            [part.format(port=port) for part in command], cwd=PROJECT_ROOT,
+            env=dict(base_env, SERVE_HOST="127.0.0.1", SERVE_PORT=str(port), LOG_LEVEL="WARNING"),
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            url = f"http://127.0.0.1:{port}{path}"
+            _wait_until_up(url, headers)
+            with multiprocessing.get_context("spawn").Pool(processes) as pool:
+                runs = pool.starmap(
+                    _load, [(url, headers, duration, max(1, concurrency // processes))] * processes
+                )
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+        latencies = sorted(latency for run_latencies, _ in runs for latency in run_latencies)
+        results[name] = {
+            "requests_per_second": round(len(latencies) / duration, 1),
+            "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2) if latencies else None,
+            "p99_ms": round(latencies[int(len(latencies) * 0.99)] * 1000, 2) if latencies else None,
+            "errors": sum(errors for _, errors in runs),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    main()
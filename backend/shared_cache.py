@@ -0,0 +1,337 @@
+import fcntl
+import logging
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+from functools import wraps
+
+logger = logging.getLogger(__name__)
+
+INSTANCE_DIR = os.path.join(os.path.abspath(os.path.dirname(__file__)), "instance")
+DEFAULT_DB_PATH = os.path.join(INSTANCE_DIR, "response_cache.db")
+DEFAULT_BUS_PATH = os.path.join(INSTANCE_DIR, "response_cache.bus")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+DEFAULT_MAX_ENTRIES = 20000
+DEFAULT_TTL = 300  # Seconds
+
+BUS_SLOTS = 4096        # Invalidations a reader can fall behind by before it has to drop everything
+PRUNE_EVERY = 64        # Stores between size checks
+TOUCH_INTERVAL = 1.0    # Seconds between LRU timestamp updates of the same entry
+
+_WORD = struct.Struct("<Q")
+
+
+class InvalidationBus:
+    """Broadcasts invalidated user IDs to every process on the host through a memory-mapped ring.
+
+    Word 0 of the file is a sequence number (the count of IDs ever
+    published); word 1 + n % BUS_SLOTS holds the n-th one, tagged with the
+    publishing process's PID in its high 32 bits. Publishers take an flock;
+    readers never lock and just compare the sequence number with the last
+    one they saw, so checking for news costs one memory read. flock only
+    excludes other open files, so publishing threads of one process also
+    take a thread lock.
+    """
+
+    def __init__(self, path=DEFAULT_BUS_PATH, slots=BUS_SLOTS):
+        self.path = path
+        self.slots = slots
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = _WORD.size * (slots + 1)
+        self._file = open(path, "a+b")
+        self._publish_lock = threading.Lock()
+        with self._locked():
+            if os.fstat(self._file.fileno()).st_size < size:
+                self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._seen = self.sequence()
+        self._seen_lock = threading.Lock()
+
+    def _locked(self):
+        return _FileLock(self._file, self._publish_lock)
+
+    def sequence(self):
+        return _WORD.unpack_from(self._map, 0)[0]
+
+    def publish(self, user_ids):
+        origin = (os.getpid() & 0xFFFFFFFF) << 32
+        with self._locked():
+            sequence = self.sequence()
+            for user_id in user_ids:
+                _WORD.pack_into(self._map, _WORD.size * (1 + sequence % self.slots), origin | int(user_id))
+                sequence += 1
+            # The IDs are in place before the new sequence number makes them visible
+            _WORD.pack_into(self._map, 0, sequence)
+
+    def read(self, since):
+        """Return (sequence, entries) with the (pid, user_id) entries published after `since`.
+
+        `entries` is None when more than a ring's worth was published since,
+        so the caller can no longer tell which users changed.
+        """
+        sequence = self.sequence()
+        if sequence == since:
+            return sequence, []
+        if sequence - since > self.slots:
+            return sequence, None
+        words = [_WORD.unpack_from(self._map, _WORD.size * (1 + n % self.slots))[0] for n in range(since, sequence)]
+        # A publisher may have lapped us while we were reading
+        if self.sequence() - since > self.slots:
+            return sequence, None
+        return sequence, [(word >> 32, word & 0xFFFFFFFF) for word in words]
+
+    def poll(self):
+        """Return the user IDs published since the last poll, or None if too many were missed to tell."""
+        if self.sequence() == self._seen:
+            return set()
+        with self._seen_lock:
+            self._seen, entries = self.read(self._seen)
+        return None if entries is None else {user_id for _, user_id in entries}
+
+
+class _FileLock:
+    # Threads sharing one open file all hold its flock at once, so `thread_lock` serializes them first
+    def __init__(self, file, thread_lock):
+        self.file = file
+        self.thread_lock = thread_lock
+
+    def __enter__(self):
+        self.thread_lock.acquire()
+        try:
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        except BaseException:
+            self.thread_lock.release()
+            raise
+
+    def __exit__(self, *exc):
+        try:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        finally:
+            self.thread_lock.release()
+
+
+def _fail_soft(default=None):
+    """A SQLite error ("database is locked", disk full) in the decorated method is logged and `default` returned.
+
+    The cache is an optimization: failing must never fail the request, and
+    the version check already keeps entries that missed an invalidation
+    from being served.
+    """
+    def decorate(method):
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            try:
+                return method(self, *args, **kwargs)
+            except sqlite3.Error as e:
+                self._count("errors")
+                logger.warning(f"Shared response cache {method.__name__} failed: {e}")
+                return default
+        return wrapper
+    return decorate
+
+
+class SharedResponseCache:
+    """Response bodies shared by every worker process on the host, stored in SQLite.
+
+    Same contract as `ResponseCache`: entries are keyed per user, carry the
+    data version they were rendered at, and expire after `ttl` seconds. The
+    least recently used entries are pruned once the total size or count
+    passes its limit.
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH, max_bytes=DEFAULT_MAX_BYTES, max_entries=DEFAULT_MAX_ENTRIES,
+                 ttl=DEFAULT_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        self._stores = 0
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0, "invalidations": 0,
+                       "errors": 0}
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS response_cache ("
+            " key TEXT PRIMARY KEY,"
+            " user_id INTEGER NOT NULL,"
+            " version INTEGER NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " mimetype TEXT NOT NULL,"
+            " body BLOB NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_response_cache_user_id ON response_cache (user_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS ix_response_cache_accessed_at ON response_cache (accessed_at)")
+
+    def _connect(self):
+        # One connection per thread and per process (connections must not cross a fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")  # It's a cache: losing it in a crash is fine
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _count(self, stat, n=1):
+        with self._stats_lock:
+            self._stats[stat] += n
+
+    @staticmethod
+    def _key(key):
+        return "\x1f".join(str(part) for part in key)
+
+    def get(self, key, version):
+        """Return (body, mimetype) for `key` at `version`, or None (also when the cache cannot be read)."""
+        try:
+            return self._get(key, version)
+        except sqlite3.Error as e:
+            self._count("errors")
+            self._count("misses")
+            logger.warning(f"Shared response cache get failed: {e}")
+            return None
+
+    def _get(self, key, version):
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT version, expires_at, accessed_at, body, mimetype FROM response_cache WHERE key = ?",
+            (self._key(key),),
+        ).fetchone()
+        now = time.time()
+        if row is None:
+            self._count("misses")
+            return None
+        if row[0] != version or row[1] <= now:
+            conn.execute("DELETE FROM response_cache WHERE key = ?", (self._key(key),))
+            self._count("invalidations" if row[0] != version else "expirations")
+            self._count("misses")
+            return None
+        if now - row[2] > TOUCH_INTERVAL:
+            conn.execute("UPDATE response_cache SET accessed_at = ? WHERE key = ?", (now, self._key(key)))
+        self._count("hits")
+        return bytes(row[3]), row[4]
+
+    @_fail_soft()
+    def set(self, key, version, body, mimetype):
+        if len(body) > self.max_bytes:
+            return
+        now = time.time()
+        conn = self._connect()
+        conn.execute(
+            "INSERT OR REPLACE INTO response_cache (key, user_id, version, expires_at, accessed_at, size, mimetype, body)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (self._key(key), int(key[0]), version, now + self.ttl, now, len(body), mimetype, body),
+        )
+        self._count("stores")
+        with self._stats_lock:
+            self._stores += 1
+            prune = self._stores % PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    @_fail_soft()
+    def prune(self):
+        """Drop expired entries, then the least recently used ones past the size and count limits."""
+        conn = self._connect()
+        expired = conn.execute("DELETE FROM response_cache WHERE expires_at <= ?", (time.time(),)).rowcount
+        evicted = conn.execute(
+            "DELETE FROM response_cache WHERE key IN ("
+            " SELECT key FROM ("
+            "  SELECT key, SUM(size) OVER w AS running, ROW_NUMBER() OVER w AS position FROM response_cache"
+            "  WINDOW w AS (ORDER BY accessed_at DESC ROWS UNBOUNDED PRECEDING))"
+            " WHERE running > ? OR position > ?)",
+            (self.max_bytes, self.max_entries),
+        ).rowcount
+        self._count("expirations", expired)
+        self._count("evictions", evicted)
+
+    @_fail_soft()
+    def invalidate_users(self, user_ids):
+        user_ids = [int(user_id) for user_id in user_ids]
+        if not user_ids:
+            return
+        deleted = self._connect().execute(
+            f"DELETE FROM response_cache WHERE user_id IN ({','.join('?' * len(user_ids))})", user_ids
+        ).rowcount
+        self._count("invalidations", deleted)
+
+    @_fail_soft()
+    def clear(self):
+        self._connect().execute("DELETE FROM response_cache")
+
+    def stats(self):
+        try:
+            entries, size = self._connect().execute("SELECT COUNT(*), TOTAL(size) FROM response_cache").fetchone()
+            size = int(size)
+        except sqlite3.Error as e:
+            logger.warning(f"Shared response cache stats failed: {e}")
+            entries = size = None
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        return {
+            **stats,
+            "hit_ratio": stats["hits"] / lookups if lookups else None,
+            "entries": entries,
+            "bytes": size,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+        }
+
+
+_shared = None
+_bus = None
+_shared_lock = threading.Lock()
+
+
+def shared_cache_enabled():
+    return os.getenv("RESPONSE_CACHE_SHARED", "true").lower() in ("1", "true", "yes")
+
+
+def get_shared_cache():
+    """Return the SharedResponseCache, or None when RESPONSE_CACHE_SHARED is false."""
+    global _shared
+
+    if _shared is None:
+        if not shared_cache_enabled():
+            return None
+        with _shared_lock:
+            if _shared is None:
+                try:
+                    _shared = SharedResponseCache(
+                        path=os.getenv("RESPONSE_CACHE_DB", DEFAULT_DB_PATH),
+                        max_bytes=int(os.getenv("RESPONSE_CACHE_SHARED_MAX_BYTES", DEFAULT_MAX_BYTES)),
+                        max_entries=int(os.getenv("RESPONSE_CACHE_SHARED_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+                        ttl=float(os.getenv("RESPONSE_CACHE_TTL", DEFAULT_TTL)),
+                    )
+                except (sqlite3.Error, OSError) as e:
+                    # Serve without it for now; the next call tries again
+                    logger.warning(f"Shared response cache unavailable: {e}")
+                    return None
+    return _shared
+
+
+def get_invalidation_bus():
+    """Return the process-wide InvalidationBus, or None when RESPONSE_CACHE_SHARED is false."""
+    global _bus
+
+    if _bus is None:
+        if not shared_cache_enabled():
+            return None
+        with _shared_lock:
+            if _bus is None:
+                try:
+                    _bus = InvalidationBus(os.getenv("RESPONSE_CACHE_BUS", DEFAULT_BUS_PATH))
+                except OSError as e:
+                    logger.warning(f"Response cache invalidation bus unavailable: {e}")
+                    return None
+    return _bus
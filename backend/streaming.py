@@ -0,0 +1,4 @@
+# Shared by the server (backend/serve.py) and the routes it serves, without either importing the other
+
+# WSGI environ key of a callable that turns the current request into a stream (see serve.PooledWSGIServer)
+DETACH_STREAM_ENVIRON = "backend.serve.detach_stream"
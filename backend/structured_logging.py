@@ -0,0 +1,241 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import traceback
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+
+DEFAULT_LEVEL = "INFO"
+DEFAULT_QUEUE_SIZE = 10000  # Records waiting for the writer thread before new ones are dropped
+REQUEST_ID_HEADER = "X-Request-ID"
+REDACTED = "[REDACTED]"
+_ANSI_ESCAPE = re.compile(r"\x1b\[[0-9;]*m")  # werkzeug colors its access log lines
+
+# Attributes every LogRecord has; anything else was passed with `extra=` and goes into the JSON record
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "request_id"}
+
+# Secrets by shape: key=value and "key": "value" pairs with a secret-looking key, bearer tokens,
+# Meta access tokens (EAA...) and JWTs
+_SECRET_PATTERNS = [
+    (re.compile(r"""((?:access_token|client_secret|app_secret|password|_password|secret|token)['"]?\s*[:=]\s*['"]?)"""
+                r"""[^'"&\s,}]+""", re.IGNORECASE), r"\1" + REDACTED),
+    (re.compile(r"(Bearer\s+)[A-Za-z0-9\-._~+/]+=*", re.IGNORECASE), r"\1" + REDACTED),
+    (re.compile(r"\bEAA[A-Za-z0-9]{20,}"), REDACTED),
+    (re.compile(r"\beyJ[A-Za-z0-9_-]+\.[A-Za-z0-9_-]+\.[A-Za-z0-9_-]*"), REDACTED),
+]
+# Secrets by value, whatever they are next to
+_SECRET_SETTINGS = ("META_ACCESS_TOKEN", "META_APP_SECRET", "JWT_SECRET_KEY", "SECRET_KEY", "META_WEBHOOK_VERIFY_TOKEN")
+
+
+def redact(text):
+    """`text` with access tokens, passwords and other secrets replaced by [REDACTED]."""
+    for setting in _SECRET_SETTINGS:
+        value = os.getenv(setting)
+        if value and len(value) >= 8 and value in text:
+            text = text.replace(value, REDACTED)
+    for pattern, replacement in _SECRET_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _parse_pairs(value):
+    # "name=value,name=value" -> {name: value}
+    pairs = {}
+    for item in filter(None, (part.strip() for part in (value or "").split(","))):
+        name, _, setting = item.partition("=")
+        pairs[name.strip()] = setting.strip()
+    return pairs
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request ID, process, any `extra=` fields and the traceback."""
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": redact(_ANSI_ESCAPE.sub("", record.getMessage())),
+            "request_id": getattr(record, "request_id", None),
+            "pid": record.process,
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = redact(value) if isinstance(value, str) else value
+        if record.exc_info:
+            entry["exception"] = redact("".join(traceback.format_exception(*record.exc_info)))
+        elif record.exc_text:
+            entry["exception"] = redact(record.exc_text)
+        # Redacted field by field: secrets inside the encoded JSON would have their quotes escaped
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s [%(process)d] %(levelname)s %(name)s [%(request_id)s]: %(message)s")
+
+    def format(self, record):
+        record.request_id = getattr(record, "request_id", None) or "-"
+        return redact(super().format(record))
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of the records below WARNING: `rates` per logger (and its children), `debug_rate` for other DEBUG records."""
+
+    def __init__(self, rates=None, debug_rate=1.0):
+        super().__init__()
+        self.rates = rates or {}
+        self.debug_rate = debug_rate
+        self._cache = {}
+
+    def _rate(self, record):
+        rate = self._cache.get((record.name, record.levelno))
+        if rate is None:
+            rate = self.debug_rate if record.levelno <= logging.DEBUG else 1.0
+            name = record.name
+            while name:
+                if name in self.rates:
+                    rate = self.rates[name]
+                    break
+                name = name.rpartition(".")[0]
+            self._cache[(record.name, record.levelno)] = rate
+        return rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record)
+        return rate >= 1.0 or random.random() < rate
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the writer thread; never blocks the caller, dropping records when the queue is full.
+
+    Only what must be captured in the calling thread happens here: the
+    message is rendered (its arguments may change later) and the request ID
+    is attached. Formatting, redaction and I/O happen in the writer thread.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        record.request_id = current_request_id()
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            # Tracebacks reference frames that keep changing; render it now
+            record.exc_text = "".join(traceback.format_exception(*record.exc_info))
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def current_request_id():
+    if has_request_context():
+        return g.get("request_id")
+    return None
+
+
+_handler = None
+_listener = None
+_lock = threading.Lock()
+
+
+def _output_handler():
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(TextFormatter() if os.getenv("LOG_FORMAT", "json").lower() == "text" else JsonFormatter())
+    return output
+
+
+def _start_listener():
+    # Caller holds the lock
+    global _listener
+    log_queue = queue.Queue(int(os.getenv("LOG_QUEUE_SIZE", DEFAULT_QUEUE_SIZE)))
+    _handler.queue = log_queue
+    _listener = QueueListener(log_queue, _output_handler(), respect_handler_level=False)
+    _listener.start()
+
+
+def configure_logging():
+    """Send every log record through a bounded queue to a writer thread that prints it to stdout.
+
+    Levels: LOG_LEVEL for the root logger, LOG_LEVELS ("werkzeug=WARNING,
+    backend.graph_client=DEBUG") per logger. Sampling: LOG_SAMPLE_RATES
+    ("backend.routes=0.1") keeps that fraction of a logger's DEBUG and INFO
+    records, LOG_DEBUG_SAMPLE_RATE that of every other DEBUG record.
+    LOG_FORMAT is json (the default) or text. Safe to call more than once.
+    """
+    global _handler
+
+    with _lock:
+        root = logging.getLogger()
+        root.setLevel(os.getenv("LOG_LEVEL", DEFAULT_LEVEL).upper())
+        for name, level in _parse_pairs(os.getenv("LOG_LEVELS")).items():
+            logging.getLogger(name).setLevel(level.upper())
+        if _handler is not None:
+            return
+
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        _handler = NonBlockingQueueHandler(None)
+        _handler.addFilter(SamplingFilter(
+            {name: float(rate) for name, rate in _parse_pairs(os.getenv("LOG_SAMPLE_RATES")).items()},
+            debug_rate=float(os.getenv("LOG_DEBUG_SAMPLE_RATE", 1.0)),
+        ))
+        _start_listener()
+        root.addHandler(_handler)
+
+
+def flush_logging():
+    """Write out every queued record and stop the writer thread (at exit)."""
+    global _listener
+
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def register_request_ids(app):
+    """Give every request an ID (the client's X-Request-ID if it sent a sane one), log it with each record, and echo it back."""
+
+    @app.before_request
+    def assign_request_id():
+        incoming = request.headers.get(REQUEST_ID_HEADER, "")
+        g.request_id = incoming if re.fullmatch(r"[A-Za-z0-9._-]{1,64}", incoming) else uuid.uuid4().hex
+
+    @app.after_request
+    def echo_request_id(response):
+        if "request_id" in g:
+            response.headers[REQUEST_ID_HEADER] = g.request_id
+        return response
+
+
+def _restart_after_fork():
+    # The writer thread does not survive fork(), and the old queue's lock may be held; start over
+    global _lock
+    _lock = threading.Lock()
+    if _handler is not None:
+        _start_listener()
+
+
+atexit.register(flush_logging)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
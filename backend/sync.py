@@ -0,0 +1,285 @@
+import json
+import logging
+import os
+from datetime import datetime
+
+from backend.extensions import db
+from backend.graph_client import GRAPH_API_URL
+from backend.models import Campaign, AdGroup, Ad, SyncState
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 500        # Objects per Graph page
+CHUNK_SIZE = 500       # Objects upserted per commit
+# Re-read a little before the high-water mark so objects updated in the same
+# second as the last sync are not missed; upserts are idempotent
+HIGH_WATER_OVERLAP = 60
+
+# Only the fields our models store (plus updated_time for the high-water mark)
+CAMPAIGN_FIELDS = ["id", "name", "objective", "status", "special_ad_categories", "updated_time"]
+AD_SET_FIELDS = [
+    "id", "name", "status", "campaign_id", "daily_budget", "billing_event", "bid_strategy", "bid_amount",
+    "bid_constraints", "optimization_goal", "targeting", "updated_time",
+]
+AD_FIELDS = ["id", "name", "status", "adset_id", "creative{id}", "updated_time"]
+
+
+class SyncError(Exception):
+    """Raised when Meta returns an error while paging through an ad account."""
+
+
+def _updated_timestamp(row):
+    # Meta sends updated_time as e.g. 2025-03-04T20:13:25+0000
+    value = row.get("updated_time")
+    if not value:
+        return None
+    try:
+        return int(datetime.strptime(value, "%Y-%m-%dT%H:%M:%S%z").timestamp())
+    except ValueError:
+        return None
+
+
+def iter_objects(ad_account_id, edge, fields, since=None, access_token=None):
+    """Yield every object on an ad account edge, following Graph cursor paging.
+
+    With `since` (unix seconds) only objects updated after it are requested.
+    """
+    from backend.routes import make_meta_api_request  # Avoid a circular import
+
+    params = {
+        "fields": ",".join(fields),
+        "limit": PAGE_SIZE,
+        "access_token": access_token or os.getenv("META_ACCESS_TOKEN"),
+    }
+    if since:
+        params["filtering"] = json.dumps([{"field": "updated_time", "operator": "GREATER_THAN", "value": since}])
+
+    url = f"{GRAPH_API_URL}/act_{ad_account_id}/{edge}"
+    while True:
+        data = make_meta_api_request(url, params, method="GET")
+        if "error" in data:
+            raise SyncError(f"Error reading {edge} for act_{ad_account_id}: {data['error']}")
+
+        for row in data.get("data", []):
+            yield row
+
+        paging = data.get("paging", {})
+        after = paging.get("cursors", {}).get("after")
+        if not paging.get("next") or not after:
+            break
+        params["after"] = after
+
+
+def _chunks(rows, size=CHUNK_SIZE):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _to_float(value):
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _owned_elsewhere(user_id, model, meta_id_column, rows):
+    # Meta IDs in `rows` that another user's rows already carry; those rows are never touched
+    other = {
+        meta_id for meta_id, in db.session.query(meta_id_column)
+        .filter(meta_id_column.in_([row["id"] for row in rows]), model.user_id != user_id)
+    }
+    if other:
+        logger.warning(f"Skipping {len(other)} {model.__tablename__} of user {user_id} that belong to another user")
+    return other
+
+
+def upsert_campaigns(user_id, rows):
+    """Insert or update the user's Campaign rows from Meta campaign objects; commits once."""
+    existing = {
+        c.meta_campaign_id: c
+        for c in Campaign.query.filter(Campaign.meta_campaign_id.in_([row["id"] for row in rows]),
+                                       Campaign.user_id == user_id)
+    }
+    owned_elsewhere = _owned_elsewhere(user_id, Campaign, Campaign.meta_campaign_id, rows)
+    stats = {"created": 0, "updated": 0, "skipped": 0, "conflicts": 0}
+    for row in rows:
+        if row["id"] in owned_elsewhere:
+            stats["conflicts"] += 1
+            continue
+        categories = row.get("special_ad_categories") or []
+        values = {
+            "name": row.get("name"),
+            "objective": row.get("objective"),
+            "status": row.get("status"),
+            "special_ad_categories": ",".join(categories) if categories else "NONE",
+        }
+        campaign = existing.get(row["id"])
+        if campaign is None:
+            db.session.add(Campaign(user_id=user_id, meta_campaign_id=row["id"], **values))
+            stats["created"] += 1
+        else:
+            for key, value in values.items():
+                setattr(campaign, key, value)
+            stats["updated"] += 1
+    db.session.commit()
+    return stats
+
+
+def upsert_ad_groups(user_id, rows):
+    """Insert or update the user's AdGroup rows from Meta ad set objects; commits once.
+
+    Ad sets whose campaign is not among the user's local campaigns are skipped.
+    """
+    campaign_ids = dict(
+        db.session.query(Campaign.meta_campaign_id, Campaign.id)
+        .filter(Campaign.meta_campaign_id.in_({row.get("campaign_id") for row in rows}), Campaign.user_id == user_id)
+    )
+    existing = {
+        ag.meta_ad_group_id: ag
+        for ag in AdGroup.query.filter(AdGroup.meta_ad_group_id.in_([row["id"] for row in rows]),
+                                       AdGroup.user_id == user_id)
+    }
+    owned_elsewhere = _owned_elsewhere(user_id, AdGroup, AdGroup.meta_ad_group_id, rows)
+    stats = {"created": 0, "updated": 0, "skipped": 0, "conflicts": 0}
+    for row in rows:
+        if row["id"] in owned_elsewhere:
+            stats["conflicts"] += 1
+            continue
+        campaign_id = campaign_ids.get(row.get("campaign_id"))
+        if campaign_id is None:
+            stats["skipped"] += 1
+            continue
+
+        targeting = row.get("targeting") or {}
+        values = {
+            "name": row.get("name"),
+            "status": row.get("status"),
+            # Lifetime-budget ad sets have no daily budget
+            "daily_budget": _to_float(row.get("daily_budget")) or 0.0,
+            "billing_event": row.get("billing_event"),
+            "bid_strategy": row.get("bid_strategy"),
+            "bid_amount": _to_float(row.get("bid_amount")),
+            "roas_average_floor": _to_float((row.get("bid_constraints") or {}).get("roas_average_floor")),
+            "optimization_goal": row.get("optimization_goal"),
+            "targeting": targeting,
+            "countries": targeting.get("geo_locations", {}).get("countries", []),
+            "campaign_id": campaign_id,
+        }
+        ad_group = existing.get(row["id"])
+        if ad_group is None:
+            db.session.add(AdGroup(user_id=user_id, meta_ad_group_id=row["id"], **values))
+            stats["created"] += 1
+        else:
+            for key, value in values.items():
+                setattr(ad_group, key, value)
+            stats["updated"] += 1
+    db.session.commit()
+    return stats
+
+
+def upsert_ads(user_id, rows):
+    """Insert or update the user's Ad rows from Meta ad objects; commits once.
+
+    Ads whose ad set is not among the user's local ad sets are skipped.
+    """
+    ad_group_ids = dict(
+        db.session.query(AdGroup.meta_ad_group_id, AdGroup.id)
+        .filter(AdGroup.meta_ad_group_id.in_({row.get("adset_id") for row in rows}), AdGroup.user_id == user_id)
+    )
+    existing = {
+        ad.meta_ad_id: ad
+        for ad in Ad.query.filter(Ad.meta_ad_id.in_([row["id"] for row in rows]), Ad.user_id == user_id)
+    }
+    owned_elsewhere = _owned_elsewhere(user_id, Ad, Ad.meta_ad_id, rows)
+    stats = {"created": 0, "updated": 0, "skipped": 0, "conflicts": 0}
+    for row in rows:
+        if row["id"] in owned_elsewhere:
+            stats["conflicts"] += 1
+            continue
+        ad_group_id = ad_group_ids.get(row.get("adset_id"))
+        if ad_group_id is None:
+            stats["skipped"] += 1
+            continue
+
+        values = {
+            "name": row.get("name"),
+            "status": row.get("status"),
+            "ad_group_id": ad_group_id,
+            "meta_creative_id": (row.get("creative") or {}).get("id"),
+        }
+        ad = existing.get(row["id"])
+        if ad is None:
+            db.session.add(Ad(user_id=user_id, meta_ad_id=row["id"], **values))
+            stats["created"] += 1
+        else:
+            for key, value in values.items():
+                setattr(ad, key, value)
+            stats["updated"] += 1
+    db.session.commit()
+    return stats
+
+
+# Parents first, so children can be linked to local rows
+SYNC_PLAN = [
+    ("campaigns", CAMPAIGN_FIELDS, upsert_campaigns),
+    ("adsets", AD_SET_FIELDS, upsert_ad_groups),
+    ("ads", AD_FIELDS, upsert_ads),
+]
+
+
+def sync_account(user_id, ad_account_id=None, full=False, access_token=None):
+    """Mirror an ad account's campaigns, ad sets and ads into the local tables.
+
+    Each object type keeps its own high-water mark, so reruns only fetch what
+    changed since the last successful sync. `full=True` ignores the marks.
+    Returns per-object-type stats.
+    """
+    ad_account_id = str(ad_account_id or os.getenv("AD_ACCOUNT_ID"))
+    results = {}
+
+    for edge, fields, upsert in SYNC_PLAN:
+        state = SyncState.query.filter_by(user_id=user_id, ad_account_id=ad_account_id, object_type=edge).first()
+        if state is None:
+            state = SyncState(user_id=user_id, ad_account_id=ad_account_id, object_type=edge)
+            db.session.add(state)
+            db.session.commit()
+
+        since = None if full or not state.high_water_mark else state.high_water_mark - HIGH_WATER_OVERLAP
+        high_water_mark = state.high_water_mark
+        stats = {"fetched": 0, "created": 0, "updated": 0, "skipped": 0, "conflicts": 0}
+
+        for chunk in _chunks(iter_objects(ad_account_id, edge, fields, since=since, access_token=access_token)):
+            chunk_stats = upsert(user_id, chunk)
+            stats["fetched"] += len(chunk)
+            for key, value in chunk_stats.items():
+                stats[key] += value
+            timestamps = [ts for ts in map(_updated_timestamp, chunk) if ts]
+            if timestamps:
+                high_water_mark = max(high_water_mark or 0, max(timestamps))
+
+        # Only advance the mark once the whole edge was read; an interrupted run starts over
+        state.high_water_mark = high_water_mark
+        state.last_synced_at = datetime.utcnow()
+        state.last_stats = stats
+        db.session.commit()
+
+        logger.info(f"Synced {edge} for act_{ad_account_id}: {stats}")
+        results[edge] = stats
+
+    return results
+
+
+def run_sync_job(user_id, data):
+    """Job handler for `sync_account`. Returns (response_body, status_code)."""
+    try:
+        results = sync_account(user_id, data.get("ad_account_id"), full=bool(data.get("full")))
+    except SyncError as e:
+        db.session.rollback()
+        return {"error": str(e)}, 502
+    return {"message": "Sync completed", "results": results}, 200
@@ -1,28 +1,32 @@
-import jwt
-from datetime import datetime, timedelta
 from functools import wraps
 from flask import request, jsonify
-from backend.models import User
-from backend.config import Config
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import ExpiredSignatureError, InvalidTokenError
+from backend.auth_cache import load_cached_user
 
 # JWT Token Authentication Decorator
 def token_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
         token = None
-        if 'Authorization' in request.headers:
-            token = request.headers['Authorization'].split(" ")[1]
+        scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+        if scheme == 'Bearer':
+            token = credentials.strip()
 
         if not token:
             return jsonify({'message': 'Token is missing!'}), 403
 
         try:
-            # Decode the JWT token using the secret key
-            decoded_token = jwt.decode(token, Config.JWT_SECRET_KEY, algorithms=['HS256'])
-            user = User.query.filter_by(id=decoded_token['sub']).first()
-        except jwt.ExpiredSignatureError:
+            # Same verification (and token cache) as @jwt_required
+            decoded_token = decode_token(token)
+        except ExpiredSignatureError:
             return jsonify({'message': 'Token expired!'}), 403
-        except jwt.InvalidTokenError:
+        except (InvalidTokenError, JWTExtendedException):
+            return jsonify({'message': 'Invalid token!'}), 403
+
+        user = load_cached_user(decoded_token['sub'])
+        if user is None:
             return jsonify({'message': 'Invalid token!'}), 403
 
         return f(user, *args, **kwargs)
@@ -0,0 +1,180 @@
+import hashlib
+from datetime import datetime
+from functools import wraps
+
+from flask import g, make_response, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event, inspect, select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from backend.dashboard import SECTIONS
+from backend.extensions import db
+from backend.models import ChangeLogEntry, UserDataVersion
+
+# Changes to these bump their owner's data version; model -> (dashboard section, serializer)
+VERSIONED_MODELS = {model: (key, serialize) for model, key, serialize in SECTIONS}
+
+# Called after each commit that changed any user's data
+_commit_listeners = []
+
+
+def on_versions_committed(callback):
+    """Register `callback(user_ids, changes)` to run after every commit that bumped data versions.
+
+    `changes` lists the committed row-level changes as dicts with `user_id`,
+    `entity` (the dashboard section), `op` (create, update or delete), `id`
+    and `data` (the row as the dashboard renders it; None for deletes and
+    for rows changed by bulk statements).
+    """
+    if callback not in _commit_listeners:
+        _commit_listeners.append(callback)
+
+
+def bump_versions(session, user_ids):
+    """Increment the data version of every user in `user_ids`, in the session's current transaction."""
+    user_ids = {int(user_id) for user_id in user_ids if user_id is not None}
+    if not user_ids:
+        return
+    statement = insert(UserDataVersion.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=["user_id"], set_={"version": UserDataVersion.__table__.c.version + 1}
+    )
+    session.connection().execute(statement, [{"user_id": user_id, "version": 1} for user_id in sorted(user_ids)])
+    session.info.setdefault("bumped_users", set()).update(user_ids)
+
+
+def _change(obj, op, data=True):
+    entity, serialize = VERSIONED_MODELS[type(obj)]
+    return {"user_id": obj.user_id, "entity": entity, "op": op, "id": obj.id,
+            "data": serialize(obj) if data else None}
+
+
+def _modified(session):
+    return [obj for obj in session.dirty
+            if type(obj) in VERSIONED_MODELS and session.is_modified(obj, include_collections=False)]
+
+
+def record_changes(session, changes, user_ids=()):
+    """Append `changes` to the change log and bump their users' versions, in the session's current transaction."""
+    if changes:
+        now = datetime.utcnow()
+        session.connection().execute(insert(ChangeLogEntry.__table__), [
+            {"user_id": change["user_id"], "entity": change["entity"], "entity_id": change["id"],
+             "op": change["op"], "changed_at": now}
+            for change in changes
+        ])
+        session.info.setdefault("changes", []).extend(changes)
+    bump_versions(session, {change["user_id"] for change in changes} | set(user_ids))
+
+
+def _collect_before_flush(session, flush_context, instances):
+    # Read owners (and deleted rows) before the flush, while deleted rows can still be loaded if expired
+    owners = session.info.setdefault("changed_owners", set())
+    changes = session.info.setdefault("flush_changes", [])
+    for obj in session.new:
+        if type(obj) in VERSIONED_MODELS:
+            owners.add(obj.user_id)
+    for obj in session.deleted:
+        if type(obj) in VERSIONED_MODELS:
+            owners.add(obj.user_id)
+            changes.append(_change(obj, "delete", data=False))
+    for obj in _modified(session):
+        owners.add(obj.user_id)
+        # Moving a row to another user changes both users' data
+        owners.update(inspect(obj).attrs.user_id.history.deleted or ())
+
+
+def _record_after_flush(session, flush_context):
+    # New rows have their IDs now; new/dirty still list what was just flushed
+    changes = session.info.pop("flush_changes", [])
+    changes.extend(_change(obj, "create") for obj in session.new if type(obj) in VERSIONED_MODELS)
+    changes.extend(_change(obj, "update") for obj in _modified(session))
+    # Same connection, so the log and the bump commit or roll back with the change itself
+    record_changes(session, changes, session.info.pop("changed_owners", ()))
+
+
+def _record_bulk_statement(orm_execute_state):
+    # query.update()/query.delete() skip the flush: read the affected rows first, with the same WHERE clause
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    model = mapper.class_ if mapper is not None else None
+    if model not in VERSIONED_MODELS:
+        return
+    statement = orm_execute_state.statement
+    rows = orm_execute_state.session.execute(
+        select(model.id, model.user_id).where(statement.whereclause)
+        if statement.whereclause is not None else select(model.id, model.user_id)
+    ).all()
+    op = "delete" if orm_execute_state.is_delete else "update"
+    record_changes(orm_execute_state.session, [
+        {"user_id": user_id, "entity": VERSIONED_MODELS[model][0], "op": op, "id": row_id, "data": None}
+        for row_id, user_id in rows
+    ])
+
+
+def _notify_after_commit(session):
+    user_ids = session.info.pop("bumped_users", None)
+    changes = session.info.pop("changes", None) or []
+    if user_ids:
+        for callback in _commit_listeners:
+            callback(user_ids, changes)
+
+
+def _forget_after_rollback(session):
+    for key in ("changed_owners", "flush_changes", "changes", "bumped_users"):
+        session.info.pop(key, None)
+
+
+def register_version_tracking():
+    """Log every change to a versioned model and bump its owner's data version.
+
+    Flushed changes are read from the session; bulk `query.update()` and
+    `query.delete()` statements select the rows they are about to touch.
+    """
+    if not event.contains(Session, "before_flush", _collect_before_flush):
+        event.listen(Session, "before_flush", _collect_before_flush)
+        event.listen(Session, "after_flush", _record_after_flush)
+        event.listen(Session, "do_orm_execute", _record_bulk_statement)
+        event.listen(Session, "after_commit", _notify_after_commit)
+        event.listen(Session, "after_rollback", _forget_after_rollback)
+
+
+def data_version(user_id):
+    version = db.session.query(UserDataVersion.version).filter_by(user_id=int(user_id)).scalar()
+    return version or 0
+
+
+def make_etag(user_id, version):
+    # The same URL can be rendered differently (JSON vs NDJSON), so the Accept header is part of the tag
+    variant = hashlib.sha1(
+        f"{user_id}\n{request.full_path}\n{request.headers.get('Accept', '')}".encode()
+    ).hexdigest()[:16]
+    return f"{version}-{variant}"
+
+
+def versioned(view):
+    """Tag a GET endpoint's response with an ETag from the user's data version.
+
+    A request whose If-None-Match carries the current tag gets a 304 after
+    a single primary-key lookup, without touching the entity tables.
+    Must sit below @jwt_required().
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        user_id = get_jwt_identity()
+        # Kept for the response cache, which stores bodies per version
+        g.data_version = data_version(user_id)
+        etag = make_etag(user_id, g.data_version)
+        if request.if_none_match.contains_weak(etag):
+            response = make_response("", 304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        # Let browsers keep the body but revalidate it on every use
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
+    return wrapper
@@ -0,0 +1,197 @@
+import hashlib
+import hmac
+import logging
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+from sqlalchemy.dialects.sqlite import insert
+
+from backend.extensions import db
+from backend.graph_batch import execute_batch
+from backend.jobs import enqueue_job
+from backend.models import Campaign, AdGroup, Ad, Job, PendingRefresh, SyncState
+from backend.sync import AD_FIELDS, AD_SET_FIELDS, CAMPAIGN_FIELDS, upsert_ad_groups, upsert_ads, upsert_campaigns
+
+logger = logging.getLogger(__name__)
+
+REFRESH_BATCH_SIZE = 200  # Pending objects claimed per loop of the refresh job
+
+# Meta's `level` in ad account change notifications -> our level name
+NOTIFICATION_LEVELS = {"CAMPAIGN": "campaign", "AD_SET": "adset", "ADSET": "adset", "AD": "ad"}
+
+# Parents first, so refreshed children can be linked to local rows
+REFRESH_PLAN = [
+    ("campaign", CAMPAIGN_FIELDS, upsert_campaigns, Campaign, Campaign.meta_campaign_id),
+    ("adset", AD_SET_FIELDS, upsert_ad_groups, AdGroup, AdGroup.meta_ad_group_id),
+    ("ad", AD_FIELDS, upsert_ads, Ad, Ad.meta_ad_id),
+]
+
+# Graph error code for an object that no longer exists (or we can no longer see)
+MISSING_OBJECT_CODE = 100
+
+
+def verify_signature(body, signature_header, app_secret):
+    """Check Meta's X-Hub-Signature-256 header (`sha256=<hex>`) against the raw request body."""
+    if not app_secret or not signature_header or not signature_header.startswith("sha256="):
+        return False
+    expected = hmac.new(app_secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature_header[len("sha256="):])
+
+
+def parse_changes(payload):
+    """Extract (ad_account_id, meta_object_id, level) from an ad account notification payload.
+
+    Changes for object levels we do not mirror are ignored.
+    """
+    changes = []
+    if not isinstance(payload, dict) or payload.get("object") != "ad_account":
+        return changes
+    for entry in payload.get("entry") or []:
+        ad_account_id = str(entry.get("id", "")).replace("act_", "") or None
+        for change in entry.get("changes") or []:
+            value = change.get("value") or {}
+            level = NOTIFICATION_LEVELS.get(str(value.get("level", "")).upper())
+            if level and value.get("id"):
+                changes.append((ad_account_id, str(value["id"]), level))
+    return changes
+
+
+def _owners(changes):
+    # Who a change belongs to: whoever syncs the account, else whoever owns the object locally
+    account_ids = {ad_account_id for ad_account_id, _, _ in changes if ad_account_id}
+    account_owner = dict(
+        db.session.query(SyncState.ad_account_id, SyncState.user_id).filter(SyncState.ad_account_id.in_(account_ids))
+    )
+    object_owner = {}
+    unresolved = {level: set() for level, *_ in REFRESH_PLAN}
+    for ad_account_id, object_id, level in changes:
+        if ad_account_id not in account_owner:
+            unresolved[level].add(object_id)
+    for level, _, _, model, column in REFRESH_PLAN:
+        if unresolved[level]:
+            object_owner.update(db.session.query(column, model.user_id).filter(column.in_(unresolved[level])))
+
+    return {
+        object_id: account_owner.get(ad_account_id) or object_owner.get(object_id)
+        for ad_account_id, object_id, _ in changes
+    }
+
+
+def record_changes(changes):
+    """Queue changed objects for a refresh, coalescing repeats of the same object.
+
+    Makes sure every affected user has a refresh job queued. Returns the
+    number of objects recorded.
+    """
+    owners = _owners(changes)
+    now = datetime.utcnow()
+    values = {}
+    for ad_account_id, object_id, level in changes:
+        if owners.get(object_id) is None:
+            logger.warning(f"Dropping change for {level} {object_id}: no user mirrors act_{ad_account_id}")
+            continue
+        values[object_id] = {
+            "meta_object_id": object_id, "level": level, "ad_account_id": ad_account_id,
+            "user_id": owners[object_id], "received_at": now,
+        }
+    if not values:
+        return 0
+
+    statement = insert(PendingRefresh.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=["meta_object_id"], set_={"received_at": statement.excluded.received_at}
+    )
+    db.session.execute(statement, list(values.values()))
+    db.session.commit()
+
+    # One queued job per user drains everything pending; a running job may already have
+    # claimed its rows, so only a *queued* one can be relied on to see these
+    user_ids = {value["user_id"] for value in values.values()}
+    queued = {
+        user_id for (user_id,) in db.session.query(Job.user_id).filter(
+            Job.kind == "refresh_objects", Job.status == "queued", Job.user_id.in_(user_ids)
+        )
+    }
+    for user_id in user_ids - queued:
+        enqueue_job("refresh_objects", user_id, {})
+    return len(values)
+
+
+def _claim(user_id, limit):
+    rows = db.session.query(
+        PendingRefresh.id, PendingRefresh.meta_object_id, PendingRefresh.level, PendingRefresh.ad_account_id,
+        PendingRefresh.received_at,
+    ).filter(PendingRefresh.user_id == user_id).order_by(PendingRefresh.received_at).limit(limit).all()
+    if rows:
+        # Objects notified again since we read them stay pending for the next pass
+        PendingRefresh.query.filter(or_(*[
+            and_(PendingRefresh.id == row.id, PendingRefresh.received_at == row.received_at) for row in rows
+        ])).delete(synchronize_session=False)
+        db.session.commit()
+    return [(row.meta_object_id, row.level, row.ad_account_id, row.received_at) for row in rows]
+
+
+def refresh_objects(user_id, claimed):
+    """Re-read claimed objects from Meta with batch requests and upsert them, parents first.
+
+    Returns (stats, failed) where `failed` lists the claimed entries to try again.
+    """
+    stats = {"fetched": 0, "created": 0, "updated": 0, "skipped": 0, "conflicts": 0, "deleted": 0}
+    failed = []
+    for level, fields, upsert, model, column in REFRESH_PLAN:
+        entries = [entry for entry in claimed if entry[1] == level]
+        if not entries:
+            continue
+        operations = [
+            {"method": "GET", "relative_url": f"{object_id}?fields={','.join(fields)}"} for object_id, *_ in entries
+        ]
+        rows, missing = [], []
+        for entry, result in zip(entries, execute_batch(operations)):
+            error = result.get("error") if isinstance(result, dict) else None
+            if not error:
+                rows.append(result)
+            elif isinstance(error, dict) and error.get("code") == MISSING_OBJECT_CODE:
+                missing.append(entry[0])
+            else:
+                failed.append(entry)
+
+        if rows:
+            for key, value in upsert(user_id, rows).items():
+                stats[key] += value
+            stats["fetched"] += len(rows)
+        if missing:
+            stats["deleted"] += model.query.filter(column.in_(missing), model.user_id == user_id).update(
+                {"status": "DELETED"}, synchronize_session=False
+            )
+            db.session.commit()
+    return stats, failed
+
+
+def run_refresh_job(user_id, data):
+    """Job handler for `refresh_objects`: drain the user's pending refreshes. Returns (response_body, status_code)."""
+    totals = {"fetched": 0, "created": 0, "updated": 0, "skipped": 0, "conflicts": 0, "deleted": 0}
+    failed = []
+    while True:
+        claimed = _claim(user_id, REFRESH_BATCH_SIZE)
+        if not claimed:
+            break
+        stats, batch_failed = refresh_objects(user_id, claimed)
+        for key, value in stats.items():
+            totals[key] += value
+        failed.extend(batch_failed)
+        if batch_failed:
+            break  # Meta is struggling; let the job retry with backoff instead of hammering it
+
+    if failed:
+        # Put failures back (unless notified again meanwhile) and let the job queue retry
+        statement = insert(PendingRefresh.__table__).on_conflict_do_nothing(index_elements=["meta_object_id"])
+        db.session.execute(statement, [
+            {"meta_object_id": object_id, "level": level, "ad_account_id": ad_account_id, "user_id": user_id,
+             "received_at": received_at}
+            for object_id, level, ad_account_id, received_at in failed
+        ])
+        db.session.commit()
+        return {"error": f"Could not refresh {len(failed)} objects", "results": totals}, 503
+
+    logger.info(f"Refreshed changed objects for user {user_id}: {totals}")
+    return {"message": "Objects refreshed", "results": totals}, 200
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef, useCallback } from "react";
 import axios from "axios";
 import { useNavigate } from "react-router-dom";
 
@@ -58,6 +58,34 @@ const DashboardPage = () => {
   const navigate = useNavigate();
   const token = sessionStorage.getItem("access_token");
 
+  // server_time of the last dashboard response; later calls only fetch what changed after it
+  const serverTime = useRef(null);
+
+  const applyDashboard = useCallback((data) => {
+    // Full response: replace. `since` response: merge changed rows, drop rows whose IDs are gone
+    const merge = (prev, changed, ids) => {
+      if (!ids) return changed || [];
+      const current = new Set(ids);
+      const updated = Object.fromEntries((changed || []).map((item) => [item.id, item]));
+      const kept = prev.filter((item) => current.has(item.id) && !updated[item.id]);
+      return [...kept, ...(changed || [])].sort((a, b) => a.id - b.id);
+    };
+    setCampaigns((prev) => merge(prev, data.campaigns, data.ids && data.ids.campaigns));
+    setAdGroups((prev) => merge(prev, data.ad_groups, data.ids && data.ids.ad_groups));
+    setAdCreatives((prev) => merge(prev, data.ad_creatives, data.ids && data.ids.ad_creatives));
+    setAds((prev) => merge(prev, data.ads, data.ids && data.ids.ads));
+    serverTime.current = data.server_time;
+  }, []);
+
+  const refreshDashboard = useCallback(async () => {
+    const params = serverTime.current ? { since: serverTime.current } : {};
+    const response = await axios.get("http://localhost:5000/api/dashboard", {
+      headers: { Authorization: `Bearer ${token}` },
+      params,
+    });
+    applyDashboard(response.data);
+  }, [token, applyDashboard]);
+
   useEffect(() => {
     const fetchData = async () => {
       if (!token) {
@@ -66,17 +94,9 @@ const DashboardPage = () => {
       }
   
       try {
-        const [campaignRes, adGroupRes, creativeRes, adRes] = await Promise.all([
-          axios.get("http://localhost:5000/api/campaigns", { headers: { Authorization: `Bearer ${token}` } }),
-          axios.get("http://localhost:5000/api/ad-groups", { headers: { Authorization: `Bearer ${token}` } }),
-          axios.get("http://localhost:5000/api/ad-creatives", { headers: { Authorization: `Bearer ${token}` } }),
-          axios.get("http://localhost:5000/api/ads", { headers: { Authorization: `Bearer ${token}` } }),
-        ]);
-  
-        setCampaigns(campaignRes.data || []);
-        setAdGroups(adGroupRes.data || []);
-        setAdCreatives(creativeRes.data || []);
-        setAds(adRes.data || []);
+        // One call for campaigns, ad sets, ads and creatives
+        serverTime.current = null;
+        await refreshDashboard();
       } catch (error) {
         if (error.response && error.response.status === 401) {
           // Token is invalid or expired, redirect to login
@@ -92,7 +112,56 @@ const DashboardPage = () => {
     };
   
     fetchData();
-  }, [token, navigate]);
+  }, [token, navigate, refreshDashboard]);
+
+  // Live updates: patch the lists from /api/events instead of refetching them
+  useEffect(() => {
+    if (!token) return undefined;
+
+    const setters = { campaigns: setCampaigns, ad_groups: setAdGroups, ads: setAds, ad_creatives: setAdCreatives };
+    const resync = () => refreshDashboard().catch((error) => console.error(error));
+    let connected = false;
+    let source = null;
+    let retryTimer = null;
+    let retries = 0;
+
+    const connect = () => {
+      // EventSource cannot send headers, so the token goes in the query string
+      source = new EventSource(`http://localhost:5000/api/events?jwt=${encodeURIComponent(token)}`);
+
+      source.addEventListener("ready", () => {
+        // After a reconnect, fetch whatever changed while we were away
+        if (connected) resync();
+        connected = true;
+        retries = 0;
+      });
+      source.addEventListener("change", (event) => {
+        const { entity, op, id, data } = JSON.parse(event.data);
+        const setState = setters[entity];
+        if (!setState) return;
+        setState((prev) => {
+          const rest = prev.filter((item) => item.id !== id);
+          return op === "delete" ? rest : [...rest, data].sort((a, b) => a.id - b.id);
+        });
+      });
+      // Changes were missed (bulk update, another server process, slow connection)
+      source.addEventListener("resync", resync);
+      source.onerror = () => {
+        // EventSource gives up for good on an error status (503 when a server worker has no stream slot left);
+        // try again for a minute, not forever (an expired token keeps failing)
+        if (source.readyState === EventSource.CLOSED && retries < 12) {
+          retries += 1;
+          retryTimer = setTimeout(connect, 5000);
+        }
+      };
+    };
+    connect();
+
+    return () => {
+      clearTimeout(retryTimer);
+      source.close();
+    };
+  }, [token, refreshDashboard]);
   
 
   // Lookup tables
@@ -190,6 +259,7 @@ const DashboardPage = () => {
           throw new Error("Failed to delete from the Meta API or database.");
         }
       }
+      // Anything else the delete changed arrives through /api/events
     } catch (error) {
       console.error("Error deleting item:", error);
       alert(error.response ? error.response.data.error : error.message);
@@ -0,0 +1,49 @@
+from flask import Flask, jsonify
+from flask_jwt_extended import create_access_token, decode_token, jwt_required
+
+from backend.auth_cache import CachingJWTManager
+
+
+def make_app():
+    app = Flask(__name__)
+    app.config["JWT_SECRET_KEY"] = "test-secret-key-of-at-least-32-bytes"
+    jwt = CachingJWTManager(app)
+
+    @app.route("/protected")
+    @jwt_required()
+    def protected():
+        return jsonify(ok=True)
+
+    return app, jwt
+
+
+def test_decode_token_is_served_from_the_token_cache():
+    # Fails if a flask-jwt-extended upgrade stops routing decode_token() through the overridden method
+    app, jwt = make_app()
+    with app.app_context():
+        token = create_access_token(identity=1)
+        first, second = decode_token(token), decode_token(token)
+    assert first == second
+    assert (jwt.token_cache.misses, jwt.token_cache.hits) == (1, 1)
+
+
+def test_jwt_required_is_served_from_the_token_cache():
+    app, jwt = make_app()
+    with app.app_context():
+        token = create_access_token(identity=1)
+    client = app.test_client()
+    for _ in range(2):
+        assert client.get("/protected", headers={"Authorization": f"Bearer {token}"}).status_code == 200
+    assert jwt.token_cache.hits == 1
+
+
+def test_tampered_token_is_not_served_from_the_cache():
+    app, jwt = make_app()
+    with app.app_context():
+        token = create_access_token(identity=1)
+        decode_token(token)
+    header, payload, signature = token.split(".")
+    tampered = ".".join((header, payload[:-2] + ("AA" if payload[-2:] != "AA" else "BB"), signature))
+    client = app.test_client()
+    assert client.get("/protected", headers={"Authorization": f"Bearer {tampered}"}).status_code != 200
+    assert jwt.token_cache.hits == 0
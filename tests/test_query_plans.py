@@ -0,0 +1,20 @@
+import pytest
+
+from backend.query_plans import build_synthetic_database, explain, hot_queries, is_full_scan
+
+HOT_QUERIES = hot_queries()
+
+
+@pytest.fixture(scope="module")
+def engine():
+    engine = build_synthetic_database()
+    yield engine
+    engine.dispose()
+
+
+@pytest.mark.parametrize("statement", [statement for _, statement in HOT_QUERIES],
+                         ids=[name for name, _ in HOT_QUERIES])
+def test_hot_query_uses_an_index(engine, statement):
+    with engine.connect() as conn:
+        details = explain(conn, statement)
+    assert not any(is_full_scan(detail) for detail in details), details
@@ -0,0 +1,35 @@
+import threading
+import time
+
+from backend.shared_cache import InvalidationBus
+
+PUBLISHES_PER_THREAD = 1000
+
+
+def test_publish_from_threads_keeps_every_id(tmp_path, monkeypatch):
+    bus = InvalidationBus(str(tmp_path / "response_cache.bus"))
+    read_sequence = bus.sequence
+
+    def yielding_sequence():
+        # Let the other thread run between reading the sequence number and writing the new one
+        value = read_sequence()
+        time.sleep(0)
+        return value
+
+    monkeypatch.setattr(bus, "sequence", yielding_sequence)
+    start = threading.Barrier(2)
+
+    def publish(first_id):
+        start.wait()
+        for user_id in range(first_id, first_id + PUBLISHES_PER_THREAD):
+            bus.publish([user_id])
+
+    threads = [threading.Thread(target=publish, args=(first_id,)) for first_id in (1, 1 + PUBLISHES_PER_THREAD)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    sequence, entries = bus.read(0)
+    assert sequence == 2 * PUBLISHES_PER_THREAD
+    assert sorted(user_id for _, user_id in entries) == list(range(1, 1 + 2 * PUBLISHES_PER_THREAD))